@@ -0,0 +1,86 @@
+"""
+Micro-benchmark of feed page serialization cost.
+
+Compares `PostPage` built from ORM entities through `orm_mode` with
+feed rows turned into dicts by `PostService.serialize_feed_row` and
+dumped with ujson, as `GET /community/posts` does.
+
+Usage: python benchmarks/feed_serialization.py [page size] [content length] [pages]
+"""
+import os
+import sys
+import time
+
+from collections import namedtuple
+from datetime import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+import ujson  # noqa: E402
+
+from fastapi.encoders import jsonable_encoder  # noqa: E402
+
+from db.models import Post, User  # noqa: E402
+from schemas.post import PostPage  # noqa: E402
+from services.post import PostService  # noqa: E402
+
+
+FeedRow = namedtuple("FeedRow", [
+    "id", "title", "content", "topic", "likes", "created_at", "updated_at",
+    "author_email", "author_username", "author_first_name", "author_last_name",
+])
+
+
+def make_page(size: int, content_length: int) -> tuple[list[Post], list[FeedRow]]:
+    """ Returns the same page as ORM entities and as feed rows """
+    now = datetime.utcnow()
+    author = User(
+        id=1, username="author", email="author@example.com", first_name="John",
+        last_name="Deer", hashed_password="x" * 100, created_at=now, updated_at=now,
+    )
+    posts, rows = [], []
+    for i in range(size):
+        fields = dict(
+            id=i, title=f"Post {i}", content="x" * content_length, topic="topic",
+            likes=i, created_at=now, updated_at=now,
+        )
+        posts.append(Post(**fields, author=author))
+        rows.append(FeedRow(
+            **fields, author_email=author.email, author_username=author.username,
+            author_first_name=author.first_name, author_last_name=author.last_name,
+        ))
+    return posts, rows
+
+
+def orm_mode(posts: list[Post]) -> str:
+    """ Previous feed path: validate entities, then encode response model """
+    page = PostPage(items=posts, next_cursor=None)
+    return ujson.dumps(jsonable_encoder(page))
+
+
+def lean(rows: list[FeedRow]) -> str:
+    """ Current feed path: dicts built straight from rows """
+    feed = {"items": [PostService.serialize_feed_row(row) for row in rows], "next_cursor": None}
+    return ujson.dumps(feed)
+
+
+def run(name: str, fn, page, pages: int) -> None:
+    started = time.perf_counter()
+    for _ in range(pages):
+        fn(page)
+    elapsed = (time.perf_counter() - started) / pages
+    print(f"{name:<9} {elapsed * 1000:>8.3f} ms/page")
+
+
+def main() -> None:
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    content_length = int(sys.argv[2]) if len(sys.argv) > 2 else 2_000
+    pages = int(sys.argv[3]) if len(sys.argv) > 3 else 200
+    posts, rows = make_page(size, content_length)
+
+    run("orm_mode", orm_mode, posts, pages)
+    run("lean", lean, rows, pages)
+
+
+if __name__ == "__main__":
+    main()
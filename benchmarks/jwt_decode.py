@@ -0,0 +1,35 @@
+"""
+Micro-benchmark of access token verification throughput.
+
+Usage: python benchmarks/jwt_decode.py [iterations] [distinct tokens]
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from core.jwt import create_token, decode_token, verified_tokens  # noqa: E402
+
+
+def run(tokens: list[str], iterations: int, use_cache: bool) -> float:
+    """ Returns decoded tokens per second """
+    verified_tokens.clear()
+    started = time.perf_counter()
+    for i in range(iterations):
+        assert decode_token(tokens[i % len(tokens)], use_cache=use_cache) is not None
+    return iterations / (time.perf_counter() - started)
+
+
+def main() -> None:
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    distinct = int(sys.argv[2]) if len(sys.argv) > 2 else 1_000
+    tokens = [create_token({"username": f"user{i}", "user_id": i}) for i in range(distinct)]
+
+    for use_cache in (False, True):
+        rate = run(tokens, iterations, use_cache)
+        print(f"cache {'on ' if use_cache else 'off'}: {rate:>12,.0f} decodes/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,45 +1,590 @@
+import hashlib
+import time
+import uuid
+
+from collections import OrderedDict
 from redis import asyncio as aioredis
+from redis.exceptions import NoScriptError
 
-from typing import Optional
+from typing import Any, Optional
 
+from core.metrics import InstrumentedRedis
 from core.settings import get_settings
 
 
 settings = get_settings()
 
-redis = aioredis.from_url(settings.get_redis_uri())
+_redis: Optional[aioredis.Redis] = None
 
 
-class MapCacher:
-    def __init__(self) -> None:
-        self.uri = settings.get_redis_uri()
+def get_redis() -> aioredis.Redis:
+    """ Returns Redis client of the worker, creating it on first use """
+    global _redis
+    if _redis is None:
+        pool = aioredis.BlockingConnectionPool.from_url(
+            settings.get_redis_uri(),
+            max_connections=settings.REDIS_MAX_CONNECTIONS,
+            timeout=settings.REDIS_POOL_TIMEOUT,
+            socket_timeout=settings.REDIS_SOCKET_TIMEOUT,
+            socket_connect_timeout=settings.REDIS_SOCKET_CONNECT_TIMEOUT,
+            health_check_interval=settings.REDIS_HEALTH_CHECK_INTERVAL,
+        )
+        redis_class = InstrumentedRedis if settings.METRICS_ENABLED else aioredis.Redis
+        _redis = redis_class(connection_pool=pool)
+    return _redis
+
+
+async def close_redis() -> None:
+    """ Closes Redis connections, the next use creates a new client """
+    global _redis
+    if _redis is not None:
+        await _redis.connection_pool.disconnect()
+    _redis = None
+
+
+def get_pool_stats() -> dict[str, int]:
+    """ Returns connection pool usage of the Redis client """
+    pool = get_redis().connection_pool
+    return {
+        "max_connections": pool.max_connections,
+        "in_use": len(getattr(pool, "_in_use_connections", ())),
+        "available": len(getattr(pool, "_available_connections", ())),
+    }
+
+
+class LuaScript:
+    """
+    Lua script run by EVALSHA, so calls send its digest instead of its body.
+
+    The body is sent only when Redis does not have the script cached,
+    e.g. on the first call after a restart or `SCRIPT FLUSH`.
+    """
+
+    def __init__(self, source: str) -> None:
+        self.source = source
+        self.sha = hashlib.sha1(source.encode()).hexdigest()
+
+    async def __call__(self, keys: list[str], args: list[Any]) -> Any:
+        """ Runs script """
+        redis = get_redis()
+        try:
+            return await redis.evalsha(self.sha, len(keys), *keys, *args)
+        except NoScriptError:
+            await redis.script_load(self.source)
+            return await redis.evalsha(self.sha, len(keys), *keys, *args)
+
+    async def _run_pipeline(self, calls: list[tuple[list[str], list[Any]]]) -> list[Any]:
+        async with get_redis().pipeline(transaction=False) as pipe:
+            for keys, args in calls:
+                pipe.evalsha(self.sha, len(keys), *keys, *args)
+            return await pipe.execute(raise_on_error=False)
+
+    async def run_many(self, calls: list[tuple[list[str], list[Any]]]) -> list[Any]:
+        """ Runs script once per `(keys, args)` pair in one round trip """
+        if not calls:
+            return []
+        results = await self._run_pipeline(calls)
+        missing = [i for i, result in enumerate(results) if isinstance(result, NoScriptError)]
+        if missing:
+            # Calls failing with NOSCRIPT did not run, so they are safe to retry
+            await get_redis().script_load(self.source)
+            retried = await self._run_pipeline([calls[i] for i in missing])
+            for i, result in zip(missing, retried):
+                results[i] = result
+        for result in results:
+            if isinstance(result, Exception):
+                raise result
+        return results
+
+
+# KEYS: tracking set or "", counters hash or "", then (to_key, from_key) pairs
+# ARGV: (member, owner, step, add) quadruples, member is only removed if add is 0
+MOVE_MEMBERS_SCRIPT = LuaScript("""
+local result = {}
+for i = 1, (#KEYS - 2) / 2 do
+    local to_key, from_key = KEYS[2 * i + 1], KEYS[2 * i + 2]
+    local member, owner, step = ARGV[4 * i - 3], ARGV[4 * i - 2], tonumber(ARGV[4 * i - 1])
+    local added = 0
+    if ARGV[4 * i] == '1' then
+        added = redis.call('SADD', to_key, member)
+    end
+    local removed = redis.call('SREM', from_key, member)
+    if KEYS[1] ~= '' then
+        redis.call('SADD', KEYS[1], owner)
+    end
+    if KEYS[2] ~= '' and added + removed > 0 then
+        redis.call('HINCRBY', KEYS[2], owner, step * (added + removed))
+    end
+    result[#result + 1] = (added + removed > 0) and 1 or 0
+    result[#result + 1] = redis.call('SCARD', to_key) + redis.call('SCARD', from_key)
+end
+return result
+""")
+
+# KEYS: counters hash, then (to_key, from_key) pairs
+# ARGV: (owner, step) pairs
+RESET_COUNTERS_SCRIPT = LuaScript("""
+for i = 1, (#KEYS - 1) / 2 do
+    local owner, step = ARGV[2 * i - 1], tonumber(ARGV[2 * i])
+    local value = step * (redis.call('SCARD', KEYS[2 * i]) - redis.call('SCARD', KEYS[2 * i + 1]))
+    if value == 0 then
+        redis.call('HDEL', KEYS[1], owner)
+    else
+        redis.call('HSET', KEYS[1], owner, value)
+    end
+end
+return 0
+""")
+
+
+# KEYS: sorted set
+# ARGV: max size, then members
+ADD_IF_EXISTS_SCRIPT = LuaScript("""
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    return 0
+end
+for i = 2, #ARGV do
+    redis.call('ZADD', KEYS[1], 0, ARGV[i])
+end
+redis.call('ZREMRANGEBYRANK', KEYS[1], 0, -tonumber(ARGV[1]) - 1)
+return 1
+""")
+
+
+# KEYS: bases hash, then sorted sets
+# ARGV: now, half-life, weight, member
+# Scores are forward decayed: weight grows exponentially with time passed since
+# the base of the set, so older weights decay relative to newer ones.
+# Negative weights are decayed from now too, so taking back an older weight
+# subtracts more than it added; scores are clamped at 0 by removing members
+# dropping to it, and members missing from the set are not added
+ADD_DECAYED_SCRIPT = LuaScript("""
+local now, half_life = tonumber(ARGV[1]), tonumber(ARGV[2])
+for i = 2, #KEYS do
+    local base = tonumber(redis.call('HGET', KEYS[1], KEYS[i]))
+    if not base then
+        base = now
+        redis.call('HSET', KEYS[1], KEYS[i], ARGV[1])
+    end
+    local score = tonumber(ARGV[3]) * math.pow(2, (now - base) / half_life)
+    if score >= 0 or redis.call('ZSCORE', KEYS[i], ARGV[4]) then
+        if tonumber(redis.call('ZINCRBY', KEYS[i], score, ARGV[4])) <= 0 then
+            redis.call('ZREM', KEYS[i], ARGV[4])
+        end
+    end
+end
+""")
+
+# KEYS: bases hash, sorted set
+# ARGV: now, half-life, max size, min score
+# Moves base of the set to now, scaling scores down so they do not overflow,
+# then drops members decayed below min score and keeps max size greatest ones
+REBASE_DECAYED_SCRIPT = LuaScript("""
+local now, half_life = tonumber(ARGV[1]), tonumber(ARGV[2])
+local base = tonumber(redis.call('HGET', KEYS[1], KEYS[2]))
+if base then
+    local factor = math.pow(2, (base - now) / half_life)
+    local members = redis.call('ZRANGE', KEYS[2], 0, -1, 'WITHSCORES')
+    for i = 1, #members, 2 do
+        redis.call('ZADD', KEYS[2], tonumber(members[i + 1]) * factor, members[i])
+    end
+end
+redis.call('ZREMRANGEBYSCORE', KEYS[2], '-inf', '(' .. ARGV[4])
+redis.call('ZREMRANGEBYRANK', KEYS[2], 0, -tonumber(ARGV[3]) - 1)
+local size = redis.call('ZCARD', KEYS[2])
+if size == 0 then
+    redis.call('HDEL', KEYS[1], KEYS[2])
+else
+    redis.call('HSET', KEYS[1], KEYS[2], ARGV[1])
+end
+return size
+""")
 
-    def _decode_table(self, map: dict[bytes, bytes]) -> dict[str, str]:
-        """ Decodes table from bytes to str """
-        return {k.decode(): v.decode() for k, v in map.items()}
 
-    def _decode_row(self, row: bytes) -> str:
-        """ Decodes row from bytes to str """
-        return row.decode()
+# KEYS: lock
+# ARGV: token of the lock holder
+RELEASE_LOCK_SCRIPT = LuaScript("""
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+""")
 
-    async def create_table(self, table: str, map: dict[str, str]) -> None:
-        """ Creates table if it does not exist """
-        await redis.hmset(table, map)
 
-    async def get_table(self, table: str) -> dict[str, str]:
-        """ Returns empty dict if table does not exist """
-        result = await redis.hgetall(table)
+class SetCacher:
+    def _decode_members(self, members: set[bytes]) -> set[str]:
+        """ Decodes set members from bytes to str """
+        return {member.decode() for member in members}
+
+    async def move_member(
+        self,
+        to_key: str,
+        from_key: str,
+        member: str,
+        owner: str,
+        step: int = 1,
+        tracking: Optional[str] = None,
+        counters: Optional[str] = None,
+        add: bool = True,
+    ) -> tuple[bool, int]:
+        """
+        Atomically adds member to `to_key` set and removes it from `from_key` set
+        in one round trip
+
+        Args:
+            owner: Name of the sets pair, e.g. id of the object they belong to
+            step: Change of owner counter per changed set
+            tracking: Optional set `owner` is added to, e.g. to track which sets were changed
+            counters: Optional hash of owner counters, kept equal to
+                `step * (size(to_key) - size(from_key))`
+            add: False to only remove member from `from_key`
+
+        Returns:
+            bool: True if either set changed, False if member was already in place
+            int: Combined size of both sets after moving
+        """
+        result = await self.move_member_many(
+            [(to_key, from_key, member, owner, step, add)],
+            tracking=tracking,
+            counters=counters,
+        )
+        return result[0]
+
+    async def move_member_many(
+        self,
+        entries: list[tuple[str, str, str, str, int, bool]],
+        tracking: Optional[str] = None,
+        counters: Optional[str] = None,
+    ) -> list[tuple[bool, int]]:
+        """
+        Atomically moves `(to_key, from_key, member, owner, step, add)` entries
+        in one round trip, see `move_member`
+
+        Returns:
+            list[tuple[bool, int]]: For each entry, whether either set changed
+                and combined size of both sets after moving
+        """
+        if not entries:
+            return []
+        keys = [tracking or "", counters or ""]
+        args = []
+        for to_key, from_key, member, owner, step, add in entries:
+            keys.extend((to_key, from_key))
+            args.extend((member, owner, step, int(add)))
+        result = await MOVE_MEMBERS_SCRIPT(keys, args)
+        return [(bool(result[i]), result[i + 1]) for i in range(0, len(result), 2)]
+
+    async def add_members(self, key: str, *members: str) -> int:
+        """ Adds members to set, returns number of added members """
+        if not members:
+            return 0
+        return await get_redis().sadd(key, *members)
+
+    async def remove_members(self, key: str, *members: str) -> int:
+        """ Removes members from set, returns number of removed members """
+        if not members:
+            return 0
+        return await get_redis().srem(key, *members)
+
+    async def get_members(self, key: str) -> set[str]:
+        """ Returns empty set if set does not exist """
+        result = await get_redis().smembers(key)
+        return self._decode_members(result)
+
+    async def get_members_many(self, *keys: str) -> list[set[str]]:
+        """ Returns members of sets in one round trip """
+        async with get_redis().pipeline(transaction=False) as pipe:
+            for key in keys:
+                pipe.smembers(key)
+            result = await pipe.execute()
+        return [self._decode_members(members) for members in result]
+
+    async def remove_members_many(self, members: dict[str, list[str]]) -> None:
+        """ Removes members from several sets in one round trip """
+        members = {key: values for key, values in members.items() if values}
+        if not members:
+            return
+        async with get_redis().pipeline(transaction=False) as pipe:
+            for key, values in members.items():
+                pipe.srem(key, *values)
+            await pipe.execute()
+
+    async def reset_counters(
+        self,
+        counters: str,
+        entries: list[tuple[str, str, str, int]],
+    ) -> None:
+        """
+        Atomically sets counters of `(to_key, from_key, owner, step)` entries
+        from sizes of their sets, see `move_member`
+        """
+        if not entries:
+            return
+        keys = [counters]
+        args = []
+        for to_key, from_key, owner, step in entries:
+            keys.extend((to_key, from_key))
+            args.extend((owner, step))
+        await RESET_COUNTERS_SCRIPT(keys, args)
+
+    async def get_counters(self, counters: str, *owners: str) -> list[int]:
+        """ Returns counters of owners in one round trip, 0 for missing ones """
+        if not owners:
+            return []
+        result = await get_redis().hmget(counters, owners)
+        return [int(value) if value is not None else 0 for value in result]
+
+    async def pop_members(self, key: str, count: int) -> set[str]:
+        """ Removes and returns up to `count` random members """
+        result = await get_redis().spop(key, count)
         if not result:
-            return {}
-        return self._decode_table(result)
-
-    async def get_row(self, table: str, row: str) -> str:
-        """ Returns None if row does not exist """
-        row = await redis.hget(table, row)
-        if not row:
-            return "[]"
-        return self._decode_row(row)
-
-    async def set_row(self, table: str, row: str, value: str) -> None:
-        """ Creates row if it does not exist """
-        await redis.hset(table, row, value)
+            return set()
+        return self._decode_members(result)
+
+    async def sizes(self, *keys: str) -> list[int]:
+        """ Returns sizes of sets in one round trip """
+        async with get_redis().pipeline(transaction=False) as pipe:
+            for key in keys:
+                pipe.scard(key)
+            return await pipe.execute()
+
+    async def size(self, key: str) -> int:
+        """ Returns 0 if set does not exist """
+        return await get_redis().scard(key)
+
+
+class LexSortedSetCacher:
+    """
+    Sorted sets with equal scores, ordered lexicographically by members.
+
+    Members encoding their sort key let pages be read as ranges of members.
+    """
+
+    def _decode_members(self, members: list[bytes]) -> list[str]:
+        """ Decodes members from bytes to str """
+        return [member.decode() for member in members]
+
+    async def replace(self, key: str, members: list[str], ttl: int) -> None:
+        """ Atomically replaces members of set, expiring after `ttl` seconds """
+        async with get_redis().pipeline(transaction=True) as pipe:
+            pipe.delete(key)
+            if members:
+                pipe.zadd(key, dict.fromkeys(members, 0))
+                pipe.expire(key, ttl)
+            await pipe.execute()
+
+    async def add_if_exists(self, key: str, max_size: int, *members: str) -> bool:
+        """
+        Adds members to existing set, keeping `max_size` greatest members
+
+        Returns:
+            bool: False if set does not exist, so it can not be partially filled
+        """
+        if not members:
+            return False
+        return bool(await ADD_IF_EXISTS_SCRIPT([key], [max_size, *members]))
+
+    async def add_if_exists_many(self, keys: list[str], max_size: int, *members: str) -> None:
+        """ Adds members to each of existing sets in one round trip, see `add_if_exists` """
+        if not keys or not members:
+            return
+        await ADD_IF_EXISTS_SCRIPT.run_many([([key], [max_size, *members]) for key in keys])
+
+    async def delete(self, *keys: str) -> None:
+        """ Deletes sets """
+        if keys:
+            await get_redis().delete(*keys)
+
+    async def range_before(self, key: str, before: Optional[str], count: int) -> list[str]:
+        """ Returns up to `count` greatest members less than `before`, from greatest """
+        upper = "+" if before is None else f"({before}"
+        return self._decode_members(await get_redis().zrevrangebylex(key, upper, "-", 0, count))
+
+    async def size(self, key: str) -> int:
+        """ Returns 0 if set does not exist """
+        return await get_redis().zcard(key)
+
+
+class DecayedSortedSetCacher:
+    """
+    Sorted sets of time-decayed scores, e.g. trending rankings.
+
+    Added weights decay by half every `half_life` seconds. Instead of
+    decaying all members, new weights are scaled up relative to the base
+    time of the set kept in `bases` hash, and `rebase` periodically moves
+    the base to now, so ranking reads stay single range queries.
+    """
+
+    def _decode_members(self, members: list[bytes]) -> list[str]:
+        """ Decodes members from bytes to str """
+        return [member.decode() for member in members]
+
+    async def add_many(
+        self,
+        bases: str,
+        members: list[tuple[list[str], str]],
+        weight: float,
+        half_life: float,
+    ) -> None:
+        """ Adds decayed weight to members of sets in one round trip, `members` are `(keys, member)` pairs """
+        if not members:
+            return
+        now = time.time()
+        await ADD_DECAYED_SCRIPT.run_many([
+            ([bases, *keys], [now, half_life, weight, member]) for keys, member in members
+        ])
+
+    async def rebase(self, bases: str, key: str, half_life: float, max_size: int, min_score: float) -> int:
+        """
+        Moves base of set to now, trimming it to `max_size` members scored over `min_score`
+
+        Returns:
+            int: Number of members left in set
+        """
+        return await REBASE_DECAYED_SCRIPT([bases, key], [time.time(), half_life, max_size, min_score])
+
+    async def remove(self, keys: list[str], member: str) -> None:
+        """ Removes member from sets """
+        async with get_redis().pipeline(transaction=False) as pipe:
+            for key in keys:
+                pipe.zrem(key, member)
+            await pipe.execute()
+
+    async def top(self, key: str, count: int) -> list[str]:
+        """ Returns up to `count` members with the greatest scores, from greatest """
+        return self._decode_members(await get_redis().zrevrange(key, 0, count - 1))
+
+
+class ValueCacher:
+    def _decode_value(self, value: Optional[bytes]) -> Optional[str]:
+        """ Decodes value from bytes to str """
+        if value is None:
+            return None
+        return value.decode()
+
+    async def get(self, key: str) -> Optional[str]:
+        """ Returns None if key does not exist """
+        return self._decode_value(await get_redis().get(key))
+
+    async def get_many(self, *keys: str) -> list[Optional[str]]:
+        """ Returns values of keys in one round trip, None for missing keys """
+        if not keys:
+            return []
+        return [self._decode_value(value) for value in await get_redis().mget(keys)]
+
+    async def set(self, key: str, value: str, ttl: Optional[int] = None) -> None:
+        """ Sets value, expiring after `ttl` seconds if given """
+        await get_redis().set(key, value, ex=ttl)
+
+    async def set_many(self, values: dict[str, str], ttl: Optional[int] = None) -> None:
+        """ Sets values in one round trip, expiring after `ttl` seconds if given """
+        async with get_redis().pipeline(transaction=False) as pipe:
+            for key, value in values.items():
+                pipe.set(key, value, ex=ttl)
+            await pipe.execute()
+
+    async def delete(self, *keys: str) -> None:
+        """ Deletes keys """
+        if keys:
+            await get_redis().delete(*keys)
+
+    async def pop(self, key: str) -> Optional[str]:
+        """ Atomically gets and deletes value, returns None if key does not exist """
+        return self._decode_value(await get_redis().getdel(key))
+
+    async def acquire_lock(self, key: str, ttl_ms: int) -> Optional[str]:
+        """ Takes short expiring lock, returns token to release it or None if it is already taken """
+        token = uuid.uuid4().hex
+        if await get_redis().set(key, token, nx=True, px=ttl_ms):
+            return token
+        return None
+
+    async def release_lock(self, key: str, token: str) -> bool:
+        """ Releases lock if it is still held with token, so an expired lock taken over is kept """
+        return bool(await RELEASE_LOCK_SCRIPT([key], [token]))
+
+    async def exists(self, key: str) -> bool:
+        """ Returns True if key exists """
+        return bool(await get_redis().exists(key))
+
+    async def set_tracked(self, key: str, value: str, ttl: int, index: str) -> None:
+        """ Sets expiring value and records its key in `index` set for group invalidation """
+        async with get_redis().pipeline(transaction=True) as pipe:
+            pipe.set(key, value, ex=ttl)
+            pipe.sadd(index, key)
+            pipe.expire(index, ttl)
+            await pipe.execute()
+
+    async def delete_tracked(self, *indexes: str) -> None:
+        """ Deletes all keys recorded in `indexes` sets and the sets themselves """
+        if not indexes:
+            return
+        async with get_redis().pipeline(transaction=False) as pipe:
+            for index in indexes:
+                pipe.smembers(index)
+            tracked = await pipe.execute()
+        keys = {key for members in tracked for key in members}
+        await get_redis().delete(*keys, *indexes)
+
+
+class LocalTTLCache:
+    """
+    In-process LRU cache with expiring entries.
+
+    Not shared between workers, so keep TTL short for data that can change.
+    """
+
+    def __init__(self, maxsize: int, ttl: float) -> None:
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: OrderedDict[str, tuple[float, Any]] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key: str) -> Optional[Any]:
+        """ Returns None if key does not exist or expired """
+        item = self._data.get(key)
+        if item is None:
+            return None
+        expires_at, value = item
+        if expires_at <= time.monotonic():
+            del self._data[key]
+            return None
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        """ Sets value, evicting least recently used keys over `maxsize` """
+        ttl = self.ttl if ttl is None else ttl
+        self._data[key] = (time.monotonic() + ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def delete(self, key: str) -> None:
+        """ Deletes key if it exists """
+        self._data.pop(key, None)
+
+    def clear(self) -> None:
+        """ Deletes all keys """
+        self._data.clear()
+
+
+class CacheStats:
+    """ Hit and miss counters of a cache, local to the worker """
+
+    def __init__(self) -> None:
+        self.hits = 0
+        self.misses = 0
+
+    def record(self, hit: bool) -> None:
+        if hit:
+            self.hits += 1
+        else:
+            self.misses += 1
+
+    @property
+    def hit_ratio(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
@@ -0,0 +1,72 @@
+import asyncio
+
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Optional
+
+from werkzeug.security import generate_password_hash, check_password_hash
+
+from core.metrics import PASSWORD_HASH_DURATION
+from core.settings import get_settings
+
+
+settings = get_settings()
+
+
+class PasswordHasher:
+    """
+    Hashes and checks passwords in a bounded thread pool.
+
+    Password hashing takes tens to hundreds of milliseconds of CPU, running it
+    inline would block the event loop for every other request of the worker.
+    hashlib releases the GIL while hashing, so threads run it in parallel.
+    """
+
+    def __init__(self, method: str, workers: int) -> None:
+        self.method = method
+        self.workers = workers
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        """ Returns executor, creating it on first use """
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.workers,
+                thread_name_prefix="password-hasher",
+            )
+        return self._executor
+
+    async def hash(self, password: str) -> str:
+        """ Returns hash of password using configured method """
+        loop = asyncio.get_running_loop()
+        with PASSWORD_HASH_DURATION.labels("hash").time():
+            return await loop.run_in_executor(
+                self._get_executor(),
+                partial(generate_password_hash, password, method=self.method),
+            )
+
+    async def verify(self, hashed_password: str, password: str) -> bool:
+        """ Returns True if password matches hash """
+        loop = asyncio.get_running_loop()
+        with PASSWORD_HASH_DURATION.labels("verify").time():
+            return await loop.run_in_executor(
+                self._get_executor(),
+                partial(check_password_hash, hashed_password, password),
+            )
+
+    def needs_rehash(self, hashed_password: str) -> bool:
+        """ Returns True if hash was made with a method other than the configured one """
+        method = hashed_password.split("$", 1)[0]
+        return method != self.method and not method.startswith(f"{self.method}:")
+
+    def shutdown(self) -> None:
+        """ Stops executor threads, the next use creates a new executor """
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+        self._executor = None
+
+
+password_hasher = PasswordHasher(
+    method=settings.PASSWORD_HASH_METHOD,
+    workers=settings.PASSWORD_HASH_WORKERS,
+)
@@ -1,32 +1,108 @@
+import hashlib
+import time
+import uuid
 
-from typing import Optional
+from functools import lru_cache
+from typing import Any, Optional
 from jwt import encode, decode, InvalidTokenError
+from jwt.algorithms import get_default_algorithms
 
+from core.cache import LocalTTLCache
 from core.settings import get_settings
 
 
 settings = get_settings()
 
-JWT_SECRET = settings.JWT_SECRET
-JWT_ALGORITHM = settings.JWT_ALGORITHM
+ACCESS_TOKEN = "access"
+REFRESH_TOKEN = "refresh"
+
+# Tokens issued before expiry and types were introduced carry none of these and are rejected
+REQUIRED_CLAIMS = ["exp", "iat", "type"]
+
+# Claims of recently verified tokens by token digest
+verified_tokens = LocalTTLCache(
+    maxsize=settings.JWT_VERIFY_CACHE_SIZE,
+    ttl=settings.JWT_VERIFY_CACHE_TTL,
+)
+
+
+def _load_key(path: Optional[str], default: str) -> Any:
+    """ Loads PEM key once into algorithm key object, falls back to shared secret """
+    if not path:
+        return default
+    with open(path, "rb") as key_file:
+        pem = key_file.read()
+    return get_default_algorithms()[settings.JWT_ALGORITHM].prepare_key(pem)
+
+
+@lru_cache
+def get_signing_key() -> Any:
+    """ Returns private key for RS/ES/EdDSA algorithms or the shared secret """
+    return _load_key(settings.JWT_PRIVATE_KEY_PATH, settings.JWT_SECRET)
+
+
+@lru_cache
+def get_verifying_key() -> Any:
+    """ Returns public key for RS/ES/EdDSA algorithms or the shared secret """
+    return _load_key(settings.JWT_PUBLIC_KEY_PATH, settings.JWT_SECRET)
 
 
 def create_token(
-    payload: dict, 
+    payload: dict,
     secret: Optional[str] = None,
+    token_type: str = ACCESS_TOKEN,
+    ttl: Optional[int] = None,
 ) -> str:
     if not secret:
-        secret = JWT_SECRET
-    return encode(payload, secret, algorithm=JWT_ALGORITHM)
+        secret = get_signing_key()
+    if ttl is None:
+        ttl = settings.JWT_REFRESH_TOKEN_TTL if token_type == REFRESH_TOKEN else settings.JWT_ACCESS_TOKEN_TTL
+    now = int(time.time())
+    claims = {"jti": uuid.uuid4().hex, **payload, "type": token_type, "iat": now, "exp": now + ttl}
+    return encode(claims, secret, algorithm=settings.JWT_ALGORITHM)
+
+
+def _verify_token(token: str, secret: Any) -> Optional[dict]:
+    try:
+        return decode(
+            token,
+            secret,
+            algorithms=[settings.JWT_ALGORITHM],
+            options={"require": REQUIRED_CLAIMS},
+        )
+    except InvalidTokenError:
+        return None
 
 
 def decode_token(
-    token: str, 
+    token: str,
     secret: Optional[str] = None,
+    token_type: str = ACCESS_TOKEN,
+    use_cache: bool = True,
 ) -> Optional[dict]:
-    if not secret:
-        secret = JWT_SECRET
-    try:
-        return decode(token, secret, algorithms=[JWT_ALGORITHM])
-    except InvalidTokenError:
+    """
+    Verifies token and returns its claims, None if token is invalid,
+    expired, lacks expiry or type claims, or is of another type.
+
+    Claims of tokens verified with the default key are cached by token
+    digest until the token expires, so repeated requests skip signature
+    verification.
+    """
+    use_cache = use_cache and not secret and settings.JWT_VERIFY_CACHE_SIZE > 0
+    digest = hashlib.sha256(token.encode()).hexdigest() if use_cache else None
+
+    payload = verified_tokens.get(digest) if use_cache else None
+    if payload is None:
+        payload = _verify_token(token, secret or get_verifying_key())
+        if payload is None:
+            return None
+        if use_cache:
+            ttl = settings.JWT_VERIFY_CACHE_TTL
+            if "exp" in payload:
+                ttl = min(ttl, payload["exp"] - time.time())
+            if ttl > 0:
+                verified_tokens.set(digest, payload, ttl=ttl)
+
+    if payload["type"] != token_type:
         return None
+    return payload
@@ -0,0 +1,172 @@
+import time
+
+from typing import Any, Callable, Iterator, Optional
+
+from prometheus_client import Histogram
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+from prometheus_client.registry import Collector
+from redis import asyncio as aioredis
+from redis.asyncio.client import Pipeline
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+
+REQUEST_DURATION = Histogram(
+    "http_request_duration_seconds",
+    "Duration of HTTP requests by route template",
+    ["method", "route", "status"],
+)
+DB_QUERY_DURATION = Histogram(
+    "db_query_duration_seconds",
+    "Duration of database statements by statement type",
+    ["operation"],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5),
+)
+REDIS_COMMAND_DURATION = Histogram(
+    "redis_command_duration_seconds",
+    "Duration of Redis commands, pipelines are timed as a whole",
+    ["command"],
+    buckets=(0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25),
+)
+PASSWORD_HASH_DURATION = Histogram(
+    "password_hash_duration_seconds",
+    "Duration of password hashing including wait for a hashing thread",
+    ["operation"],
+)
+LIKES_SYNC_BATCH_SIZE = Histogram(
+    "likes_sync_batch_size",
+    "Number of cached likes changes synced into database per post",
+    buckets=(1, 2, 5, 10, 25, 50, 100, 250, 500, 1000),
+)
+LIKES_FLUSH_DURATION = Histogram(
+    "likes_flush_duration_seconds",
+    "Duration of draining dirty posts of the likes write-behind cache",
+)
+
+# Key of `Connection.info` holding start times of running statements
+_QUERY_STARTED = "query_started"
+_OPERATIONS = {"SELECT", "INSERT", "UPDATE", "DELETE", "WITH", "BEGIN", "COMMIT", "ROLLBACK"}
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware recording latency of HTTP requests.
+
+    Requests are labeled by route template instead of path, so path
+    parameters do not create a time series per value.
+    """
+
+    def __init__(self, app: Any) -> None:
+        self.app = app
+
+    async def __call__(self, scope: dict, receive: Callable, send: Callable) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+
+        async def send_with_status(message: dict) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            route = scope.get("route")
+            REQUEST_DURATION.labels(
+                scope["method"],
+                route.path if route is not None else "unmatched",
+                status,
+            ).observe(time.perf_counter() - started)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany) -> None:
+    conn.info.setdefault(_QUERY_STARTED, []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany) -> None:
+    started = conn.info[_QUERY_STARTED].pop()
+    words = statement.split(None, 1)
+    operation = words[0].upper() if words else ""
+    if operation not in _OPERATIONS:
+        operation = "OTHER"
+    DB_QUERY_DURATION.labels(operation).observe(time.perf_counter() - started)
+
+
+def _handle_error(context) -> None:
+    # Failed statements do not reach `after_cursor_execute`
+    started = context.connection.info.get(_QUERY_STARTED) if context.connection is not None else None
+    if started:
+        started.pop()
+
+
+def instrument_engine(engine: Engine) -> None:
+    """ Records duration and count of statements executed by engine """
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(engine, "handle_error", _handle_error)
+
+
+class InstrumentedPipeline(Pipeline):
+    """ Pipeline recording duration of its execution """
+
+    async def execute(self, raise_on_error: bool = True) -> list[Any]:
+        started = time.perf_counter()
+        try:
+            return await super().execute(raise_on_error)
+        finally:
+            REDIS_COMMAND_DURATION.labels("PIPELINE").observe(time.perf_counter() - started)
+
+
+class InstrumentedRedis(aioredis.Redis):
+    """ Redis client recording duration of every command """
+
+    async def execute_command(self, *args: Any, **options: Any) -> Any:
+        started = time.perf_counter()
+        try:
+            return await super().execute_command(*args, **options)
+        finally:
+            REDIS_COMMAND_DURATION.labels(str(args[0]).upper()).observe(time.perf_counter() - started)
+
+    def pipeline(self, transaction: bool = True, shard_hint: Optional[str] = None) -> InstrumentedPipeline:
+        return InstrumentedPipeline(self.connection_pool, self.response_callbacks, transaction, shard_hint)
+
+
+class StatsCollector(Collector):
+    """
+    Exposes counters and pool usage the app already tracks, read on scrape,
+    so requests pay nothing for them.
+    """
+
+    def __init__(
+        self,
+        cache_stats: dict[str, Any],
+        db_pool_stats: Callable[[], dict[str, int]],
+        redis_pool_stats: Callable[[], dict[str, int]],
+    ) -> None:
+        self.cache_stats = cache_stats
+        self.db_pool_stats = db_pool_stats
+        self.redis_pool_stats = redis_pool_stats
+
+    def collect(self) -> Iterator[Any]:
+        hits = CounterMetricFamily("cache_hits", "Read-through cache hits", labels=["cache"])
+        misses = CounterMetricFamily("cache_misses", "Read-through cache misses", labels=["cache"])
+        for name, stats in self.cache_stats.items():
+            hits.add_metric([name], stats.hits)
+            misses.add_metric([name], stats.misses)
+        yield hits
+        yield misses
+
+        db_pool = GaugeMetricFamily("db_pool_connections", "Database connection pool usage", labels=["state"])
+        for state, value in self.db_pool_stats().items():
+            db_pool.add_metric([state], value)
+        yield db_pool
+
+        redis_pool = GaugeMetricFamily("redis_pool_connections", "Redis connection pool usage", labels=["state"])
+        for state, value in self.redis_pool_stats().items():
+            redis_pool.add_metric([state], value)
+        yield redis_pool
@@ -0,0 +1,74 @@
+import base64
+import binascii
+
+import ujson
+
+from datetime import datetime
+from typing import Any
+
+from core.settings import get_settings
+
+
+def encode_cursor(payload: dict[str, Any]) -> str:
+    """
+    Encodes keyset position into an opaque url-safe cursor.
+
+    :param payload: JSON-serializable position of the last returned row.
+    :return: Cursor string.
+    """
+    raw = ujson.dumps(payload).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> dict[str, Any]:
+    """
+    Decodes cursor created by `encode_cursor`.
+
+    :param cursor: Cursor string.
+    :return: Keyset position.
+    :raises ValueError: If cursor is malformed.
+    """
+    padded = cursor + "=" * (-len(cursor) % 4)
+    try:
+        payload = ujson.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (binascii.Error, ValueError) as exc:
+        raise ValueError("Invalid cursor") from exc
+    if not isinstance(payload, dict):
+        raise ValueError("Invalid cursor")
+    return payload
+
+
+def encode_position_cursor(created_at: datetime, id: int) -> str:
+    """
+    Encodes `(created_at, id)` keyset position of feeds into a cursor.
+
+    :param created_at: Creation time of the last returned post.
+    :param id: Id of the last returned post.
+    :return: Cursor string.
+    """
+    return encode_cursor({"created_at": created_at.isoformat(), "id": id})
+
+
+def decode_position_cursor(cursor: str) -> tuple[datetime, int]:
+    """
+    Decodes cursor created by `encode_position_cursor`.
+
+    :param cursor: Cursor string.
+    :return: `(created_at, id)` keyset position.
+    :raises ValueError: If cursor is malformed.
+    """
+    payload = decode_cursor(cursor)
+    try:
+        return datetime.fromisoformat(payload["created_at"]), int(payload["id"])
+    except (KeyError, TypeError) as exc:
+        raise ValueError("Invalid cursor") from exc
+
+
+def clamp_limit(limit: int) -> int:
+    """
+    Caps requested page size at `MAX_PAGE_SIZE`.
+
+    :param limit: Requested page size.
+    :return: Page size to query.
+    """
+    return min(limit, get_settings().MAX_PAGE_SIZE)
@@ -1,4 +1,6 @@
 
+from functools import lru_cache
+from typing import Optional
 from pydantic import BaseSettings
 
 
@@ -11,23 +13,96 @@ class ProjectSettings(BaseSettings):
     APP_NAME: str = "FastAPI Blog"
 
     DEBUG: bool = True
+    # Prometheus metrics at /metrics, with request, database and Redis timings
+    METRICS_ENABLED: bool = True
 
     HOST: str = "localhost"
     PORT: int = 8000
 
     POST_LIKES_CACHE_THRESHOLD: int = 100
+    LIKES_BATCH_MAX_SIZE: int = 100
+    MAX_PAGE_SIZE: int = 100
+    EXPORT_BATCH_SIZE: int = 1000
+
+    LIKES_FLUSH_ENABLED: bool = True
+    LIKES_FLUSH_INTERVAL: float = 5.0
+    LIKES_FLUSH_POLL_INTERVAL: float = 0.5
+    LIKES_FLUSH_BATCH_SIZE: int = 100
+    LIKES_RECONCILE_INTERVAL: float = 300.0
 
     POSTGRES_USER: str = "postgres"
     POSTGRES_PASSWORD: str = "postgres"
     POSTGRES_HOST: str = "localhost"
     POSTGRES_PORT: str = "5432"
     POSTGRES_DB: str = "postgres"
+    # SQLAlchemy URI of the primary with an async driver, overrides POSTGRES_* if set,
+    # e.g. sqlite+aiosqlite:///blog.db for local runs
+    DB_URI: Optional[str] = None
+
+    DB_POOL_SIZE: int = 5
+    DB_MAX_OVERFLOW: int = 10
+    DB_POOL_TIMEOUT: float = 30.0
+    DB_POOL_RECYCLE: int = 1800
+    DB_POOL_PRE_PING: bool = True
+    # Prepared statements cached per connection by asyncpg and SQLAlchemy, set to 0 behind
+    # pgbouncer in transaction mode, which also gives each statement a unique name
+    DB_STATEMENT_CACHE_SIZE: int = 100
+    # Read replicas as JSON list of SQLAlchemy URIs, reads go to the primary if empty
+    DB_REPLICA_URIS: list[str] = []
+    DB_REPLICA_CHECK_INTERVAL: float = 10.0
+    # Seconds reads of a user stay on the primary after the user wrote
+    DB_READ_YOUR_WRITES_TTL: int = 5
 
     REDIS_HOST: str = "localhost"
     REDIS_PORT: int = 6379
 
+    REDIS_MAX_CONNECTIONS: int = 50
+    REDIS_POOL_TIMEOUT: float = 5.0
+    REDIS_SOCKET_TIMEOUT: float = 5.0
+    REDIS_SOCKET_CONNECT_TIMEOUT: float = 5.0
+    REDIS_HEALTH_CHECK_INTERVAL: int = 30
+
+    POST_CACHE_TTL: int = 300
+    FEED_CACHE_TTL: int = 30
+    TOPIC_FEEDS_ENABLED: bool = False
+    TOPIC_FEED_MAX_SIZE: int = 1000
+    TOPIC_FEED_TTL: int = 3600
+    TIMELINE_MAX_SIZE: int = 800
+    TIMELINE_TTL: int = 24 * 3600
+    # Posts of authors with more followers are pulled on timeline reads instead of fanned out
+    TIMELINE_FANOUT_MAX_FOLLOWERS: int = 5000
+    TIMELINE_FANOUT_BATCH_SIZE: int = 1000
+    # New posts are fanned out by the likes flusher task, which also runs with LIKES_FLUSH_ENABLED off.
+    # Turned off, timelines pick up new posts only when they are rebuilt
+    TIMELINE_FANOUT_ENABLED: bool = True
+    # Weight of likes in trending scores halves every half-life seconds
+    TRENDING_HALF_LIFE: float = 6 * 3600.0
+    TRENDING_POST_WEIGHT: float = 1.0
+    TRENDING_MAX_SIZE: int = 1000
+    TRENDING_MIN_SCORE: float = 0.01
+    TRENDING_REBASE_INTERVAL: float = 60.0
+    TRENDING_TOPICS_ENABLED: bool = False
+    CACHE_FILL_LOCK_TTL_MS: int = 500
+    CACHE_FILL_POLL_MS: int = 20
+
+    USER_CACHE_TTL: int = 300
+    # Bounds how long other workers authenticate a user after it was changed or deactivated
+    USER_CACHE_LOCAL_TTL: float = 30.0
+    USER_CACHE_LOCAL_SIZE: int = 10000
+
+    # Werkzeug hash method, hashes made with another method are upgraded on login
+    PASSWORD_HASH_METHOD: str = "scrypt"
+    PASSWORD_HASH_WORKERS: int = 4
+
     JWT_SECRET: str = "secret"
     JWT_ALGORITHM: str = "HS256"
+    # PEM keys for RS/ES/EdDSA algorithms, verifying services need only the public one
+    JWT_PRIVATE_KEY_PATH: Optional[str] = None
+    JWT_PUBLIC_KEY_PATH: Optional[str] = None
+    JWT_ACCESS_TOKEN_TTL: int = 3600
+    JWT_REFRESH_TOKEN_TTL: int = 30 * 24 * 3600
+    JWT_VERIFY_CACHE_SIZE: int = 10000
+    JWT_VERIFY_CACHE_TTL: float = 300.0
 
     def get_db_uri(self, driver: str) -> str:
         return f"postgresql+{driver}://{self.POSTGRES_USER}:{self.POSTGRES_PASSWORD}"\
@@ -41,5 +116,7 @@ class ProjectSettings(BaseSettings):
         env_file_encoding = "utf-8"
 
 
+@lru_cache
 def get_settings() -> ProjectSettings:
+    """ Returns settings parsed once per process """
     return ProjectSettings()
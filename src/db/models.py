@@ -1,6 +1,7 @@
 
 from sqlalchemy import *
-from sqlalchemy.orm import relationship
+from sqlalchemy.dialects.postgresql import TSVECTOR
+from sqlalchemy.orm import relationship, deferred
 from sqlalchemy.ext.declarative import declarative_base
 
 
@@ -18,6 +19,9 @@ class BaseModel(Base):
         updated_at (datetime): Date and time of last update
     """
 
+    # Fetch generated columns with RETURNING on flush instead of a refresh query
+    __mapper_args__ = {"eager_defaults": True}
+
     id = Column(Integer, primary_key=True, autoincrement=True)
     created_at = Column(DateTime, default=func.now())
     updated_at = Column(DateTime, default=func.now(), onupdate=func.now())
@@ -35,6 +39,7 @@ class User(BaseModel):
         first_name (str): First name of user
         last_name (str): Last name of user
         is_active (bool): Whether user is active or not
+        followers_count (int): Number of users following user
     """
 
     username = Column(String(50), unique=True, nullable=False)
@@ -46,9 +51,15 @@ class User(BaseModel):
 
     is_active = Column(Boolean, default=True)
 
+    followers_count = Column(Integer, default=0, server_default="0", nullable=False)
+
 
 class Post(BaseModel):
     __tablename__ = "posts"
+    __table_args__ = (
+        Index("ix_posts_created_at_id", "created_at", "id"),
+        Index("ix_posts_search_vector", "search_vector", postgresql_using="gin"),
+    )
     """
     Post model
 
@@ -57,6 +68,8 @@ class Post(BaseModel):
         content (str): Content of post
         likes (int): Number of likes on post
         author_id (int): ID of user who created post
+        search_vector (str): Full-text search document of title and content,
+            maintained by `posts_search_vector_update` trigger in Postgres
     """
 
     title = Column(String(50), nullable=False)
@@ -69,9 +82,20 @@ class Post(BaseModel):
     author_id = Column(Integer, ForeignKey("users.id"))
     author = relationship("User", backref="posts")
 
+    search_vector = deferred(Column(TSVECTOR().with_variant(Text(), "sqlite"), nullable=True))
+
+
+# Serves topic feeds in keyset order without sorting
+Index("ix_posts_topic_created_at_id", Post.topic, Post.created_at.desc(), Post.id.desc())
+# Serves timelines built from posts of followed authors
+Index("ix_posts_author_id_created_at_id", Post.author_id, Post.created_at.desc(), Post.id.desc())
+
 
 class UserLike(BaseModel):
     __tablename__ = "user_likes"
+    __table_args__ = (
+        UniqueConstraint("user_id", "post_id", name="uq_user_likes_user_id_post_id"),
+    )
     """
     UserLike model
 
@@ -81,4 +105,21 @@ class UserLike(BaseModel):
     """
 
     user_id = Column(Integer, ForeignKey("users.id"))
-    post_id = Column(Integer, ForeignKey("posts.id"))
+    post_id = Column(Integer, ForeignKey("posts.id"), index=True)
+
+
+class UserFollow(BaseModel):
+    __tablename__ = "user_follows"
+    __table_args__ = (
+        UniqueConstraint("follower_id", "followee_id", name="uq_user_follows_follower_id_followee_id"),
+    )
+    """
+    UserFollow model
+
+    Attributes:
+        follower_id (int): ID of user who follows
+        followee_id (int): ID of user who is followed
+    """
+
+    follower_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    followee_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
@@ -0,0 +1,145 @@
+import asyncio
+import itertools
+import logging
+
+from functools import partial
+from typing import Any, Optional
+
+from sqlalchemy import event, text
+from sqlalchemy.engine import Engine, ExceptionContext
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession
+from sqlalchemy.orm import Session
+
+from core.cache import ValueCacher
+from core.settings import get_settings
+
+
+logger = logging.getLogger(__name__)
+
+# Keys of `Session.info`
+REPLICAS = "replicas"
+REPLICA = "replica"
+USE_PRIMARY = "use_primary"
+WROTE = "wrote"
+USER_ID = "user_id"
+
+
+class ReplicaSet:
+    """
+    Read replicas picked round-robin.
+
+    Replicas failing the periodic health check or dropping connections are
+    skipped until they pass the check again.
+    """
+
+    def __init__(self, engines: list[AsyncEngine], check_interval: float) -> None:
+        self.engines = engines
+        self.check_interval = check_interval
+        self.healthy = [True] * len(engines)
+        self._next = itertools.count()
+        self._task: Optional[asyncio.Task] = None
+        for index, engine in enumerate(engines):
+            event.listen(engine.sync_engine, "handle_error", partial(self._on_error, index))
+
+    def choose(self) -> Optional[AsyncEngine]:
+        """ Returns next healthy replica, None if all replicas are down """
+        for _ in range(len(self.engines)):
+            index = next(self._next) % len(self.engines)
+            if self.healthy[index]:
+                return self.engines[index]
+        return None
+
+    def _on_error(self, index: int, context: ExceptionContext) -> None:
+        if context.is_disconnect:
+            self.healthy[index] = False
+
+    async def _ping(self, engine: AsyncEngine) -> None:
+        async with engine.connect() as connection:
+            await connection.execute(text("SELECT 1"))
+
+    async def check(self) -> None:
+        """ Pings every replica and updates its health """
+        for index, engine in enumerate(self.engines):
+            try:
+                await asyncio.wait_for(self._ping(engine), timeout=self.check_interval)
+            except Exception as exc:
+                if self.healthy[index]:
+                    logger.warning("Replica %s failed health check: %r", engine.url, exc)
+                self.healthy[index] = False
+            else:
+                self.healthy[index] = True
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.check_interval)
+            await self.check()
+
+    def start(self) -> None:
+        """ Starts health checks in the running event loop """
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def dispose(self) -> None:
+        """ Stops health checks and closes replica connections """
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        for engine in self.engines:
+            await engine.dispose()
+
+
+class RoutingSession(Session):
+    """
+    Session sending reads to a replica and writes to the primary.
+
+    Once the session writes, all its later statements use the primary,
+    so a request reads its own writes. Reads of a session stick to one
+    replica to keep a consistent view.
+    """
+
+    def get_bind(self, mapper: Any = None, clause: Any = None, **kwargs: Any) -> Engine:
+        if self._flushing or getattr(clause, "is_dml", False):
+            self.info[USE_PRIMARY] = True
+            self.info[WROTE] = True
+
+        replicas: Optional[ReplicaSet] = self.info.get(REPLICAS)
+        if replicas is None or self.info.get(USE_PRIMARY):
+            return super().get_bind(mapper, clause=clause, **kwargs)
+
+        replica = self.info.get(REPLICA) or replicas.choose()
+        if replica is None:
+            return super().get_bind(mapper, clause=clause, **kwargs)
+        self.info[REPLICA] = replica
+        return replica.sync_engine
+
+
+class ReadYourWrites:
+    """
+    Keeps reads of a user on the primary for `DB_READ_YOUR_WRITES_TTL`
+    seconds after the user wrote, so replica lag does not hide the write
+    from the next requests of the user. Shared between workers in Redis.
+    """
+    KEY_PREFIX = "db:primary_reads"
+
+    def __init__(self) -> None:
+        self.cacher = ValueCacher()
+
+    def _key(self, user_id: int) -> str:
+        return f"{self.KEY_PREFIX}:{user_id}"
+
+    async def route(self, session: AsyncSession, user_id: int) -> None:
+        """ Binds session to user, routing its reads to the primary if user wrote recently """
+        if session.info.get(REPLICAS) is None:
+            return
+        session.info[USER_ID] = user_id
+        if await self.cacher.exists(self._key(user_id)):
+            session.info[USE_PRIMARY] = True
+
+    async def after_commit(self, session: AsyncSession) -> None:
+        """ Records write of the user bound to session """
+        user_id = session.info.get(USER_ID)
+        if session.info.pop(WROTE, False) and user_id is not None:
+            await self.cacher.set(self._key(user_id), "1", ttl=get_settings().DB_READ_YOUR_WRITES_TTL)
+
+
+read_your_writes = ReadYourWrites()
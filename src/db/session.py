@@ -1,24 +1,169 @@
 
-from sqlalchemy.ext.asyncio import create_async_engine
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Optional
+from uuid import uuid4
+
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine, AsyncEngine
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import QueuePool
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from core.metrics import instrument_engine
 from core.settings import get_settings, PostgresDrivers
+from db.routing import REPLICAS, USE_PRIMARY, ReplicaSet, RoutingSession, read_your_writes
+
+
+_engine: Optional[AsyncEngine] = None
+_replicas: Optional[ReplicaSet] = None
+_sessionmaker: Optional[sessionmaker] = None
+
+
+def _engine_options(uri: str) -> dict:
+    """ Returns pool and driver options supported by the dialect of uri """
+    settings = get_settings()
+    url = make_url(uri)
+    options = {"pool_pre_ping": settings.DB_POOL_PRE_PING}
+    if url.get_backend_name() != "sqlite":
+        # SQLite pools are not sized, in-memory databases use a single connection
+        options.update(
+            pool_size=settings.DB_POOL_SIZE,
+            max_overflow=settings.DB_MAX_OVERFLOW,
+            pool_timeout=settings.DB_POOL_TIMEOUT,
+            pool_recycle=settings.DB_POOL_RECYCLE,
+        )
+    if url.get_driver_name() == "asyncpg":
+        # asyncpg and the SQLAlchemy dialect on top of it keep separate caches
+        cache_size = settings.DB_STATEMENT_CACHE_SIZE
+        connect_args = {
+            "statement_cache_size": cache_size,
+            "prepared_statement_cache_size": cache_size,
+        }
+        if not cache_size:
+            # Behind pgbouncer in transaction mode, connections share server backends,
+            # so default statement names of one connection collide with another's
+            connect_args["prepared_statement_name_func"] = _unique_statement_name
+        options["connect_args"] = connect_args
+    return options
+
+
+def _unique_statement_name() -> str:
+    return f"__asyncpg_{uuid4()}__"
+
+
+def _create_engine(uri: str) -> AsyncEngine:
+    settings = get_settings()
+    engine = create_async_engine(uri, future=True, **_engine_options(uri))
+    if settings.METRICS_ENABLED:
+        instrument_engine(engine.sync_engine)
+    return engine
+
+
+def get_engine() -> AsyncEngine:
+    """ Returns engine of the worker, creating it on first use """
+    global _engine
+    if _engine is None:
+        settings = get_settings()
+        _engine = _create_engine(settings.DB_URI or settings.get_db_uri(driver=PostgresDrivers.asyncpg))
+    return _engine
+
+
+def get_replicas() -> Optional[ReplicaSet]:
+    """ Returns read replicas of the worker, None if no replicas are configured """
+    global _replicas
+    settings = get_settings()
+    if _replicas is None and settings.DB_REPLICA_URIS:
+        _replicas = ReplicaSet(
+            [_create_engine(uri) for uri in settings.DB_REPLICA_URIS],
+            check_interval=settings.DB_REPLICA_CHECK_INTERVAL,
+        )
+    return _replicas
 
 
-settings = get_settings()
-DATABASE_URI = settings.get_db_uri(driver=PostgresDrivers.asyncpg)
+def get_sessionmaker() -> sessionmaker:
+    """ Returns session factory bound to the engine of the worker """
+    global _sessionmaker
+    if _sessionmaker is None:
+        replicas = get_replicas()
+        _sessionmaker = sessionmaker(
+            autocommit=False, 
+            autoflush=False, 
+            bind=get_engine(), 
+            class_=AsyncSession,
+            sync_session_class=RoutingSession,
+            info={REPLICAS: replicas} if replicas else None,
+            expire_on_commit=False
+        )
+    return _sessionmaker
 
-engine = create_async_engine(DATABASE_URI, future=True)
-SessionLocal = sessionmaker(
-    autocommit=False, 
-    autoflush=False, 
-    bind=engine, 
-    class_=AsyncSession,
-    expire_on_commit=False
-)
+
+async def dispose_engine() -> None:
+    """ Closes engine connections, the next use creates a new engine """
+    global _engine, _replicas, _sessionmaker
+    if _engine is not None:
+        await _engine.dispose()
+    if _replicas is not None:
+        await _replicas.dispose()
+    _engine = None
+    _replicas = None
+    _sessionmaker = None
+
+
+async def commit(session: AsyncSession) -> None:
+    """ Commits session, keeping next reads of its user on the primary if it wrote """
+    await session.commit()
+    await read_your_writes.after_commit(session)
+
+
+UNIT_OF_WORK_DEPTH = "unit_of_work_depth"
+
+
+def in_unit_of_work(session: AsyncSession) -> bool:
+    """ Returns True while a unit of work is open on the session """
+    return session.info.get(UNIT_OF_WORK_DEPTH, 0) > 0
+
+
+@asynccontextmanager
+async def unit_of_work(session: AsyncSession) -> AsyncIterator[AsyncSession]:
+    """
+    Groups changes of repositories sharing the session into one transaction.
+
+    Repositories defer their commits while a unit of work is open, the
+    outermost unit commits once on exit or rolls back on error. Units nest,
+    so services can call each other inside one transaction. Reads inside
+    a unit of work go to the primary, so writes are not based on lagging data.
+    """
+    session.info[USE_PRIMARY] = True
+    depth = session.info.get(UNIT_OF_WORK_DEPTH, 0)
+    session.info[UNIT_OF_WORK_DEPTH] = depth + 1
+    try:
+        yield session
+        if depth == 0:
+            await commit(session)
+    except BaseException:
+        if depth == 0:
+            await session.rollback()
+        raise
+    finally:
+        session.info[UNIT_OF_WORK_DEPTH] = depth
 
 
 async def get_session() -> AsyncSession:
-    async with SessionLocal() as session:
+    """ Yields session of the request, shared by all repositories it injects """
+    async with get_sessionmaker()() as session:
         yield session
+
+
+def get_pool_stats() -> dict[str, int]:
+    """ Returns connection pool usage of the engine """
+    pool = get_engine().pool
+    if not isinstance(pool, QueuePool):
+        # Only queue pools are sized, e.g. in-memory SQLite uses a single connection
+        return dict.fromkeys(("size", "max_overflow", "checked_in", "checked_out", "overflow"), 0)
+    return {
+        "size": pool.size(),
+        "max_overflow": get_settings().DB_MAX_OVERFLOW,
+        "checked_in": pool.checkedin(),
+        "checked_out": pool.checkedout(),
+        "overflow": pool.overflow(),
+    }
@@ -5,42 +5,74 @@ from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 
 from core.jwt import decode_token
+from db.routing import REPLICA, read_your_writes
 
-from db.models import User
 from repositories.user import UserRepo
+from repositories.user_cache import UserPrincipalCacheRepo
+from schemas.user import UserPrincipal
 
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
+credentials_exception = HTTPException(
+    status_code=status.HTTP_401_UNAUTHORIZED,
+    detail="Invalid authentication credentials",
+    headers={"WWW-Authenticate": "Bearer"},
+)
+
 
 async def get_user_by_token(
     token: Annotated[str, Depends(oauth2_scheme)],
-    user_repo: Annotated[UserRepo, Depends()]
-) -> User:
+    user_repo: Annotated[UserRepo, Depends()],
+    user_cache: Annotated[UserPrincipalCacheRepo, Depends()],
+) -> UserPrincipal:
     """
     Get a user by token.
 
+    The user is served from the principal cache, the database
+    is queried only on a cache miss, falling back to the primary
+    if a lagging replica misses the user. Reads of the request are
+    routed to the primary if the user wrote recently.
+
     Args:
         token (str): The JWT token.
-        user_service (UserService): The user service.
+        user_repo (UserRepo): The user repository.
+        user_cache (UserPrincipalCacheRepo): The user principal cache.
 
     Returns:
-        User: The user.
+        UserPrincipal: The user.
     """
     payload = decode_token(token=token)
+    if not payload:
+        raise credentials_exception
     username: str = payload.get("username", None)
+    user_id: int = payload.get("user_id", None)
     if not username:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Invalid authentication credentials",
-            headers={"WWW-Authenticate": "Bearer"},
-        )
-
-    user = await user_repo.get_by_username(username)
-    if not user:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Invalid authentication credentials",
-            headers={"WWW-Authenticate": "Bearer"},
-        )
-    return user
+        raise credentials_exception
+
+    principal = await user_cache.get(username, user_id)
+    if principal:
+        if not principal.is_active:
+            raise credentials_exception
+        await read_your_writes.route(user_repo.session, principal.id)
+        return principal
+
+    async def get_user():
+        if user_id is not None:
+            return await user_repo.get_by_id(user_id)
+        return await user_repo.get_by_username(username)
+
+    user = await get_user()
+    if not user and user_repo.session.info.get(REPLICA) is not None:
+        # Replica may lag behind a just created user
+        user_repo.use_primary()
+        user = await get_user()
+    if not user or user.username != username:
+        raise credentials_exception
+
+    principal = UserPrincipal.from_orm(user)
+    await user_cache.set(principal)
+    if not principal.is_active:
+        raise credentials_exception
+    await read_your_writes.route(user_repo.session, principal.id)
+    return principal
@@ -1,18 +1,52 @@
 import uvicorn
 
-from fastapi import FastAPI
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Response
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, generate_latest
 
-from routes import auth_router, user_router, posts_router
+from routes import auth_router, user_router, posts_router, system_router
+from services.like_flusher import likes_flusher
 
+from core.cache import close_redis, get_pool_stats as get_redis_pool_stats
+from core.hashing import password_hasher
+from core.metrics import MetricsMiddleware, StatsCollector
 from core.settings import get_settings
+from db.session import dispose_engine, get_replicas, get_pool_stats as get_db_pool_stats
+from repositories.post_cache import post_cache_stats
 
 
 settings = get_settings()
-app = FastAPI(debug=settings.DEBUG)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if settings.LIKES_FLUSH_ENABLED or settings.TIMELINE_FANOUT_ENABLED:
+        likes_flusher.start()
+    replicas = get_replicas()
+    if replicas:
+        replicas.start()
+    yield
+    await likes_flusher.stop()
+    await close_redis()
+    await dispose_engine()
+    password_hasher.shutdown()
+
+
+app = FastAPI(debug=settings.DEBUG, lifespan=lifespan)
 
 app.include_router(auth_router)
 app.include_router(user_router)
 app.include_router(posts_router)
+app.include_router(system_router)
+
+if settings.METRICS_ENABLED:
+    app.add_middleware(MetricsMiddleware)
+    REGISTRY.register(StatsCollector(post_cache_stats, get_db_pool_stats, get_redis_pool_stats))
+
+    @app.get('/metrics', include_in_schema=False)
+    async def metrics() -> Response:
+        """ Prometheus metrics of this worker """
+        return Response(generate_latest(REGISTRY), media_type=CONTENT_TYPE_LATEST)
 
 
 def main() -> None:
@@ -0,0 +1,75 @@
+from typing import Annotated
+from fastapi import Depends
+
+from sqlalchemy import select, delete
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from repositories.generic import GenericRepo
+
+from db.models import UserFollow, User
+from db.session import get_session
+
+
+class FollowRepo(GenericRepo[UserFollow]):
+    def __init__(self, session: Annotated[AsyncSession, Depends(get_session)]) -> None:
+        self.Model = UserFollow
+        super().__init__(session, self.Model)
+
+    async def create_follow(self, follower_id: int, followee_id: int) -> bool:
+        """
+        Create follow with `INSERT ... ON CONFLICT DO NOTHING`.
+        Does not commit, so it can share a transaction with the followers counter update.
+
+        :param follower_id: Id of user who follows.
+        :param followee_id: Id of user who is followed.
+        :return: True if follow was created, False if it already existed.
+        """
+        stmt = (
+            self._insert()
+            .values(follower_id=follower_id, followee_id=followee_id)
+            .on_conflict_do_nothing(index_elements=["follower_id", "followee_id"])
+            .returning(self.Model.id)
+        )
+        result = await self.session.execute(stmt)
+        return result.first() is not None
+
+    async def delete_follow(self, follower_id: int, followee_id: int) -> bool:
+        """
+        Delete follow, does not commit.
+
+        :param follower_id: Id of user who follows.
+        :param followee_id: Id of user who is followed.
+        :return: True if follow was deleted, False if it did not exist.
+        """
+        stmt = delete(self.Model).where(
+            self.Model.follower_id == follower_id,
+            self.Model.followee_id == followee_id,
+        )
+        result = await self.session.execute(stmt)
+        return result.rowcount > 0
+
+    async def get_follower_ids(self, followee_id: int) -> list[int]:
+        """
+        Get ids of all followers of user.
+
+        :param followee_id: Id of followed user.
+        :return: Ids of followers.
+        """
+        query = select(self.Model.follower_id).where(self.Model.followee_id == followee_id)
+        result = await self.session.execute(query)
+        return list(result.scalars().all())
+
+    async def get_followees(self, follower_id: int) -> dict[int, int]:
+        """
+        Get users followed by user with their followers counters in one query.
+
+        :param follower_id: Id of user who follows.
+        :return: Mapping of followed user id to number of their followers.
+        """
+        query = (
+            select(User.id, User.followers_count)
+            .join(self.Model, self.Model.followee_id == User.id)
+            .where(self.Model.follower_id == follower_id)
+        )
+        result = await self.session.execute(query)
+        return {user_id: followers for user_id, followers in result.all()}
@@ -1,9 +1,13 @@
-from typing import TypeVar, Type, Generic, Optional, Any
+from contextlib import AbstractAsyncContextManager
+from typing import TypeVar, Type, Generic, Optional, Any, AsyncIterator, Callable, Sequence
 
-from sqlalchemy import select, update, and_
+from sqlalchemy import select, insert, update, exists, func, tuple_, Row, Select
+from sqlalchemy.dialects import postgresql, sqlite
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from db.models import BaseModel
+from db.routing import USE_PRIMARY
+from db.session import commit, in_unit_of_work, unit_of_work
 
 
 T = TypeVar("T", bound=BaseModel)
@@ -20,15 +24,169 @@ class GenericRepo(Generic[T]):
         self.session = session
         self.model = model
 
+    def _filters(self, **kwargs: dict[str, Any]) -> list[Any]:
+        """
+        Builds equality conditions from keyword arguments.
+
+        :param kwargs: Column names and values.
+        :return: List of conditions.
+        """
+        return [getattr(self.model, k) == v for k, v in kwargs.items()]
+
+    def _select(self, columns: Optional[Sequence[Any]] = None) -> Select:
+        """
+        Selects model objects or, if columns are given, only these columns.
+
+        :param columns: Columns to project.
+        :return: Select statement.
+        """
+        return select(*columns) if columns else select(self.model)
+
+    async def _fetch(self, query: Select, columns: Optional[Sequence[Any]] = None) -> list[T] | list[Row]:
+        """
+        Executes select statement built by `_select`.
+
+        :param query: Select statement.
+        :param columns: Columns the statement projects.
+        :return: Model objects or rows of projected columns.
+        """
+        result = await self.session.execute(query)
+        return result.all() if columns else result.scalars().all()
+
+    def _keyset(
+        self,
+        query: Select,
+        limit: int,
+        after: Optional[tuple[Any, ...]] = None,
+        keys: Optional[Sequence[Any]] = None,
+    ) -> Select:
+        """
+        Applies keyset pagination, newest first by default.
+
+        The query seeks past the last row of the previous page by comparing
+        row values, so it costs the same for any page given an index on keys.
+
+        :param query: Select statement.
+        :param limit: Page size.
+        :param after: Values of keys of the last row of the previous page.
+        :param keys: Unique ordering columns, `(created_at, id)` by default.
+        :return: Paginated select statement.
+        """
+        keys = keys or (self.model.created_at, self.model.id)
+        if after is not None:
+            query = query.where(tuple_(*keys) < tuple_(*after))
+        return query.order_by(*(key.desc() for key in keys)).limit(limit)
+
+    @staticmethod
+    def _in_order(items: Sequence[Any], ids: Sequence[int], key: Callable[[Any], int]) -> list[Any]:
+        """
+        Orders items as ids, skipping ids without an item.
+
+        :param items: Items in any order.
+        :param ids: Ids in requested order.
+        :param key: Returns id of item.
+        :return: Ordered items.
+        """
+        by_id = {key(item): item for item in items}
+        return [by_id[id] for id in ids if id in by_id]
+
+    def _insert(self) -> postgresql.Insert | sqlite.Insert:
+        """
+        Returns dialect specific INSERT supporting `ON CONFLICT` clauses.
+
+        :return: Insert statement for the model table.
+        """
+        if self.session.bind.dialect.name == "sqlite":
+            return sqlite.insert(self.model)
+        return postgresql.insert(self.model)
+
+    async def commit(self) -> None:
+        """
+        Commits changes made through the session.
+        """
+        await commit(self.session)
+
+    async def _commit(self) -> None:
+        """
+        Commits changes of a single repository method,
+        deferred to the end of the unit of work if one is open.
+        """
+        if not in_unit_of_work(self.session):
+            await commit(self.session)
+
+    def unit_of_work(self) -> AbstractAsyncContextManager[AsyncSession]:
+        """
+        Opens unit of work on the session, see `db.session.unit_of_work`.
+
+        :return: Context manager committing once on exit.
+        """
+        return unit_of_work(self.session)
+
+    def use_primary(self) -> None:
+        """
+        Routes later reads of the session to the primary,
+        for reads that must not miss recent writes.
+        """
+        self.session.info[USE_PRIMARY] = True
+
+    async def _stream(self, query: Select, batch_size: int) -> AsyncIterator[list[Row]]:
+        """
+        Streams query result through a server-side cursor in batches,
+        so memory use does not grow with the size of the result.
+
+        :param query: Query to stream.
+        :param batch_size: Number of rows fetched at once.
+        :return: Async iterator of row batches.
+        """
+        result = await self.session.stream(query.execution_options(yield_per=batch_size))
+        async for batch in result.partitions():
+            yield batch
+
     async def get_all(self) -> list[T]:
         """
         Retrieves all objects from the database.
+        Loads the whole table, stream it for large tables.
 
         :return: A list of all objects of the model type.
         """
         result = await self.session.execute(select(self.model))
         return result.scalars().all()
 
+    async def get_many(self, ids: Sequence[int], columns: Optional[Sequence[Any]] = None) -> list[T] | list[Row]:
+        """
+        Retrieves objects by IDs in one `IN` query.
+
+        :param ids: The IDs of the objects to retrieve.
+        :param columns: Columns to project instead of loading objects, must include id.
+        :return: Found objects or rows in order of IDs, missing IDs are skipped.
+        """
+        if not ids:
+            return []
+        query = self._select(columns).where(self.model.id.in_(ids))
+        return self._in_order(await self._fetch(query, columns), ids, key=lambda item: item.id)
+
+    async def count(self, **kwargs: dict[str, Any]) -> int:
+        """
+        Counts objects matching the keyword arguments without loading them.
+
+        :param kwargs: The keyword arguments to use for filtering the objects.
+        :return: Number of matching objects.
+        """
+        query = select(func.count()).select_from(self.model).where(*self._filters(**kwargs))
+        result = await self.session.execute(query)
+        return result.scalar_one()
+
+    async def exists(self, **kwargs: dict[str, Any]) -> bool:
+        """
+        Checks if any object matches the keyword arguments, stopping at the first one.
+
+        :param kwargs: The keyword arguments to use for filtering the objects.
+        :return: True if a matching object exists.
+        """
+        query = select(exists().select_from(self.model).where(*self._filters(**kwargs)))
+        result = await self.session.execute(query)
+        return result.scalar_one()
+
     async def get_by_id(self, id: int) -> Optional[T]:
         """
         Retrieves an object by its ID.
@@ -42,14 +200,15 @@ class GenericRepo(Generic[T]):
     async def create(self, **kwargs: dict[str, Any]) -> T:
         """
         Creates a new object with the given keyword arguments.
+        Generated columns are fetched by `INSERT ... RETURNING`.
 
         :param kwargs: The keyword arguments to use for creating the object.
         :return: The newly created object.
         """
         obj = self.model(**kwargs)
         self.session.add(obj)
-        await self.session.commit()
-        await self.session.refresh(obj)
+        await self.session.flush()
+        await self._commit()
         return obj
 
     async def update(self, id: int, **kwargs: dict[str, Any]) -> None:
@@ -60,7 +219,27 @@ class GenericRepo(Generic[T]):
         :param kwargs: The keyword arguments to use for updating the object.
         """
         await self.session.execute(update(self.model).where(self.model.id == id).values(**kwargs))
-        await self.session.commit()
+        await self._commit()
+
+    async def bulk_create(self, rows: Sequence[dict[str, Any]]) -> None:
+        """
+        Inserts rows in one executemany `INSERT`, without loading objects.
+        Does not commit, so it can share a transaction with other changes.
+
+        :param rows: Column values of the rows.
+        """
+        if rows:
+            await self.session.execute(insert(self.model), rows)
+
+    async def bulk_update(self, rows: Sequence[dict[str, Any]]) -> None:
+        """
+        Updates rows by primary key in one executemany `UPDATE`.
+        Does not commit, so it can share a transaction with other changes.
+
+        :param rows: Column values of the rows, each including id.
+        """
+        if rows:
+            await self.session.execute(update(self.model), rows)
 
     async def delete(self, id: int) -> Optional[T]:
         """
@@ -72,20 +251,54 @@ class GenericRepo(Generic[T]):
         obj = await self.get_by_id(id)
         if obj:
             await self.session.delete(obj)
-            await self.session.commit()
+            await self._commit()
             return obj
 
-    async def filter(self, page: int = 1, per_page: int = 10, **kwargs: dict[str, Any]) -> list[T]:
+    async def filter(
+        self,
+        page: int = 1,
+        per_page: int = 10,
+        columns: Optional[Sequence[Any]] = None,
+        **kwargs: dict[str, Any],
+    ) -> list[T] | list[Row]:
         """
         Filters objects based on the given keyword arguments and paginate the result.
 
-        :param page: The page number to retrieve.
+        :param page: The page number to retrieve, starting from 1.
         :param per_page: The number of items per page.
+        :param columns: Columns to project instead of loading objects.
         :param kwargs: The keyword arguments to use for filtering the objects.
         :return: A list of objects that match the filter criteria.
+        :raises ValueError: If page is less than 1.
         """
-        offset = (page) * per_page
-        filters = [getattr(self.model, k) == v for k, v in kwargs.items()]
-        query = select(self.model).where(and_(*filters)).limit(per_page).offset(offset)
-        result = await self.session.execute(query)
-        return result.scalars().all()
+        if page < 1:
+            raise ValueError("Page numbers start from 1")
+        query = (
+            self._select(columns)
+            .where(*self._filters(**kwargs))
+            .order_by(self.model.id)
+            .limit(per_page)
+            .offset((page - 1) * per_page)
+        )
+        return await self._fetch(query, columns)
+
+    async def keyset(
+        self,
+        limit: int,
+        after: Optional[tuple[Any, ...]] = None,
+        columns: Optional[Sequence[Any]] = None,
+        **kwargs: dict[str, Any],
+    ) -> list[T] | list[Row]:
+        """
+        Filters objects based on the given keyword arguments, newest first,
+        using keyset pagination on `(created_at, id)`.
+
+        :param limit: The number of items per page.
+        :param after: `(created_at, id)` of the last object of the previous page.
+        :param columns: Columns to project instead of loading objects.
+        :param kwargs: The keyword arguments to use for filtering the objects.
+        :return: A list of objects that match the filter criteria.
+        """
+        query = self._select(columns).where(*self._filters(**kwargs))
+        query = self._keyset(query, limit, after)
+        return await self._fetch(query, columns)
@@ -1,8 +1,8 @@
 
-from typing import Annotated
+from typing import Annotated, AsyncIterator
 from fastapi import Depends
 
-from sqlalchemy import select, update, delete, and_
+from sqlalchemy import select, update, delete, func, Row
 from sqlalchemy.orm import selectinload
 from sqlalchemy.ext.asyncio import AsyncSession
 
@@ -17,26 +17,75 @@ class LikeRepo(GenericRepo[UserLike]):
         self.Model = UserLike
         super().__init__(session, self.Model)
 
-    async def create_like(self, post_id: int, user_id: int) -> UserLike:
+    async def bulk_create_likes(self, post_id: int, user_ids: list[int]) -> int:
         """
-        Create like for post.
+        Create likes for post in one `INSERT ... ON CONFLICT DO NOTHING` statement.
+        Does not commit, so it can share a transaction with the likes counter update.
 
         :param post_id: Post id.
-        :param user_id: User id.
-        :return: Like.
+        :param user_ids: Ids of users who liked post.
+        :return: Number of created likes, already existing ones are skipped.
         """
-        like = UserLike(post_id=post_id, user_id=user_id)
-        self.session.add(like)
-        await self.session.commit()
-        return like
+        if not user_ids:
+            return 0
+        stmt = (
+            self._insert()
+            .values([{"post_id": post_id, "user_id": user_id} for user_id in user_ids])
+            .on_conflict_do_nothing(index_elements=["user_id", "post_id"])
+            .returning(self.Model.id)
+        )
+        result = await self.session.execute(stmt)
+        return len(result.all())
 
-    async def get_all_likes_by_post(self, post_id: int) -> list[UserLike]:
+    async def bulk_delete_likes(self, post_id: int, user_ids: list[int]) -> int:
         """
-        Get all likes by post.
+        Delete likes of post in one statement.
+        Does not commit, so it can share a transaction with the likes counter update.
 
         :param post_id: Post id.
-        :return: List of likes.
+        :param user_ids: Ids of users who unliked post.
+        :return: Number of deleted likes, missing ones are skipped.
         """
-        query = select(self.Model).where(self.Model.post_id == post_id)
+        if not user_ids:
+            return 0
+        stmt = delete(self.Model).where(
+            self.Model.post_id == post_id,
+            self.Model.user_id.in_(user_ids),
+        )
+        result = await self.session.execute(stmt)
+        return result.rowcount
+
+    async def stream_rows(self, batch_size: int, **kwargs) -> AsyncIterator[list[Row]]:
+        """
+        Stream likes in batches, ordered by id.
+
+        :param batch_size: Number of rows fetched at once.
+        :param kwargs: Filter params.
+        :return: Async iterator of `(id, user_id, post_id, created_at)` row batches.
+        """
+        query = (
+            select(self.Model.id, self.Model.user_id, self.Model.post_id, self.Model.created_at)
+            .where(*self._filters(**kwargs))
+            .order_by(self.Model.id)
+        )
+        async for batch in self._stream(query, batch_size):
+            yield batch
+
+    async def count_by_posts(self, post_ids: list[int]) -> dict[int, int]:
+        """
+        Count likes of many posts in one query.
+
+        :param post_ids: Post ids.
+        :return: Mapping of post id to number of likes, 0 for posts without likes.
+        """
+        if not post_ids:
+            return {}
+        query = (
+            select(self.Model.post_id, func.count())
+            .where(self.Model.post_id.in_(post_ids))
+            .group_by(self.Model.post_id)
+        )
         result = await self.session.execute(query)
-        return result.scalars().all()
+        counts = dict.fromkeys(post_ids, 0)
+        counts.update({post_id: count for post_id, count in result.all()})
+        return counts
@@ -1,14 +1,15 @@
 
-from typing import Annotated
+from datetime import datetime
+from typing import Annotated, AsyncIterator, Optional
 from fastapi import Depends
 
-from sqlalchemy import select, update, delete, and_
+from sqlalchemy import select, update, delete, and_, or_, func, literal, tuple_, Float, Row, Select
 from sqlalchemy.orm import selectinload
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from repositories.generic import GenericRepo
 
-from db.models import Post
+from db.models import Post, User, UserLike
 from db.session import get_session
 
 
@@ -32,48 +33,201 @@ class PostRepo(GenericRepo[Post]):
         result = await self.session.execute(query)
         return result.scalar_one_or_none()
 
-    async def filter_with_author(self, page: int, limit: int, **kwargs) -> list[Post]:
+    async def get_existing_ids_liked_by(self, ids: list[int], user_id: int) -> dict[int, bool]:
         """
-        Filter posts with relation.
-    
-        :param page: Page of pagination.
-        :param limit: Limit for pagination page.
-        :param kwargs: Filter params.
-        :return: List of posts.
+        Get ids of existing posts with stored likes of user in one query.
+
+        :param ids: Post ids.
+        :param user_id: User id.
+        :return: Mapping of id of each existing post to whether user like of it is stored.
         """
-        filters = [getattr(self.model, k) == v for k, v in kwargs.items()]
-        query = (
-            select(self.Model)
-            .options(selectinload(Post.author))
-        )
-        if filters:
-            query = query.where(and_(*filters))
+        if not ids:
+            return {}
         query = (
-            query
-            .order_by(self.Model.created_at.desc())
-            .offset(page * limit)
-            .limit(limit)
+            select(self.Model.id, UserLike.id.is_not(None))
+            .outerjoin(UserLike, and_(UserLike.post_id == self.Model.id, UserLike.user_id == user_id))
+            .where(self.Model.id.in_(ids))
         )
         result = await self.session.execute(query)
-        return result.scalars().all()
+        return {post_id: liked for post_id, liked in result.all()}
 
-    async def paginate_with_author(self, page: int, limit: int) -> list[Post]:
+    def _feed_query(self, preview_length: Optional[int] = None) -> Select:
         """
-        Paginate posts with relation.
-    
-        :param page: Page of pagination.
-        :param limit: Limit for pagination page.
-        :return: List of posts.
+        Select only columns of feed items, with author joined in the same query.
+
+        :param preview_length: Truncate content to this number of characters.
+        :return: Query of feed rows.
         """
-        query = (
-            select(self.Model)
-            .options(selectinload(Post.author))
-            .order_by(self.Model.created_at.desc())
-            .offset(page * limit)
-            .limit(limit)
+        content = self.Model.content
+        if preview_length is not None:
+            content = func.substr(content, 1, preview_length)
+        return (
+            select(
+                self.Model.id,
+                self.Model.title,
+                content.label("content"),
+                self.Model.topic,
+                self.Model.likes,
+                self.Model.created_at,
+                self.Model.updated_at,
+                User.email.label("author_email"),
+                User.username.label("author_username"),
+                User.first_name.label("author_first_name"),
+                User.last_name.label("author_last_name"),
+            )
+            .join(User, self.Model.author_id == User.id)
         )
+
+    async def filter_feed_rows(
+        self,
+        limit: int,
+        page: Optional[int] = None,
+        after: Optional[tuple[datetime, int]] = None,
+        preview_length: Optional[int] = None,
+        **kwargs,
+    ) -> list[Row]:
+        """
+        Filter feed rows without loading ORM entities.
+
+        Pages are selected by offset `page` or, if it is None, by keyset `after`.
+
+        :param limit: Limit for pagination page.
+        :param page: Page of pagination.
+        :param after: `(created_at, id)` of the last post of the previous page.
+        :param preview_length: Truncate content to this number of characters.
+        :param kwargs: Filter params.
+        :return: List of feed rows.
+        """
+        query = self._feed_query(preview_length).where(*self._filters(**kwargs))
+        if page is not None:
+            query = self._keyset(query, limit).offset(page * limit)
+        else:
+            query = self._keyset(query, limit, after)
         result = await self.session.execute(query)
-        return result.scalars().all()
+        return result.all()
+
+    async def stream_feed_rows(self, batch_size: int, **kwargs) -> AsyncIterator[list[Row]]:
+        """
+        Stream feed rows of all posts in batches, ordered by id.
+
+        :param batch_size: Number of rows fetched at once.
+        :param kwargs: Filter params.
+        :return: Async iterator of row batches.
+        """
+        query = self._feed_query().where(*self._filters(**kwargs)).order_by(self.Model.id)
+        async for batch in self._stream(query, batch_size):
+            yield batch
+
+    async def get_many_feed_rows(self, ids: list[int]) -> list[Row]:
+        """
+        Get feed rows by ids in one query.
+
+        :param ids: Post ids.
+        :return: Rows of existing posts in order of ids.
+        """
+        if not ids:
+            return []
+        result = await self.session.execute(self._feed_query().where(self.Model.id.in_(ids)))
+        return self._in_order(result.all(), ids, key=lambda row: row.id)
+
+    async def get_feed_positions(
+        self,
+        topic: str,
+        limit: int,
+        since: Optional[tuple[datetime, int]] = None,
+    ) -> list[tuple[datetime, int]]:
+        """
+        Get `(created_at, id)` of newest posts of topic.
+
+        Served from `ix_posts_topic_created_at_id` index alone.
+
+        :param topic: Topic of posts.
+        :param limit: Maximum number of posts.
+        :param since: `(created_at, id)` of a post, only newer posts are returned.
+        :return: Positions of posts, newest first.
+        """
+        query = select(self.Model.created_at, self.Model.id).where(self.Model.topic == topic)
+        if since is not None:
+            query = query.where(tuple_(self.Model.created_at, self.Model.id) > tuple_(*since))
+        result = await self.session.execute(self._keyset(query, limit))
+        return [tuple(row) for row in result.all()]
+
+    async def get_author_feed_positions(
+        self,
+        author_ids: list[int],
+        limit: int,
+        after: Optional[tuple[datetime, int]] = None,
+        since: Optional[tuple[datetime, int]] = None,
+    ) -> list[tuple[datetime, int]]:
+        """
+        Get `(created_at, id)` of newest posts of authors.
+
+        Served from `ix_posts_author_id_created_at_id` index alone.
+
+        :param author_ids: Ids of authors.
+        :param limit: Maximum number of posts.
+        :param after: `(created_at, id)` of the last post of the previous page.
+        :param since: `(created_at, id)` of a post, only newer posts are returned.
+        :return: Positions of posts, newest first.
+        """
+        if not author_ids:
+            return []
+        query = select(self.Model.created_at, self.Model.id).where(self.Model.author_id.in_(author_ids))
+        if since is not None:
+            query = query.where(tuple_(self.Model.created_at, self.Model.id) > tuple_(*since))
+        result = await self.session.execute(self._keyset(query, limit, after))
+        return [tuple(row) for row in result.all()]
+
+    @staticmethod
+    def _substring_pattern(word: str) -> str:
+        """
+        Builds LIKE pattern matching word anywhere, with wildcards in word escaped by backslash.
+
+        :param word: Searched word.
+        :return: LIKE pattern.
+        """
+        escaped = word.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+        return f"%{escaped}%"
+
+    async def search_feed_rows(
+        self,
+        text: str,
+        limit: int,
+        after: Optional[tuple[float, int]] = None,
+        **kwargs,
+    ) -> list[Row]:
+        """
+        Full-text search of feed rows using keyset pagination, without loading ORM entities.
+
+        In Postgres posts are matched against `search_vector` through the
+        `ix_posts_search_vector` GIN index and ordered by `(rank, id)`
+        descending. Other databases fall back to case-insensitive substring
+        match of every word, with rank 0.
+
+        :param text: Search query, in web search syntax in Postgres.
+        :param limit: Limit for pagination page.
+        :param after: `(rank, id)` of the last post of the previous page.
+        :param kwargs: Filter params.
+        :return: List of feed rows with their `rank`.
+        """
+        filters = self._filters(**kwargs)
+        if self.session.bind.dialect.name == "postgresql":
+            ts_query = func.websearch_to_tsquery("english", text)
+            rank = func.ts_rank_cd(self.Model.search_vector, ts_query)
+            filters.append(self.Model.search_vector.op("@@")(ts_query))
+        else:
+            rank = literal(0.0, Float)
+            patterns = [self._substring_pattern(word) for word in text.split()]
+            filters.extend(
+                or_(
+                    self.Model.title.ilike(pattern, escape="\\"),
+                    self.Model.content.ilike(pattern, escape="\\"),
+                )
+                for pattern in patterns
+            )
+        query = self._feed_query().add_columns(rank.label("rank")).where(*filters)
+        result = await self.session.execute(self._keyset(query, limit, after, keys=(rank, self.Model.id)))
+        return result.all()
 
     async def update_post_if_author(self, post_id: int, user_id: int, **kwargs) -> bool:
         """
@@ -88,7 +242,7 @@ class PostRepo(GenericRepo[Post]):
         ).values(**kwargs)
 
         result = await self.session.execute(stmt)
-        await self.session.commit()
+        await self._commit()
 
         return result.rowcount > 0
 
@@ -105,18 +259,26 @@ class PostRepo(GenericRepo[Post]):
         )
 
         result = await self.session.execute(stmt)
-        await self.session.commit()
+        await self._commit()
 
         return result.rowcount > 0
 
-    async def set_likes(self, post_id: int, likes: int = 0) -> None:
+    async def increment_likes(self, post_id: int, delta: int) -> None:
         """
-        Add likes of post.
+        Increment likes counter of post, does not commit.
 
         :param post_id: Post id.
+        :param delta: Number of likes to add.
         """
         stmt = update(self.model).where(self.model.id == post_id).values(
-            likes=likes
+            likes=func.coalesce(self.model.likes, 0) + delta
         )
         await self.session.execute(stmt)
-        await self.session.commit()
+
+    async def set_likes_bulk(self, likes: dict[int, int]) -> None:
+        """
+        Set likes counters of many posts in one executemany, does not commit.
+
+        :param likes: Mapping of post id to number of likes.
+        """
+        await self.bulk_update([{"id": post_id, "likes": count} for post_id, count in likes.items()])
@@ -1,44 +1,474 @@
 import ujson
 
-from typing import Annotated
+from datetime import datetime, timedelta
+from typing import Annotated, Optional
 from fastapi import Depends
 
-from core.cache import MapCacher
+from core.cache import CacheStats, DecayedSortedSetCacher, LexSortedSetCacher, SetCacher, ValueCacher
+from core.settings import get_settings
+
+
+settings = get_settings()
 
 
 class PostLikesCacheRepo:
-    TABLE_NAME = "post_likes"
+    """
+    Write-behind cache of likes changes.
+
+    Pending likes and unlikes of a post are kept in two sets, a user is in
+    at most one of them, so the latest action of the user wins on sync.
+    Net pending change of each post is kept in `DELTA_KEY` hash, so live
+    likes counters are read without touching the sets.
+    """
+    KEY_PREFIX = "post_likes"
+    UNLIKES_KEY_PREFIX = "post_unlikes"
+    DIRTY_KEY = "post_likes:dirty"
+    DUE_KEY = "post_likes:due"
+    DELTA_KEY = "post_likes:delta"
+    TOUCHED_KEY = "post_likes:touched"
 
-    def __init__(self, cacher: Annotated[MapCacher, Depends()]) -> None:
+    def __init__(self, cacher: Annotated[SetCacher, Depends()]) -> None:
         self.cacher = cacher
 
-    async def _get_post_data(self, post_id: int) -> list[str]:
-        """ Returns post data """
-        result = await self.cacher.get_row(self.TABLE_NAME, str(post_id))
-        return ujson.loads(result)
+    def _key(self, post_id: int) -> str:
+        """ Returns key of pending post likes set """
+        return f"{self.KEY_PREFIX}:{post_id}"
+
+    def _unlikes_key(self, post_id: int) -> str:
+        """ Returns key of pending post unlikes set """
+        return f"{self.UNLIKES_KEY_PREFIX}:{post_id}"
+
+    async def get_pending(self, post_id: int) -> tuple[list[int], list[int]]:
+        """
+        Returns pending changes of post likes
+
+        :param post_id: Post id
+        :return: Ids of users who liked post and ids of users who unliked it
+        """
+        likes, unlikes = await self.cacher.get_members_many(
+            self._key(post_id),
+            self._unlikes_key(post_id),
+        )
+        return [int(user_id) for user_id in likes], [int(user_id) for user_id in unlikes]
+
+    async def remove_pending(self, post_id: int, likes: list[int], unlikes: list[int]) -> None:
+        """ Removes synced changes from cache, keeping changes made meanwhile """
+        await self.cacher.remove_members_many({
+            self._key(post_id): list(map(str, likes)),
+            self._unlikes_key(post_id): list(map(str, unlikes)),
+        })
+        await self.reset_deltas(post_id)
+
+    async def reset_deltas(self, *post_ids: int) -> None:
+        """ Recomputes net pending changes of posts from pending sets """
+        await self.cacher.reset_counters(self.DELTA_KEY, [
+            (self._key(post_id), self._unlikes_key(post_id), str(post_id), 1)
+            for post_id in post_ids
+        ])
 
-    async def clear_cache(self, post_id: int) -> None:
-        """ Clears cache """
-        await self.cacher.set_row(self.TABLE_NAME, str(post_id), "[]")
+    async def get_deltas(self, post_ids: list[int]) -> dict[int, int]:
+        """
+        Returns net pending changes of posts likes in one round trip
 
-    async def get_likes_by_post(self, post_id: int) -> list[int]:
-        """ Returns list of likes by post id """
-        result = await self._get_post_data(post_id)
-        return [int(user_id) for user_id in result]
+        :param post_ids: Post ids
+        :return: Mapping of post id to number of pending likes minus pending unlikes
+        """
+        deltas = await self.cacher.get_counters(self.DELTA_KEY, *map(str, post_ids))
+        return dict(zip(post_ids, deltas))
 
-    async def like_post(self, post_id: int, user_id: int) -> bool:
+    async def like_post(self, post_id: int, user_id: int, persisted: bool = False) -> tuple[bool, int]:
         """ 
-        Likes post 
+        Likes post, cancelling pending unlike of the user
         
         :param post_id: Post id
         :param user_id: User id
-        :return: True if post was liked, False if post was already liked
+        :param persisted: True if like of the user is stored, so it is only
+            restored by cancelling pending unlike instead of liking again
+        :return: True if post was liked, False if post was already liked,
+            and number of pending changes of post
+        """
+        return await self.cacher.move_member(
+            self._key(post_id),
+            self._unlikes_key(post_id),
+            str(user_id),
+            str(post_id),
+            tracking=self.DIRTY_KEY,
+            counters=self.DELTA_KEY,
+            add=not persisted,
+        )
+
+    async def unlike_post(self, post_id: int, user_id: int, persisted: bool = True) -> tuple[bool, int]:
+        """
+        Unlikes post, cancelling pending like of the user
+
+        :param post_id: Post id
+        :param user_id: User id
+        :param persisted: False if like of the user is not stored, so there
+            is nothing to unlike but its pending like
+        :return: True if post was unliked, False if post was already unliked,
+            and number of pending changes of post
+        """
+        return await self.cacher.move_member(
+            self._unlikes_key(post_id),
+            self._key(post_id),
+            str(user_id),
+            str(post_id),
+            step=-1,
+            tracking=self.DIRTY_KEY,
+            counters=self.DELTA_KEY,
+            add=persisted,
+        )
+
+    async def like_posts(
+        self,
+        post_ids: list[int],
+        user_id: int,
+        persisted: set[int] = frozenset(),
+    ) -> list[tuple[bool, int]]:
+        """
+        Likes many posts in one round trip, see `like_post`
+
+        :param post_ids: Post ids
+        :param user_id: User id
+        :param persisted: Ids of posts with stored like of the user
+        :return: For each post, whether it was liked and number of its pending changes
+        """
+        return await self.cacher.move_member_many(
+            [
+                (
+                    self._key(post_id), self._unlikes_key(post_id), str(user_id), str(post_id),
+                    1, post_id not in persisted,
+                )
+                for post_id in post_ids
+            ],
+            tracking=self.DIRTY_KEY,
+            counters=self.DELTA_KEY,
+        )
+
+    async def mark_dirty(self, *post_ids: int) -> None:
+        """ Queues posts for the next flush """
+        await self.cacher.add_members(self.DIRTY_KEY, *map(str, post_ids))
+
+    async def mark_due(self, *post_ids: int) -> None:
+        """ Queues posts for flush without waiting for the flush interval """
+        await self.cacher.add_members(self.DUE_KEY, *map(str, post_ids))
+
+    async def mark_touched(self, *post_ids: int) -> None:
+        """ Queues posts for likes counter reconciliation """
+        await self.cacher.add_members(self.TOUCHED_KEY, *map(str, post_ids))
+
+    async def pop_touched_posts(self, count: int) -> list[int]:
+        """ Removes and returns up to `count` posts due for reconciliation """
+        result = await self.cacher.pop_members(self.TOUCHED_KEY, count)
+        return [int(post_id) for post_id in result]
+
+    async def pop_dirty_posts(self, count: int) -> list[int]:
+        """ Removes and returns up to `count` posts with unsynced likes """
+        result = await self.cacher.pop_members(self.DIRTY_KEY, count)
+        return [int(post_id) for post_id in result]
+
+    async def pop_due_posts(self, count: int) -> list[int]:
+        """ Removes and returns up to `count` posts due for flush """
+        result = await self.cacher.pop_members(self.DUE_KEY, count)
+        return [int(post_id) for post_id in result]
+
+    async def get_backlog(self) -> tuple[int, int]:
+        """
+        Returns backlog depth
+
+        :return: Number of dirty posts and number of posts due for flush
+        """
+        dirty, due = await self.cacher.sizes(self.DIRTY_KEY, self.DUE_KEY)
+        return dirty, due
+
+
+post_cache_stats = {
+    "post": CacheStats(),
+    "feed": CacheStats(),
+}
+
+
+class PostCacheRepo:
+    """ Read-through cache of serialized posts and feed pages """
+    POST_KEY_PREFIX = "posts:item"
+    FEED_KEY_PREFIX = "posts:feed"
+    FEED_INDEX_PREFIX = "posts:feed_keys"
+    FILL_LOCK_PREFIX = "posts:fill_lock"
+
+    def __init__(self, cacher: Annotated[ValueCacher, Depends()]) -> None:
+        self.cacher = cacher
+
+    def _post_key(self, post_id: int) -> str:
+        """ Returns key of serialized post """
+        return f"{self.POST_KEY_PREFIX}:{post_id}"
+
+    def _feed_scope(self, topic: Optional[str]) -> str:
+        """ Returns scope of feed, all posts or single topic """
+        return "all" if topic is None else f"topic:{topic}"
+
+    def _feed_key(self, topic: Optional[str], position: str, limit: int) -> str:
+        """ Returns key of serialized feed page """
+        return f"{self.FEED_KEY_PREFIX}:{self._feed_scope(topic)}:{position}:{limit}"
+
+    async def get_post(self, post_id: int, track: bool = True) -> Optional[dict]:
+        """ Returns None on cache miss, `track` counts the lookup in hit/miss stats """
+        result = await self.cacher.get(self._post_key(post_id))
+        if track:
+            post_cache_stats["post"].record(result is not None)
+        return ujson.loads(result) if result is not None else None
+
+    async def get_posts(self, post_ids: list[int]) -> list[Optional[dict]]:
+        """ Returns posts in one round trip, None on cache miss """
+        result = await self.cacher.get_many(*map(self._post_key, post_ids))
+        for payload in result:
+            post_cache_stats["post"].record(payload is not None)
+        return [ujson.loads(payload) if payload is not None else None for payload in result]
+
+    async def set_post(self, post_id: int, payload: str) -> None:
+        """ Caches serialized post """
+        await self.cacher.set(self._post_key(post_id), payload, ttl=settings.POST_CACHE_TTL)
+
+    async def set_posts(self, payloads: dict[int, str]) -> None:
+        """ Caches serialized posts in one round trip """
+        await self.cacher.set_many(
+            {self._post_key(post_id): payload for post_id, payload in payloads.items()},
+            ttl=settings.POST_CACHE_TTL,
+        )
+
+    async def get_feed(
+        self,
+        topic: Optional[str],
+        position: str,
+        limit: int,
+        track: bool = True,
+    ) -> Optional[dict]:
+        """ Returns None on cache miss, `track` counts the lookup in hit/miss stats """
+        result = await self.cacher.get(self._feed_key(topic, position, limit))
+        if track:
+            post_cache_stats["feed"].record(result is not None)
+        return ujson.loads(result) if result is not None else None
+
+    async def set_feed(self, topic: Optional[str], position: str, limit: int, payload: str) -> None:
+        """ Caches serialized feed page """
+        await self.cacher.set_tracked(
+            self._feed_key(topic, position, limit),
+            payload,
+            ttl=settings.FEED_CACHE_TTL,
+            index=f"{self.FEED_INDEX_PREFIX}:{self._feed_scope(topic)}",
+        )
+
+    async def acquire_fill_lock(self, name: str) -> Optional[str]:
+        """ Takes cross-worker lock for filling cache entry, None if another worker fills it """
+        return await self.cacher.acquire_lock(
+            f"{self.FILL_LOCK_PREFIX}:{name}",
+            ttl_ms=settings.CACHE_FILL_LOCK_TTL_MS,
+        )
+
+    async def is_fill_locked(self, name: str) -> bool:
+        """ Returns True while another worker fills cache entry """
+        return await self.cacher.exists(f"{self.FILL_LOCK_PREFIX}:{name}")
+
+    async def release_fill_lock(self, name: str, token: str) -> None:
+        """ Releases cache fill lock taken with token """
+        await self.cacher.release_lock(f"{self.FILL_LOCK_PREFIX}:{name}", token)
+
+    async def invalidate_posts(self, *post_ids: int) -> None:
+        """ Drops cached posts """
+        await self.cacher.delete(*map(self._post_key, post_ids))
+
+    async def invalidate_feeds(self, *topics: Optional[str]) -> None:
+        """ Drops cached pages of the all-posts feed and of the given topics feeds """
+        scopes = {self._feed_scope(None)}
+        scopes.update(self._feed_scope(topic) for topic in topics if topic is not None)
+        await self.cacher.delete_tracked(*(f"{self.FEED_INDEX_PREFIX}:{scope}" for scope in scopes))
+
+
+class PositionFeedCacheRepo:
+    """
+    Precomputed feeds of post ids.
+
+    Each feed holds up to `MAX_SIZE` newest posts as members encoding
+    `(created_at, id)`, so feed pages are member ranges ordered the same
+    way as keyset pagination in the database.
+    """
+    KEY_PREFIX: str
+    MAX_SIZE: int
+    TTL: int
+    EPOCH = datetime(1970, 1, 1)
+
+    def __init__(self, cacher: Annotated[LexSortedSetCacher, Depends()]) -> None:
+        self.cacher = cacher
+
+    def _key(self, owner: str | int) -> str:
+        """ Returns key of feed """
+        return f"{self.KEY_PREFIX}:{owner}"
+
+    def encode(self, created_at: datetime, post_id: int) -> str:
+        """ Encodes feed position into member sorting as `(created_at, id)` """
+        microseconds = (created_at - self.EPOCH) // timedelta(microseconds=1)
+        return f"{microseconds:017d}:{post_id:012d}"
+
+    def decode(self, member: str) -> tuple[datetime, int]:
+        """ Decodes member into `(created_at, id)` feed position """
+        microseconds, post_id = member.split(":")
+        return self.EPOCH + timedelta(microseconds=int(microseconds)), int(post_id)
+
+    async def get_page(
+        self,
+        owner: str | int,
+        after: Optional[tuple[datetime, int]],
+        limit: int,
+    ) -> list[tuple[datetime, int]]:
+        """ Returns feed positions after `after`, newest first """
+        before = self.encode(*after) if after is not None else None
+        members = await self.cacher.range_before(self._key(owner), before, limit)
+        return [self.decode(member) for member in members]
+
+    async def size(self, owner: str | int) -> int:
+        """ Returns number of posts in feed, 0 if feed is not built """
+        return await self.cacher.size(self._key(owner))
+
+    async def replace(self, owner: str | int, positions: list[tuple[datetime, int]]) -> None:
+        """ Builds feed from `(created_at, id)` positions """
+        await self.cacher.replace(
+            self._key(owner),
+            [self.encode(*position) for position in positions],
+            ttl=self.TTL,
+        )
+
+    async def add_post(self, owner: str | int, created_at: datetime, post_id: int) -> None:
+        """ Adds post to feed if feed is built """
+        await self.add_posts(owner, [(created_at, post_id)])
+
+    async def add_posts(self, owner: str | int, positions: list[tuple[datetime, int]]) -> None:
+        """ Adds posts at `(created_at, id)` positions to feed if feed is built """
+        await self.cacher.add_if_exists(
+            self._key(owner),
+            self.MAX_SIZE,
+            *(self.encode(*position) for position in positions),
+        )
+
+    async def invalidate(self, owner: str | int) -> None:
+        """
+        Drops feed, it is rebuilt on the next read
+
+        Removing single posts from a trimmed feed would make it look shorter
+        than its source, so older posts would not be served.
+        """
+        await self.cacher.delete(self._key(owner))
+
+
+class TopicFeedCacheRepo(PositionFeedCacheRepo):
+    """ Precomputed per-topic feeds of newest posts of topic """
+    KEY_PREFIX = "posts:topic_feed"
+    MAX_SIZE = settings.TOPIC_FEED_MAX_SIZE
+    TTL = settings.TOPIC_FEED_TTL
+
+
+class TimelineCacheRepo(PositionFeedCacheRepo):
+    """
+    Precomputed home timelines of newest posts of followed authors,
+    filled on write by fanning new posts out to followers.
+    """
+    KEY_PREFIX = "posts:timeline"
+    FAN_OUT_KEY = "posts:timeline:fan_out"
+    MAX_SIZE = settings.TIMELINE_MAX_SIZE
+    TTL = settings.TIMELINE_TTL
+
+    def __init__(
+        self,
+        cacher: Annotated[LexSortedSetCacher, Depends()],
+        queue_cacher: Annotated[SetCacher, Depends()],
+    ) -> None:
+        super().__init__(cacher)
+        self.queue_cacher = queue_cacher
+
+    async def add_post_many(self, user_ids: list[int], created_at: datetime, post_id: int) -> None:
+        """ Adds post to built timelines of users in one round trip """
+        await self.cacher.add_if_exists_many(
+            [self._key(user_id) for user_id in user_ids],
+            self.MAX_SIZE,
+            self.encode(created_at, post_id),
+        )
+
+    async def invalidate_many(self, user_ids: list[int]) -> None:
+        """ Drops timelines of users, they are rebuilt on the next read """
+        await self.cacher.delete(*(self._key(user_id) for user_id in user_ids))
+
+    async def queue_fan_out(self, *post_ids: int) -> None:
+        """ Queues posts to be pushed into timelines of followers of their authors """
+        await self.queue_cacher.add_members(self.FAN_OUT_KEY, *map(str, post_ids))
+
+    async def pop_fan_out(self, count: int) -> list[int]:
+        """ Removes and returns up to `count` posts queued for fan-out """
+        result = await self.queue_cacher.pop_members(self.FAN_OUT_KEY, count)
+        return [int(post_id) for post_id in result]
+
+
+class TrendingCacheRepo:
+    """
+    Trending rankings of posts, overall and optionally per topic.
+
+    Posts are scored by likes and creation weights decaying by half
+    every `TRENDING_HALF_LIFE` seconds. Rankings keep `TRENDING_MAX_SIZE`
+    best posts, trimmed by `rebase`.
+    """
+    KEY_PREFIX = "posts:trending"
+    BASES_KEY = "posts:trending:bases"
+    TOPICS_KEY = "posts:trending:topics"
+
+    def __init__(
+        self,
+        cacher: Annotated[DecayedSortedSetCacher, Depends()],
+        topics_cacher: Annotated[SetCacher, Depends()],
+    ) -> None:
+        self.cacher = cacher
+        self.topics_cacher = topics_cacher
+
+    def _key(self, topic: Optional[str]) -> str:
+        """ Returns key of overall ranking or of topic ranking """
+        return f"{self.KEY_PREFIX}:all" if topic is None else f"{self.KEY_PREFIX}:topic:{topic}"
+
+    def _keys(self, topic: Optional[str]) -> list[str]:
+        """ Returns keys of rankings post of topic is in """
+        return [self._key(None)] if topic is None else [self._key(None), self._key(topic)]
+
+    async def add_posts(self, posts: list[tuple[int, Optional[str]]], weight: float) -> None:
+        """
+        Adds weight to scores of posts in one round trip
+
+        :param posts: Post ids with topics of posts to rank in topic rankings too
+        :param weight: Weight of like or creation, negative to take it back
+        """
+        await self.cacher.add_many(
+            self.BASES_KEY,
+            [(self._keys(topic), str(post_id)) for post_id, topic in posts],
+            weight,
+            settings.TRENDING_HALF_LIFE,
+        )
+        topics = {topic for _, topic in posts if topic is not None}
+        if topics:
+            await self.topics_cacher.add_members(self.TOPICS_KEY, *topics)
+
+    async def remove_post(self, post_id: int, topic: Optional[str], overall: bool = True) -> None:
+        """ Removes post from topic ranking and, if `overall`, from overall ranking """
+        keys = self._keys(topic) if overall else [self._key(topic)]
+        await self.cacher.remove(keys, str(post_id))
+
+    async def get_top(self, topic: Optional[str], limit: int) -> list[int]:
+        """ Returns ids of up to `limit` best ranked posts """
+        return [int(post_id) for post_id in await self.cacher.top(self._key(topic), limit)]
+
+    async def rebase(self) -> int:
         """
-        likes_str = await self._get_post_data(post_id)
-        likes = [int(user_id) for user_id in likes_str]
+        Rescales scores of all rankings to the current time and trims them
 
-        if user_id in likes:
-            return False
-        likes.append(user_id)
-        await self.cacher.set_row(self.TABLE_NAME, str(post_id), ujson.dumps(likes))
-        return True
+        Returns:
+            int: Number of posts in overall ranking
+        """
+        args = (settings.TRENDING_HALF_LIFE, settings.TRENDING_MAX_SIZE, settings.TRENDING_MIN_SCORE)
+        size = await self.cacher.rebase(self.BASES_KEY, self._key(None), *args)
+        for topic in await self.topics_cacher.get_members(self.TOPICS_KEY):
+            if not await self.cacher.rebase(self.BASES_KEY, self._key(topic), *args):
+                await self.topics_cacher.remove_members(self.TOPICS_KEY, topic)
+        return size
@@ -1,8 +1,7 @@
-
-from typing import Annotated
+from typing import Annotated, Optional
 from fastapi import Depends
 
-from sqlalchemy import select
+from sqlalchemy import select, update
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from repositories.generic import GenericRepo
@@ -20,3 +19,20 @@ class UserRepo(GenericRepo[User]):
     async def get_by_username(self, username: str) -> User:
         result = await self.session.execute(select(self.Model).where(self.Model.username == username))
         return result.scalar_one_or_none()
+
+    async def increment_followers(self, user_id: int, delta: int) -> Optional[int]:
+        """
+        Increment followers counter of user, does not commit.
+
+        :param user_id: User id.
+        :param delta: Number of followers to add.
+        :return: Number of followers after the change, None if user does not exist.
+        """
+        stmt = (
+            update(self.Model)
+            .where(self.Model.id == user_id)
+            .values(followers_count=self.Model.followers_count + delta)
+            .returning(self.Model.followers_count)
+        )
+        result = await self.session.execute(stmt)
+        return result.scalar_one_or_none()
@@ -0,0 +1,106 @@
+import ujson
+
+from typing import Annotated, Optional
+from fastapi import Depends
+
+from core.cache import ValueCacher, LocalTTLCache
+from core.settings import get_settings
+
+from schemas.user import UserPrincipal
+
+
+settings = get_settings()
+
+local_principals = LocalTTLCache(
+    maxsize=settings.USER_CACHE_LOCAL_SIZE,
+    ttl=settings.USER_CACHE_LOCAL_TTL,
+)
+
+
+class UserPrincipalCacheRepo:
+    """
+    Two-tier cache of authenticated users: in-process LRU in front of Redis.
+
+    `invalidate` drops the Redis entries and the LRU entries of the calling
+    worker only, so other workers serve a changed principal for up to
+    `USER_CACHE_LOCAL_TTL` seconds.
+    """
+    KEY_PREFIX = "users:principal"
+
+    def __init__(self, cacher: Annotated[ValueCacher, Depends()]) -> None:
+        self.cacher = cacher
+        self.local = local_principals
+
+    def _keys(self, username: str, user_id: Optional[int] = None) -> list[str]:
+        """ Returns keys of principal, by id for tokens carrying it and by username """
+        keys = [f"{self.KEY_PREFIX}:username:{username}"]
+        if user_id is not None:
+            keys.insert(0, f"{self.KEY_PREFIX}:id:{user_id}")
+        return keys
+
+    async def get(self, username: str, user_id: Optional[int] = None) -> Optional[UserPrincipal]:
+        """ Returns None if principal is not cached """
+        key = self._keys(username, user_id)[0]
+        principal = self.local.get(key)
+        if principal is not None:
+            return principal
+
+        result = await self.cacher.get(key)
+        if result is None:
+            return None
+        principal = UserPrincipal(**ujson.loads(result))
+        self.local.set(key, principal)
+        return principal
+
+    async def set(self, principal: UserPrincipal) -> None:
+        """ Caches principal under both its id and username keys """
+        keys = self._keys(principal.username, principal.id)
+        for key in keys:
+            self.local.set(key, principal)
+        value = principal.json()
+        await self.cacher.set_many(dict.fromkeys(keys, value), ttl=settings.USER_CACHE_TTL)
+
+    async def invalidate(self, username: str, user_id: Optional[int] = None) -> None:
+        """ Drops cached principal, called by `UserService.update_user` """
+        keys = self._keys(username, user_id)
+        for key in keys:
+            self.local.delete(key)
+        await self.cacher.delete(*keys)
+
+
+class RefreshTokenCacheRepo:
+    """
+    Allowlist of unused refresh tokens by their `jti` claim.
+
+    A refresh token is valid only while its id is listed, so it can be used
+    once and revoked before it expires.
+    """
+    KEY_PREFIX = "auth:refresh"
+
+    def __init__(self, cacher: Annotated[ValueCacher, Depends()]) -> None:
+        self.cacher = cacher
+
+    def _key(self, jti: str) -> str:
+        return f"{self.KEY_PREFIX}:{jti}"
+
+    def _user_key(self, user_id: int) -> str:
+        return f"{self.KEY_PREFIX}:user:{user_id}"
+
+    async def add(self, jti: str, user_id: int) -> None:
+        """ Lists issued refresh token until it expires """
+        await self.cacher.set_tracked(
+            self._key(jti), str(user_id), settings.JWT_REFRESH_TOKEN_TTL, self._user_key(user_id),
+        )
+
+    async def consume(self, jti: str) -> Optional[int]:
+        """ Unlists refresh token, returns id of its user or None if it was not listed """
+        user_id = await self.cacher.pop(self._key(jti))
+        return int(user_id) if user_id is not None else None
+
+    async def revoke(self, jti: str) -> None:
+        """ Unlists refresh token """
+        await self.cacher.delete(self._key(jti))
+
+    async def revoke_user(self, user_id: int) -> None:
+        """ Unlists all refresh tokens of user """
+        await self.cacher.delete_tracked(self._user_key(user_id))
@@ -2,9 +2,11 @@
 from .auth import auth_router
 from .user import user_router
 from .post import posts_router
+from .system import system_router
 
 __all__ = [
     'auth_router',
     'user_router',
     'posts_router',
+    'system_router',
 ]
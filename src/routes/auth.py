@@ -4,7 +4,7 @@ from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordRequestForm
 
 from services.user import UserService
-from schemas.auth import Token
+from schemas.auth import Token, TokenRefresh
 
 
 auth_router = APIRouter(
@@ -25,6 +25,35 @@ async def auth_user(
             headers={'WWW-Authenticate': 'Bearer'},
         )
 
-    token = UserService.create_access_token(user.username)
+    token = await user_service.create_access_token(user.username, user.id)
 
     return token
+
+
+@auth_router.post('/token/refresh', response_model=Token)
+async def refresh_token(
+    token_data: TokenRefresh,
+    user_service: Annotated[UserService, Depends()]
+) -> Token:
+    token = await user_service.refresh_access_token(token_data.refresh_token)
+    if not token:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail='Invalid refresh token',
+            headers={'WWW-Authenticate': 'Bearer'},
+        )
+    return token
+
+
+@auth_router.post('/token/revoke', status_code=status.HTTP_204_NO_CONTENT)
+async def revoke_token(
+    token_data: TokenRefresh,
+    user_service: Annotated[UserService, Depends()]
+) -> None:
+    result = await user_service.revoke_refresh_token(token_data.refresh_token)
+    if not result:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail='Invalid refresh token',
+            headers={'WWW-Authenticate': 'Bearer'},
+        )
@@ -1,13 +1,19 @@
 
 from typing import Annotated, Optional
 from fastapi import APIRouter, Depends, Query, HTTPException, status
+from fastapi.responses import StreamingResponse, UJSONResponse
 
-from db.models import User
-from schemas.post import PostCreate, PostOut, PostUpdate
+from schemas.post import (
+    PostCreate, PostOut, PostPage, PostUpdate,
+    PostLikeBatch, PostLikeBatchOut, PostLikeResult,
+)
 from schemas.base import ResponseDetails
+from schemas.user import UserPrincipal
 from dependencies.user import get_user_by_token
-from repositories.post import PostRepo
+from core.pagination import clamp_limit
+from services.export import ExportService
 from services.post import PostService
+from services.timeline import TimelineService
 
 
 posts_router = APIRouter(
@@ -18,26 +24,124 @@ posts_router = APIRouter(
 
 @posts_router.get('/posts', response_model=list[PostOut])
 async def get_posts(
-    post_repo: Annotated[PostRepo, Depends()],
+    post_service: Annotated[PostService, Depends()],
     topic: Optional[str] = Query(None, min_length=1, max_length=50, description='Topic of post'),
-    page: int = Query(0, description='Page of pagination'),
-    limit: int = Query(100, description='Limit for pagination page'),
-) -> list[PostOut]:
+    page: int = Query(0, ge=0, description='Page of pagination (use /posts/feed to paginate by cursor)'),
+    limit: int = Query(100, ge=1, description='Limit for pagination page, capped at the server maximum'),
+    preview_length: Optional[int] = Query(None, ge=1, description='Truncate content of posts to this length'),
+) -> UJSONResponse:
     """ Get all posts """
-    filters = {}
-    if topic:
-        filters = {'topic': topic}
-    result = await post_repo.filter_with_author(page, limit, **filters)
-    return result
+    feed = await post_service.get_feed(
+        clamp_limit(limit),
+        topic=topic,
+        page=page,
+        preview_length=preview_length,
+    )
+    # Items are built from rows in PostOut shape, so validation is skipped
+    return UJSONResponse(feed['items'])
+
+
+@posts_router.get('/posts/feed', response_model=PostPage)
+async def get_posts_feed(
+    post_service: Annotated[PostService, Depends()],
+    topic: Optional[str] = Query(None, min_length=1, max_length=50, description='Topic of post'),
+    cursor: Optional[str] = Query(None, description='Cursor of the page, `next_cursor` of the previous response'),
+    limit: int = Query(100, ge=1, description='Limit for pagination page, capped at the server maximum'),
+    preview_length: Optional[int] = Query(None, ge=1, description='Truncate content of posts to this length'),
+) -> UJSONResponse:
+    """ Get all posts, newest first, paginated by cursor """
+    try:
+        feed = await post_service.get_feed(
+            clamp_limit(limit),
+            topic=topic,
+            cursor=cursor,
+            preview_length=preview_length,
+        )
+    except ValueError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail='Invalid cursor',
+        )
+    # Items are built from rows in PostOut shape, so validation is skipped
+    return UJSONResponse(feed)
+
+
+@posts_router.get('/timeline', response_model=PostPage)
+async def get_timeline(
+    user: Annotated[UserPrincipal, Depends(get_user_by_token)],
+    timeline_service: Annotated[TimelineService, Depends()],
+    cursor: Optional[str] = Query(None, description='Cursor of the page, `next_cursor` of the previous response'),
+    limit: int = Query(20, ge=1, description='Limit for pagination page, capped at the server maximum'),
+) -> UJSONResponse:
+    """ Get posts of followed users, newest first """
+    try:
+        timeline = await timeline_service.get_timeline(user.id, clamp_limit(limit), cursor=cursor)
+    except ValueError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail='Invalid cursor',
+        )
+    # Items are cached dicts in PostOut shape, so validation is skipped
+    return UJSONResponse(timeline)
+
+
+@posts_router.get('/posts/search', response_model=PostPage)
+async def search_posts(
+    post_service: Annotated[PostService, Depends()],
+    q: str = Query(..., min_length=1, max_length=200, description='Keywords to search in title and content'),
+    topic: Optional[str] = Query(None, min_length=1, max_length=50, description='Topic of post'),
+    cursor: Optional[str] = Query(None, description='Cursor of the page, `next_cursor` of the previous response'),
+    limit: int = Query(20, ge=1, description='Limit for pagination page, capped at the server maximum'),
+) -> PostPage:
+    """ Search posts, best matches first """
+    try:
+        return await post_service.search_posts(q, clamp_limit(limit), topic=topic, cursor=cursor)
+    except ValueError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail='Invalid cursor',
+        )
+
+
+@posts_router.get('/posts/trending', response_model=PostPage)
+async def get_trending_posts(
+    post_service: Annotated[PostService, Depends()],
+    topic: Optional[str] = Query(None, min_length=1, max_length=50, description='Topic of post, if topic rankings are enabled'),
+    limit: int = Query(20, ge=1, description='Number of posts, capped at the server maximum'),
+) -> UJSONResponse:
+    """ Get posts trending by recent likes, best first """
+    trending = await post_service.get_trending(clamp_limit(limit), topic=topic)
+    # Items are cached dicts in PostOut shape, so validation is skipped
+    return UJSONResponse(trending)
+
+
+@posts_router.get('/posts/export', response_class=StreamingResponse)
+async def export_posts(
+    user: Annotated[UserPrincipal, Depends(get_user_by_token)],
+    export_service: Annotated[ExportService, Depends()],
+    topic: Optional[str] = Query(None, min_length=1, max_length=50, description='Topic of post'),
+) -> StreamingResponse:
+    """ Export all posts as NDJSON """
+    return StreamingResponse(export_service.export_posts(topic), media_type='application/x-ndjson')
+
+
+@posts_router.get('/likes/export', response_class=StreamingResponse)
+async def export_likes(
+    user: Annotated[UserPrincipal, Depends(get_user_by_token)],
+    export_service: Annotated[ExportService, Depends()],
+    post_id: Optional[int] = Query(None, description='Export likes of this post only'),
+) -> StreamingResponse:
+    """ Export likes of the current user as NDJSON """
+    return StreamingResponse(export_service.export_likes(user.id, post_id), media_type='application/x-ndjson')
 
 
 @posts_router.get('/posts/{post_id}', response_model=PostOut)
 async def get_post(
     post_id: int, 
-    post_repo: Annotated[PostRepo, Depends()],
+    post_service: Annotated[PostService, Depends()],
 ) -> PostOut:
     """ Get post by id """
-    post = await post_repo.get_by_id_with_author(post_id)
+    post = await post_service.get_post(post_id)
     if not post:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -50,7 +154,7 @@ async def get_post(
 async def create_post(
     post: PostCreate,
     post_service: Annotated[PostService, Depends()],
-    user: Annotated[User, Depends(get_user_by_token)],
+    user: Annotated[UserPrincipal, Depends(get_user_by_token)],
 ) -> PostOut:
     """ Create post """
     post = await post_service.create_post(post, user.id)
@@ -60,11 +164,11 @@ async def create_post(
 @posts_router.put('/posts', response_model=ResponseDetails)
 async def update_post(
     post: PostUpdate,
-    user: Annotated[User, Depends(get_user_by_token)],
-    post_repo: Annotated[PostRepo, Depends()],
+    user: Annotated[UserPrincipal, Depends(get_user_by_token)],
+    post_service: Annotated[PostService, Depends()],
 ) -> ResponseDetails:
     """ Update post """
-    result = await post_repo.update_post_if_author(post.id, user.id, **post.dict())
+    result = await post_service.update_post(post, user.id)
     if not result:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -79,11 +183,11 @@ async def update_post(
 @posts_router.delete('/posts/{post_id}', status_code=status.HTTP_204_NO_CONTENT)
 async def delete_post(
     post_id: int,
-    user: Annotated[User, Depends(get_user_by_token)],
-    post_repo: Annotated[PostRepo, Depends()],
+    user: Annotated[UserPrincipal, Depends(get_user_by_token)],
+    post_service: Annotated[PostService, Depends()],
 ) -> None:
     """ Delete post """
-    result = await post_repo.delete_post_if_author(post_id, user.id)
+    result = await post_service.delete_post(post_id, user.id)
     if not result:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -94,12 +198,49 @@ async def delete_post(
 @posts_router.post('/posts/{post_id}/like', response_model=ResponseDetails)
 async def like_post(
     post_id: int,
-    user: Annotated[User, Depends(get_user_by_token)],
+    user: Annotated[UserPrincipal, Depends(get_user_by_token)],
     post_service: Annotated[PostService, Depends()],
 ) -> ResponseDetails:
     """ Like post """
-    await post_service.like_post(post_id, user.id)
+    result = await post_service.like_post(post_id, user.id)
+    if not result:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail='Post not found',
+        )
     return ResponseDetails(
         success=True,
         details='Post liked successfully',
     )
+
+
+@posts_router.delete('/posts/{post_id}/like', response_model=ResponseDetails)
+async def unlike_post(
+    post_id: int,
+    user: Annotated[UserPrincipal, Depends(get_user_by_token)],
+    post_service: Annotated[PostService, Depends()],
+) -> ResponseDetails:
+    """ Unlike post """
+    result = await post_service.unlike_post(post_id, user.id)
+    if not result:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail='Post not found',
+        )
+    return ResponseDetails(
+        success=True,
+        details='Post unliked successfully',
+    )
+
+
+@posts_router.post('/posts/likes', response_model=PostLikeBatchOut)
+async def like_posts(
+    likes: PostLikeBatch,
+    user: Annotated[UserPrincipal, Depends(get_user_by_token)],
+    post_service: Annotated[PostService, Depends()],
+) -> PostLikeBatchOut:
+    """ Like many posts at once, e.g. to replay likes queued offline """
+    results = await post_service.like_posts(likes.post_ids, user.id)
+    return PostLikeBatchOut(
+        results=[PostLikeResult(post_id=post_id, status=status) for post_id, status in results],
+    )
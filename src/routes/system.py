@@ -0,0 +1,38 @@
+
+from fastapi import APIRouter
+
+from core.cache import get_pool_stats as get_redis_pool_stats
+from db.session import get_pool_stats as get_db_pool_stats
+from repositories.post_cache import post_cache_stats
+from schemas.system import CacheStatsOut, LikesFlusherStats, PoolStats
+from services.like_flusher import likes_flusher
+
+
+system_router = APIRouter(
+    prefix='/system',
+    tags=['system'],
+)
+
+
+@system_router.get('/likes-flusher', response_model=LikesFlusherStats)
+async def get_likes_flusher_stats() -> LikesFlusherStats:
+    """ Get likes flusher backlog and counters """
+    return await likes_flusher.get_stats()
+
+
+@system_router.get('/cache', response_model=dict[str, CacheStatsOut])
+async def get_cache_stats() -> dict[str, CacheStatsOut]:
+    """ Get read-through caches hit and miss counters of this worker """
+    return {
+        name: CacheStatsOut(hits=stats.hits, misses=stats.misses, hit_ratio=stats.hit_ratio)
+        for name, stats in post_cache_stats.items()
+    }
+
+
+@system_router.get('/pools', response_model=PoolStats)
+async def get_pools_stats() -> PoolStats:
+    """ Get database and Redis connection pools usage of this worker """
+    return PoolStats(
+        database=get_db_pool_stats(),
+        redis=get_redis_pool_stats(),
+    )
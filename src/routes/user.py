@@ -2,8 +2,11 @@
 from typing import Annotated
 from fastapi import APIRouter, Depends, HTTPException, status
 
+from dependencies.user import get_user_by_token
+from services.timeline import TimelineService
 from services.user import UserService
-from schemas.user import UserSignUp, UserOut
+from schemas.base import ResponseDetails
+from schemas.user import UserSignUp, UserOut, UserPrincipal
 
 
 user_router = APIRouter(
@@ -19,3 +22,44 @@ async def create_user(
     """ Create user """
     user = await user_service.create_user(user_data)
     return user
+
+
+@user_router.post('/users/{user_id}/follow', response_model=ResponseDetails)
+async def follow_user(
+    user_id: int,
+    user: Annotated[UserPrincipal, Depends(get_user_by_token)],
+    timeline_service: Annotated[TimelineService, Depends()],
+) -> ResponseDetails:
+    """ Follow user, their new posts appear in your timeline """
+    if user_id == user.id:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail='You can not follow yourself',
+        )
+    if not await timeline_service.follow(user.id, user_id):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail='User not found',
+        )
+    return ResponseDetails(
+        success=True,
+        details='User followed successfully',
+    )
+
+
+@user_router.delete('/users/{user_id}/follow', response_model=ResponseDetails)
+async def unfollow_user(
+    user_id: int,
+    user: Annotated[UserPrincipal, Depends(get_user_by_token)],
+    timeline_service: Annotated[TimelineService, Depends()],
+) -> ResponseDetails:
+    """ Unfollow user """
+    if not await timeline_service.unfollow(user.id, user_id):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail='User is not followed',
+        )
+    return ResponseDetails(
+        success=True,
+        details='User unfollowed successfully',
+    )
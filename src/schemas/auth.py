@@ -1,4 +1,5 @@
 
+from typing import Optional
 from pydantic import BaseModel, Field
 
 
@@ -6,3 +7,10 @@ class Token(BaseModel):
     """ Token schema to return to the user. """
     access_token: str = Field(..., example='eyJhbGciOiJIUzI1NiIsInR5cCI6IkpXVCJ9.eyJ1c2VyX2lkIjoyLC')
     token_type: str = Field('bearer', example='bearer')
+    expires_in: Optional[int] = Field(None, description='Access token lifetime in seconds', example=3600)
+    refresh_token: Optional[str] = Field(None, example='eyJhbGciOiJIUzI1NiIsInR5cCI6IkpXVCJ9.eyJ0eXBlIjoicmVmcmVzaCJ9')
+
+
+class TokenRefresh(BaseModel):
+    """ Refresh token schema to exchange for a new token pair. """
+    refresh_token: str = Field(..., example='eyJhbGciOiJIUzI1NiIsInR5cCI6IkpXVCJ9.eyJ0eXBlIjoicmVmcmVzaCJ9')
@@ -1,11 +1,17 @@
 
+from enum import Enum
 from typing import Optional
 from pydantic import BaseModel, Field
 
+from core.settings import get_settings
+
 from .base import BaseNetworkModel
 from .user import UserOut
 
 
+settings = get_settings()
+
+
 class BasePost(BaseModel):
     """ Base post schema. """
     title: str = Field(..., example='My Post', max_length=50)
@@ -30,3 +36,36 @@ class PostOut(BasePost, BaseNetworkModel):
 
     class Config:
         orm_mode = True
+
+
+class PostPage(BaseModel):
+    """ Page of posts with cursor to the next one. """
+    items: list[PostOut] = Field(..., description="Posts of the page")
+    next_cursor: Optional[str] = Field(None, description="Cursor of the next page, null on the last page")
+
+
+class PostLikeBatch(BaseModel):
+    """ Batch of posts liked by the user. """
+    post_ids: list[int] = Field(
+        ...,
+        example=[1, 2, 3],
+        min_items=1,
+        max_items=settings.LIKES_BATCH_MAX_SIZE,
+    )
+
+
+class LikeStatus(str, Enum):
+    liked = 'liked'
+    already_liked = 'already_liked'
+    not_found = 'not_found'
+
+
+class PostLikeResult(BaseModel):
+    """ Result of liking a single post of the batch. """
+    post_id: int = Field(..., example=1)
+    status: LikeStatus = Field(..., example=LikeStatus.liked)
+
+
+class PostLikeBatchOut(BaseModel):
+    """ Results of the likes batch in request order. """
+    results: list[PostLikeResult]
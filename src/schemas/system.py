@@ -0,0 +1,50 @@
+
+from typing import Optional
+from datetime import datetime
+from pydantic import BaseModel, Field
+
+
+class LikesFlusherStats(BaseModel):
+    """ Likes write-behind flusher state. """
+    running: bool = Field(..., example=True)
+    backlog_posts: int = Field(..., description="Posts with unsynced cached likes", example=12)
+    due_posts: int = Field(..., description="Posts over the cache threshold waiting for flush", example=0)
+    flushed_posts: int = Field(..., example=340)
+    flushed_likes: int = Field(..., example=5120)
+    failed_posts: int = Field(..., example=0)
+    last_flush_at: Optional[datetime] = Field(None, example='2021-01-01 00:00:00')
+    last_flush_seconds: Optional[float] = Field(None, example=0.042)
+    reconciled_posts: int = Field(..., description="Posts with likes counters recounted", example=80)
+    last_reconcile_at: Optional[datetime] = Field(None, example='2021-01-01 00:00:00')
+    trending_posts: int = Field(..., description="Posts in overall trending ranking after the last rebase", example=1000)
+    last_trending_rebase_at: Optional[datetime] = Field(None, example='2021-01-01 00:00:00')
+    fanned_out_posts: int = Field(..., description="New posts pushed into timelines of followers", example=25)
+
+
+class CacheStatsOut(BaseModel):
+    """ Cache hit and miss counters of the worker. """
+    hits: int = Field(..., example=990)
+    misses: int = Field(..., example=10)
+    hit_ratio: float = Field(..., example=0.99)
+
+
+class DatabasePoolStats(BaseModel):
+    """ Database connection pool usage of the worker. """
+    size: int = Field(..., example=5)
+    max_overflow: int = Field(..., example=10)
+    checked_in: int = Field(..., description="Idle connections", example=4)
+    checked_out: int = Field(..., description="Connections in use", example=1)
+    overflow: int = Field(..., description="Connections opened over pool size, negative while pool is not full", example=-4)
+
+
+class RedisPoolStats(BaseModel):
+    """ Redis connection pool usage of the worker. """
+    max_connections: int = Field(..., example=50)
+    in_use: int = Field(..., example=2)
+    available: int = Field(..., example=3)
+
+
+class PoolStats(BaseModel):
+    """ Connection pools usage of the worker. """
+    database: DatabasePoolStats
+    redis: RedisPoolStats
@@ -21,3 +21,12 @@ class UserOut(UserBase):
 
     class Config:
         orm_mode = True
+
+
+class UserPrincipal(UserBase):
+    """ Authenticated user, cached between requests. """
+    id: int = Field(..., example=1)
+    is_active: bool = Field(True, example=True)
+
+    class Config:
+        orm_mode = True
@@ -0,0 +1,53 @@
+import ujson
+
+from typing import AsyncIterator, Optional
+
+from core.settings import get_settings
+from db.session import get_sessionmaker
+
+from repositories.like import LikeRepo
+from repositories.post import PostRepo
+
+from services.post import PostService
+
+
+settings = get_settings()
+
+
+class ExportService:
+    """
+    Bulk exports as NDJSON, one JSON object per line.
+
+    Rows are streamed from a server-side cursor and sent in batches of
+    `EXPORT_BATCH_SIZE`, so memory use stays flat for any export size.
+    Exports open their own session, as they outlive the request handler,
+    and read from a replica if any is configured, without read-your-writes.
+    """
+
+    async def export_posts(self, topic: Optional[str] = None) -> AsyncIterator[str]:
+        """ Stream posts in `PostOut` shape, ordered by id """
+        filters = {'topic': topic} if topic else {}
+        async with get_sessionmaker()() as session:
+            batches = PostRepo(session).stream_feed_rows(settings.EXPORT_BATCH_SIZE, **filters)
+            async for batch in batches:
+                yield "".join(
+                    ujson.dumps(PostService.serialize_feed_row(row)) + "\n" for row in batch
+                )
+
+    async def export_likes(self, user_id: int, post_id: Optional[int] = None) -> AsyncIterator[str]:
+        """ Stream persisted likes of user, ordered by id """
+        filters = {'user_id': user_id}
+        if post_id is not None:
+            filters['post_id'] = post_id
+        async with get_sessionmaker()() as session:
+            batches = LikeRepo(session).stream_rows(settings.EXPORT_BATCH_SIZE, **filters)
+            async for batch in batches:
+                yield "".join(
+                    ujson.dumps({
+                        'id': row.id,
+                        'user_id': row.user_id,
+                        'post_id': row.post_id,
+                        'created_at': row.created_at.isoformat(),
+                    }) + "\n"
+                    for row in batch
+                )
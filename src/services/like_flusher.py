@@ -0,0 +1,275 @@
+import asyncio
+import logging
+import time
+
+from datetime import datetime
+from typing import Optional
+
+from core.cache import DecayedSortedSetCacher, LexSortedSetCacher, SetCacher
+from core.metrics import LIKES_FLUSH_DURATION, LIKES_SYNC_BATCH_SIZE
+from core.settings import get_settings
+from db.session import get_sessionmaker
+
+from repositories.post_cache import PostLikesCacheRepo, TimelineCacheRepo, TrendingCacheRepo
+
+from schemas.system import LikesFlusherStats
+from services.post import build_post_service
+
+
+settings = get_settings()
+
+logger = logging.getLogger(__name__)
+
+
+class LikesFlusher:
+    """
+    Write-behind worker persisting cached likes off the request path.
+
+    Every poll it checks the backlog: posts over `POST_LIKES_CACHE_THRESHOLD`
+    are flushed at once, the rest of dirty posts are drained when the backlog
+    reaches `LIKES_FLUSH_BATCH_SIZE` or `LIKES_FLUSH_INTERVAL` has passed.
+    Every `LIKES_RECONCILE_INTERVAL` likes counters of flushed posts are
+    recounted from stored likes, repairing drift of counters, and every
+    `TRENDING_REBASE_INTERVAL` trending rankings are rebased and trimmed.
+    New posts queued by `PostService.create_post` are fanned out into
+    timelines of followers every poll. `flush_likes` and `fan_out_posts`
+    turn off either part, so timelines are built with likes flushing off.
+    Dirty and queued posts are popped atomically, so several workers can run it at once.
+    """
+
+    def __init__(
+        self,
+        interval: float = settings.LIKES_FLUSH_INTERVAL,
+        poll_interval: float = settings.LIKES_FLUSH_POLL_INTERVAL,
+        batch_size: int = settings.LIKES_FLUSH_BATCH_SIZE,
+        reconcile_interval: float = settings.LIKES_RECONCILE_INTERVAL,
+        trending_interval: float = settings.TRENDING_REBASE_INTERVAL,
+        flush_likes: bool = settings.LIKES_FLUSH_ENABLED,
+        fan_out_posts: bool = settings.TIMELINE_FANOUT_ENABLED,
+    ) -> None:
+        self.interval = interval
+        self.poll_interval = poll_interval
+        self.batch_size = batch_size
+        self.reconcile_interval = reconcile_interval
+        self.trending_interval = trending_interval
+        self.flush_likes = flush_likes
+        self.fan_out_posts = fan_out_posts
+        self.likes_cache = PostLikesCacheRepo(SetCacher())
+        self.timelines = TimelineCacheRepo(LexSortedSetCacher(), SetCacher())
+        self.trending = TrendingCacheRepo(DecayedSortedSetCacher(), SetCacher())
+
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = asyncio.Event()
+        self._last_flush = time.monotonic()
+        self._last_reconcile = time.monotonic()
+        self._last_rebase = time.monotonic()
+
+        self.flushed_posts = 0
+        self.flushed_likes = 0
+        self.failed_posts = 0
+        self.last_flush_at: Optional[datetime] = None
+        self.last_flush_seconds: Optional[float] = None
+        self.reconciled_posts = 0
+        self.last_reconcile_at: Optional[datetime] = None
+        self.trending_posts = 0
+        self.last_trending_rebase_at: Optional[datetime] = None
+        self.fanned_out_posts = 0
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self) -> None:
+        """ Starts flusher task in the running event loop """
+        if self.running:
+            return
+        self._stopping = asyncio.Event()
+        self._last_flush = time.monotonic()
+        self._last_reconcile = time.monotonic()
+        self._last_rebase = time.monotonic()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """ Stops flusher, flushing the remaining backlog """
+        if not self.running:
+            return
+        self._stopping.set()
+        await self._task
+        self._task = None
+
+    async def _run(self) -> None:
+        while not self._stopping.is_set():
+            try:
+                await asyncio.wait_for(self._stopping.wait(), timeout=self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+            else:
+                break
+            try:
+                await self._tick()
+            except Exception:
+                logger.exception("Likes flush failed")
+
+        if not self.flush_likes:
+            return
+        try:
+            await self.flush()
+        except Exception:
+            logger.exception("Likes flush on shutdown failed")
+
+    async def _tick(self) -> None:
+        if self.flush_likes:
+            await self._flush_backlog()
+
+        if self.fan_out_posts:
+            await self.fan_out()
+
+        if time.monotonic() - self._last_reconcile >= self.reconcile_interval:
+            await self.reconcile()
+
+        if time.monotonic() - self._last_rebase >= self.trending_interval:
+            await self.rebase_trending()
+
+    async def _flush_backlog(self) -> None:
+        dirty, due = await self.likes_cache.get_backlog()
+        if due:
+            post_ids = await self.likes_cache.pop_due_posts(self.batch_size)
+            _, failed = await self._flush_posts(post_ids)
+            await self.likes_cache.mark_dirty(*failed)
+
+        elapsed = time.monotonic() - self._last_flush
+        if dirty >= self.batch_size or (dirty and elapsed >= self.interval):
+            await self.flush()
+
+    async def flush(self) -> int:
+        """
+        Drains all dirty posts
+
+        Returns:
+            int: Number of flushed likes
+        """
+        started = time.monotonic()
+        flushed = 0
+        retry = []
+        while True:
+            post_ids = await self.likes_cache.pop_dirty_posts(self.batch_size)
+            if not post_ids:
+                break
+            likes, failed = await self._flush_posts(post_ids)
+            flushed += likes
+            retry.extend(failed)
+        # Failed posts are retried on the next flush, not in this drain loop
+        await self.likes_cache.mark_dirty(*retry)
+
+        self._last_flush = time.monotonic()
+        self.last_flush_at = datetime.utcnow()
+        self.last_flush_seconds = self._last_flush - started
+        LIKES_FLUSH_DURATION.observe(self.last_flush_seconds)
+        return flushed
+
+    async def reconcile(self) -> int:
+        """
+        Recounts likes counters of posts flushed since the last reconciliation
+
+        Returns:
+            int: Number of reconciled posts
+        """
+        reconciled = 0
+        while True:
+            post_ids = await self.likes_cache.pop_touched_posts(self.batch_size)
+            if not post_ids:
+                break
+            try:
+                async with get_sessionmaker()() as session:
+                    await build_post_service(session).recount_likes(post_ids)
+            except Exception:
+                logger.exception("Failed to reconcile likes of posts %s", post_ids)
+                await self.likes_cache.mark_touched(*post_ids)
+                break
+            reconciled += len(post_ids)
+
+        self._last_reconcile = time.monotonic()
+        self.reconciled_posts += reconciled
+        self.last_reconcile_at = datetime.utcnow()
+        return reconciled
+
+    async def fan_out(self) -> int:
+        """
+        Pushes queued posts into timelines of followers of their authors
+
+        Returns:
+            int: Number of fanned out posts
+        """
+        fanned_out = 0
+        retry = []
+        while True:
+            post_ids = await self.timelines.pop_fan_out(self.batch_size)
+            if not post_ids:
+                break
+            for post_id in post_ids:
+                try:
+                    async with get_sessionmaker()() as session:
+                        await build_post_service(session).fan_out(post_id)
+                except Exception:
+                    logger.exception("Failed to fan out post %s", post_id)
+                    retry.append(post_id)
+                    continue
+                fanned_out += 1
+        # Failed posts are retried on the next poll, not in this drain loop
+        await self.timelines.queue_fan_out(*retry)
+
+        self.fanned_out_posts += fanned_out
+        return fanned_out
+
+    async def rebase_trending(self) -> int:
+        """
+        Rescales trending scores to the current time and trims rankings
+
+        Returns:
+            int: Number of posts in overall trending ranking
+        """
+        self.trending_posts = await self.trending.rebase()
+        self._last_rebase = time.monotonic()
+        self.last_trending_rebase_at = datetime.utcnow()
+        return self.trending_posts
+
+    async def _flush_posts(self, post_ids: list[int]) -> tuple[int, list[int]]:
+        flushed = 0
+        failed = []
+        for post_id in post_ids:
+            try:
+                async with get_sessionmaker()() as session:
+                    likes = await build_post_service(session).sync_likes(post_id)
+            except Exception:
+                logger.exception("Failed to flush likes of post %s", post_id)
+                self.failed_posts += 1
+                failed.append(post_id)
+                continue
+            if likes:
+                LIKES_SYNC_BATCH_SIZE.observe(likes)
+                self.flushed_posts += 1
+                self.flushed_likes += likes
+                flushed += likes
+        return flushed, failed
+
+    async def get_stats(self) -> LikesFlusherStats:
+        """ Returns flusher counters and current backlog depth """
+        dirty, due = await self.likes_cache.get_backlog()
+        return LikesFlusherStats(
+            running=self.running,
+            backlog_posts=dirty,
+            due_posts=due,
+            flushed_posts=self.flushed_posts,
+            flushed_likes=self.flushed_likes,
+            failed_posts=self.failed_posts,
+            last_flush_at=self.last_flush_at,
+            last_flush_seconds=self.last_flush_seconds,
+            reconciled_posts=self.reconciled_posts,
+            last_reconcile_at=self.last_reconcile_at,
+            trending_posts=self.trending_posts,
+            last_trending_rebase_at=self.last_trending_rebase_at,
+            fanned_out_posts=self.fanned_out_posts,
+        )
+
+
+likes_flusher = LikesFlusher()
@@ -1,19 +1,34 @@
+import asyncio
+import ujson
 
-from typing import Annotated
+from datetime import datetime
+from functools import partial
+from typing import Annotated, Awaitable, Callable, Optional
 from fastapi import Depends
+from sqlalchemy import Row
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from db.models import Post
+from core.cache import DecayedSortedSetCacher, LexSortedSetCacher, SetCacher, ValueCacher
+from core.pagination import encode_cursor, decode_cursor, encode_position_cursor, decode_position_cursor
 from core.settings import get_settings
+from core.singleflight import SingleFlight
 
 from repositories.post import PostRepo
-from repositories.post_cache import PostLikesCacheRepo
+from repositories.post_cache import (
+    PostLikesCacheRepo, PostCacheRepo, TimelineCacheRepo, TopicFeedCacheRepo, TrendingCacheRepo,
+)
 from repositories.like import LikeRepo
+from repositories.follow import FollowRepo
 
-from schemas.post import PostCreate, PostUpdate
+from schemas.post import LikeStatus, PostCreate, PostOut, PostUpdate
 
 
 settings = get_settings()
 
+# Coalesces identical post and feed cache misses of this worker
+post_reads = SingleFlight()
+
 
 class PostService:
     def __init__(
@@ -21,10 +36,335 @@ class PostService:
         post_repo: Annotated[PostRepo, Depends()],
         post_likes_cache_repo: Annotated[PostLikesCacheRepo, Depends()],
         like_repo: Annotated[LikeRepo, Depends()],
+        post_cache_repo: Annotated[PostCacheRepo, Depends()],
+        topic_feed_cache_repo: Annotated[TopicFeedCacheRepo, Depends()],
+        follow_repo: Annotated[FollowRepo, Depends()],
+        timeline_cache_repo: Annotated[TimelineCacheRepo, Depends()],
+        trending_cache_repo: Annotated[TrendingCacheRepo, Depends()],
     ) -> None:
         self.post_repo = post_repo
         self.likes_cache = post_likes_cache_repo
         self.like_repo = like_repo
+        self.posts_cache = post_cache_repo
+        self.topic_feeds = topic_feed_cache_repo
+        self.follow_repo = follow_repo
+        self.timelines = timeline_cache_repo
+        self.trending = trending_cache_repo
+
+    @staticmethod
+    def _encode_cursor(posts: list[Post], limit: int) -> Optional[str]:
+        """ Encodes cursor pointing after the last post, None on the last page """
+        if not posts or len(posts) < limit:
+            return None
+        last = posts[-1]
+        return encode_position_cursor(last.created_at, last.id)
+
+    @staticmethod
+    def serialize_feed_row(row: Row) -> dict:
+        """ Builds JSON-ready `PostOut` dict straight from feed row, skipping validation """
+        return {
+            'id': row.id,
+            'title': row.title,
+            'content': row.content,
+            'topic': row.topic,
+            'likes': row.likes,
+            'created_at': row.created_at.isoformat(),
+            'updated_at': row.updated_at.isoformat(),
+            'author': {
+                'email': row.author_email,
+                'username': row.author_username,
+                'first_name': row.author_first_name,
+                'last_name': row.author_last_name,
+            },
+        }
+
+    @staticmethod
+    def _decode_search_cursor(cursor: str) -> tuple[float, int]:
+        """ Decodes `(rank, id)` keyset position, raises ValueError if invalid """
+        try:
+            payload = decode_cursor(cursor)
+            return float(payload['rank']), int(payload['id'])
+        except (KeyError, TypeError) as exc:
+            raise ValueError("Invalid cursor") from exc
+
+    async def _fill_once(
+        self,
+        name: str,
+        get_cached: Callable[[], Awaitable[Optional[dict]]],
+        load: Callable[[], Awaitable[Optional[dict]]],
+    ) -> Optional[dict]:
+        """
+        Fill cache miss once across workers
+
+        The worker taking the fill lock queries the database, the others
+        poll the cache until it is filled or the lock is released.
+        """
+        token = await self.posts_cache.acquire_fill_lock(name)
+        if token is not None:
+            try:
+                return await load()
+            finally:
+                await self.posts_cache.release_fill_lock(name, token)
+
+        poll_interval = settings.CACHE_FILL_POLL_MS / 1000
+        for _ in range(settings.CACHE_FILL_LOCK_TTL_MS // settings.CACHE_FILL_POLL_MS):
+            await asyncio.sleep(poll_interval)
+            cached = await get_cached()
+            if cached is not None:
+                return cached
+            if not await self.posts_cache.is_fill_locked(name):
+                break
+        return await load()
+
+    async def _load_post(self, post_id: int) -> Optional[dict]:
+        """ Load post from database into cache """
+        # Cache is shared by all readers, so it is filled from the primary:
+        # a lagging replica would cache a post just updated or deleted
+        self.post_repo.use_primary()
+        post = await self.post_repo.get_by_id_with_author(post_id)
+        if post is None:
+            return None
+        post_out = PostOut.from_orm(post)
+        await self.posts_cache.set_post(post_id, post_out.json())
+        return post_out.dict()
+
+    async def _with_live_likes(self, items: list[dict]) -> list[dict]:
+        """
+        Merge pending likes changes into likes counters of posts
+
+        Cached posts are shared between callers, so updated copies are returned.
+        """
+        deltas = await self.likes_cache.get_deltas([item['id'] for item in items])
+        return [
+            {**item, 'likes': max(item['likes'] + deltas[item['id']], 0)}
+            if deltas[item['id']] else item
+            for item in items
+        ]
+
+    async def get_post(self, post_id: int) -> Optional[dict]:
+        """ Get post with live likes counter """
+        post = await self._get_post(post_id)
+        if post is None:
+            return None
+        [post] = await self._with_live_likes([post])
+        return post
+
+    async def _get_post(self, post_id: int) -> Optional[dict]:
+        """ Get post, served from cache when possible """
+        cached = await self.posts_cache.get_post(post_id)
+        if cached is not None:
+            return cached
+
+        name = f"post:{post_id}"
+        return await post_reads.do(name, partial(
+            self._fill_once,
+            name,
+            partial(self.posts_cache.get_post, post_id, track=False),
+            partial(self._load_post, post_id),
+        ))
+
+    async def _load_feed(
+        self,
+        limit: int,
+        topic: Optional[str],
+        position: str,
+        after: Optional[tuple[datetime, int]],
+        page: Optional[int],
+        preview_length: Optional[int],
+    ) -> dict:
+        """ Load feed page from database into cache """
+        # Filled from the primary, see `_load_post`
+        self.post_repo.use_primary()
+        filters = {'topic': topic} if topic else {}
+        rows = await self.post_repo.filter_feed_rows(
+            limit,
+            page=page,
+            after=after,
+            preview_length=preview_length,
+            **filters,
+        )
+        feed = {
+            'items': [self.serialize_feed_row(row) for row in rows],
+            'next_cursor': self._encode_cursor(rows, limit),
+        }
+        await self.posts_cache.set_feed(topic, position, limit, ujson.dumps(feed))
+        return feed
+
+    async def get_feed(
+        self,
+        limit: int,
+        topic: Optional[str] = None,
+        cursor: Optional[str] = None,
+        page: Optional[int] = None,
+        preview_length: Optional[int] = None,
+    ) -> dict:
+        """
+        Get page of posts feed with live likes counters
+
+        Items are JSON-ready dicts, `preview_length` truncates their content.
+        """
+        feed = await self._get_feed(limit, topic, cursor, page, preview_length)
+        return {**feed, 'items': await self._with_live_likes(feed['items'])}
+
+    async def _get_feed(
+        self,
+        limit: int,
+        topic: Optional[str] = None,
+        cursor: Optional[str] = None,
+        page: Optional[int] = None,
+        preview_length: Optional[int] = None,
+    ) -> dict:
+        """
+        Get page of posts feed, served from cache when possible
+
+        Pages are selected by cursor, `page` is kept for offset pagination
+        compatibility. Raises ValueError if cursor is invalid.
+        """
+        after = None
+        if page is not None and cursor is None:
+            position = f"page:{page}"
+        elif cursor:
+            page = None
+            after = decode_position_cursor(cursor)
+            position = f"after:{after[0].isoformat()}:{after[1]}"
+        else:
+            position = "first"
+        if preview_length is not None:
+            position = f"{position}:preview:{preview_length}"
+
+        if topic and page is None and settings.TOPIC_FEEDS_ENABLED:
+            feed = await self._get_topic_feed(limit, topic, after, preview_length)
+            if feed is not None:
+                return feed
+
+        cached = await self.posts_cache.get_feed(topic, position, limit)
+        if cached is not None:
+            return cached
+
+        name = f"feed:{self.posts_cache._feed_scope(topic)}:{position}:{limit}"
+        return await post_reads.do(name, partial(
+            self._fill_once,
+            name,
+            partial(self.posts_cache.get_feed, topic, position, limit, track=False),
+            partial(self._load_feed, limit, topic, position, after, page, preview_length),
+        ))
+
+    async def _hydrate_posts(self, post_ids: list[int]) -> list[dict]:
+        """ Get posts by ids from cache, loading misses with one query """
+        cached = await self.posts_cache.get_posts(post_ids)
+        missing = [post_id for post_id, post in zip(post_ids, cached) if post is None]
+        loaded = {}
+        if missing:
+            # Filled from the primary, see `_load_post`
+            self.post_repo.use_primary()
+            rows = await self.post_repo.get_many_feed_rows(missing)
+            loaded = {row.id: self.serialize_feed_row(row) for row in rows}
+            await self.posts_cache.set_posts({
+                post_id: ujson.dumps(post) for post_id, post in loaded.items()
+            })
+        # Posts deleted meanwhile are skipped
+        return [
+            post if post is not None else loaded[post_id]
+            for post_id, post in zip(post_ids, cached)
+            if post is not None or post_id in loaded
+        ]
+
+    async def get_posts(self, post_ids: list[int]) -> list[dict]:
+        """ Get posts by ids in the given order with live likes counters, skipping deleted ones """
+        return await self._with_live_likes(await self._hydrate_posts(post_ids))
+
+    async def _build_topic_feed(self, topic: str) -> list[tuple[datetime, int]]:
+        """ Build precomputed topic feed from database """
+        # Filled from the primary, see `_load_post`
+        self.post_repo.use_primary()
+        positions = await self.post_repo.get_feed_positions(topic, settings.TOPIC_FEED_MAX_SIZE)
+        await self.topic_feeds.replace(topic, positions)
+        if positions:
+            # Posts created while the feed was built skipped it, as it did not exist yet
+            newer = await self.post_repo.get_feed_positions(
+                topic, settings.TOPIC_FEED_MAX_SIZE, since=positions[0],
+            )
+            if newer:
+                await self.topic_feeds.add_posts(topic, newer)
+                positions = (newer + positions)[:settings.TOPIC_FEED_MAX_SIZE]
+        return positions
+
+    async def _get_topic_feed(
+        self,
+        limit: int,
+        topic: str,
+        after: Optional[tuple[datetime, int]],
+        preview_length: Optional[int] = None,
+    ) -> Optional[dict]:
+        """
+        Get topic feed page as range of precomputed feed and hydrate its posts
+
+        Returns None if page reaches past the oldest post kept in precomputed feed.
+        """
+        size = await self.topic_feeds.size(topic)
+        if size:
+            positions = await self.topic_feeds.get_page(topic, after, limit)
+        else:
+            built = await post_reads.do(f"topic_feed:{topic}", partial(self._build_topic_feed, topic))
+            size = len(built)
+            positions = [position for position in built if after is None or position < after][:limit]
+        if len(positions) < limit and size >= settings.TOPIC_FEED_MAX_SIZE:
+            return None
+
+        next_cursor = None
+        if positions and len(positions) == limit:
+            next_cursor = encode_position_cursor(*positions[-1])
+        items = await self._hydrate_posts([post_id for _, post_id in positions])
+        if preview_length is not None:
+            items = [{**item, 'content': item['content'][:preview_length]} for item in items]
+        return {'items': items, 'next_cursor': next_cursor}
+
+    async def search_posts(
+        self,
+        text: str,
+        limit: int,
+        topic: Optional[str] = None,
+        cursor: Optional[str] = None,
+    ) -> dict:
+        """
+        Search posts by keywords in title and content, best matches first
+
+        Results are not cached. Raises ValueError if cursor is invalid.
+        """
+        after = self._decode_search_cursor(cursor) if cursor else None
+        filters = {'topic': topic} if topic else {}
+        rows = await self.post_repo.search_feed_rows(text, limit, after, **filters)
+
+        next_cursor = None
+        if rows and len(rows) == limit:
+            next_cursor = encode_cursor({'rank': rows[-1].rank, 'id': rows[-1].id})
+        items = [self.serialize_feed_row(row) for row in rows]
+        return {'items': await self._with_live_likes(items), 'next_cursor': next_cursor}
+
+    async def get_trending(self, limit: int, topic: Optional[str] = None) -> dict:
+        """ Get best ranked trending posts with live likes counters """
+        if topic is not None and not settings.TRENDING_TOPICS_ENABLED:
+            topic = None
+        post_ids = await self.trending.get_top(topic, limit)
+        return {'items': await self.get_posts(post_ids), 'next_cursor': None}
+
+    def _trending_topic(self, topic: Optional[str]) -> Optional[str]:
+        """ Returns topic of post to rank in, None if topic rankings are disabled """
+        return topic if settings.TRENDING_TOPICS_ENABLED else None
+
+    async def _update_trending(self, post_ids: list[int], weight: float) -> None:
+        """ Add weight to trending scores of posts """
+        if not settings.TRENDING_TOPICS_ENABLED:
+            # Topics are not needed, callers only pass posts checked to exist.
+            # Posts deleted since are skipped when rankings are read
+            await self.trending.add_posts([(post_id, None) for post_id in post_ids], weight)
+            return
+        # Deleted posts are skipped along the way
+        posts = await self._hydrate_posts(post_ids)
+        await self.trending.add_posts(
+            [(post['id'], post['topic']) for post in posts],
+            weight,
+        )
 
     async def create_post(self, post_data: PostCreate, author_id: int) -> Post:
         """ Create post """
@@ -32,39 +372,205 @@ class PostService:
             **post_data.dict(),
             author_id=author_id,
         )
+        await self.posts_cache.invalidate_feeds(post.topic)
+        post = await self.post_repo.get_by_id_with_author(post.id)
+        if post.topic and settings.TOPIC_FEEDS_ENABLED:
+            await self.topic_feeds.add_post(post.topic, post.created_at, post.id)
+        await self.trending.add_posts(
+            [(post.id, self._trending_topic(post.topic))],
+            settings.TRENDING_POST_WEIGHT,
+        )
+        if settings.TIMELINE_FANOUT_ENABLED:
+            await self.timelines.queue_fan_out(post.id)
         return post
 
-    async def update_post(self, post_data: PostUpdate, author_id: int) -> Post:
-        """ Update post """
-        post = await self.post_repo.update(
-            **post_data.dict(),
-            author_id=author_id,
+    async def fan_out(self, post_id: int) -> None:
+        """
+        Push post into built timelines of followers of its author,
+        run off the request path by the background flusher
+
+        Posts of authors over `TIMELINE_FANOUT_MAX_FOLLOWERS` followers are
+        pulled on timeline reads instead.
+        """
+        post = await self.post_repo.get_by_id_with_author(post_id)
+        if post is None or post.author.followers_count > settings.TIMELINE_FANOUT_MAX_FOLLOWERS:
+            return
+        follower_ids = await self.follow_repo.get_follower_ids(post.author_id)
+        batch_size = settings.TIMELINE_FANOUT_BATCH_SIZE
+        for start in range(0, len(follower_ids), batch_size):
+            await self.timelines.add_post_many(
+                follower_ids[start:start + batch_size],
+                post.created_at,
+                post.id,
+            )
+
+    async def update_post(self, post_data: PostUpdate, author_id: int) -> bool:
+        """ Update post if user is its author """
+        post = await self.post_repo.get_by_id(post_data.id)
+        if post is None:
+            return False
+        old_topic = post.topic
+        updated = await self.post_repo.update_post_if_author(
+            post_data.id,
+            author_id,
+            **post_data.dict(exclude={'id'}),
         )
-        return post
+        if updated:
+            await self.posts_cache.invalidate_posts(post_data.id)
+            await self.posts_cache.invalidate_feeds(old_topic, post_data.topic)
+            if old_topic != post_data.topic and settings.TOPIC_FEEDS_ENABLED:
+                if old_topic:
+                    await self.topic_feeds.invalidate(old_topic)
+                if post_data.topic:
+                    await self.topic_feeds.add_post(post_data.topic, post.created_at, post.id)
+            if old_topic != post_data.topic and self._trending_topic(old_topic):
+                # Score is rebuilt in the new topic ranking by new likes
+                await self.trending.remove_post(post.id, old_topic, overall=False)
+        return updated
 
-    async def _update_likes_counter(self, post_id: int,) -> None:
-        """ Update likes counter """
-        likes = await self.like_repo.get_all_likes_by_post(post_id)
-        await self.post_repo.set_likes(post_id, len(likes))
+    async def delete_post(self, post_id: int, author_id: int) -> bool:
+        """ Delete post if user is its author """
+        post = await self.post_repo.get_by_id(post_id)
+        if post is None:
+            return False
+        topic = post.topic
+        deleted = await self.post_repo.delete_post_if_author(post_id, author_id)
+        if deleted:
+            await self.posts_cache.invalidate_posts(post_id)
+            await self.posts_cache.invalidate_feeds(topic)
+            if topic and settings.TOPIC_FEEDS_ENABLED:
+                await self.topic_feeds.invalidate(topic)
+            await self.trending.remove_post(post_id, self._trending_topic(topic))
+        return deleted
 
-    async def _sync_likes(self, post_id: int) -> None:
-        """ Sync likes """
-        likes = await self.likes_cache.get_likes_by_post(post_id)
+    async def recount_likes(self, post_ids: list[int]) -> dict[int, int]:
+        """
+        Recount likes counters of posts from stored likes
 
-        likes_db = await self.like_repo.get_all_likes_by_post(post_id)
-        likes_db = [like.user_id for like in likes_db]
+        Returns:
+            dict[int, int]: Mapping of post id to number of likes
+        """
+        async with self.post_repo.unit_of_work():
+            likes = await self.like_repo.count_by_posts(post_ids)
+            await self.post_repo.set_likes_bulk(likes)
+            rows = await self.post_repo.get_many(post_ids, columns=[Post.id, Post.topic])
+        await self.likes_cache.reset_deltas(*post_ids)
+        await self.posts_cache.invalidate_posts(*post_ids)
+        await self.posts_cache.invalidate_feeds(*{row.topic for row in rows})
+        return likes
 
-        for user_id in likes:
-            if user_id in likes_db:
+    async def sync_likes(self, post_id: int) -> int:
+        """
+        Sync cached likes and unlikes of post into database in one transaction,
+        adjusting likes counter by the net change
+
+        Returns:
+            int: Number of cached changes processed
+        """
+        likes, unlikes = await self.likes_cache.get_pending(post_id)
+        if not likes and not unlikes:
+            return 0
+
+        post = await self.post_repo.get_by_id(post_id)
+        if post is None:
+            # Post was deleted after it was liked, nothing to persist
+            await self.likes_cache.remove_pending(post_id, likes, unlikes)
+            return 0
+
+        async with self.post_repo.unit_of_work():
+            deleted = await self.like_repo.bulk_delete_likes(post_id, unlikes)
+            created = await self.like_repo.bulk_create_likes(post_id, likes)
+            delta = created - deleted
+            if delta:
+                await self.post_repo.increment_likes(post_id, delta)
+        await self.likes_cache.remove_pending(post_id, likes, unlikes)
+        await self.likes_cache.mark_touched(post_id)
+        if delta:
+            await self.posts_cache.invalidate_posts(post_id)
+            await self.posts_cache.invalidate_feeds(post.topic)
+        return len(likes) + len(unlikes)
+
+    async def _get_stored_like(self, post_id: int, user_id: int) -> Optional[bool]:
+        """
+        Check post exists and whether like of user is stored, in one query
+
+        Pending changes of the cache are relative to the stored like.
+        Returns None if post does not exist.
+        """
+        # A like flushed moments ago may not have reached replicas yet
+        self.post_repo.use_primary()
+        existing = await self.post_repo.get_existing_ids_liked_by([post_id], user_id)
+        return existing.get(post_id)
+
+    async def like_post(self, post_id: int, user_id: int) -> bool:
+        """ Like post, likes are persisted by the background flusher. Returns False if post does not exist """
+        persisted = await self._get_stored_like(post_id, user_id)
+        if persisted is None:
+            return False
+        liked, pending = await self.likes_cache.like_post(post_id, user_id, persisted=persisted)
+        if pending >= settings.POST_LIKES_CACHE_THRESHOLD:
+            await self.likes_cache.mark_due(post_id)
+        if liked:
+            await self._update_trending([post_id], 1.0)
+        return True
+
+    async def unlike_post(self, post_id: int, user_id: int) -> bool:
+        """ Unlike post, unlikes are persisted by the background flusher. Returns False if post does not exist """
+        persisted = await self._get_stored_like(post_id, user_id)
+        if persisted is None:
+            return False
+        unliked, pending = await self.likes_cache.unlike_post(post_id, user_id, persisted=persisted)
+        if pending >= settings.POST_LIKES_CACHE_THRESHOLD:
+            await self.likes_cache.mark_due(post_id)
+        if unliked:
+            await self._update_trending([post_id], -1.0)
+        return True
+
+    async def like_posts(self, post_ids: list[int], user_id: int) -> list[tuple[int, LikeStatus]]:
+        """
+        Like many posts, checking posts and stored likes in one database query
+        and recording likes in one cache round trip
+
+        Posts reaching the flush threshold and trending scores take one more
+        round trip each.
+        """
+        # A like flushed moments ago may not have reached replicas yet
+        self.post_repo.use_primary()
+        existing = await self.post_repo.get_existing_ids_liked_by(post_ids, user_id)
+        to_like = [post_id for post_id in post_ids if post_id in existing]
+        persisted = {post_id for post_id in to_like if existing[post_id]}
+        added = iter(await self.likes_cache.like_posts(to_like, user_id, persisted))
+
+        results = []
+        due = set()
+        liked_ids = []
+        for post_id in post_ids:
+            if post_id not in existing:
+                results.append((post_id, LikeStatus.not_found))
                 continue
-            await self.like_repo.create_like(post_id, user_id)
-        await self._update_likes_counter(post_id)
-
-    async def like_post(self, post_id: int, user_id: int) -> None:
-        """ Like post """
-        await self.likes_cache.like_post(post_id, user_id)
-        
-        cache_likes = await self.likes_cache.get_likes_by_post(post_id)
-        if len(cache_likes) >= settings.POST_LIKES_CACHE_THRESHOLD:
-            await self._sync_likes(post_id)
-            await self.likes_cache.clear_cache(post_id)
+            liked, pending = next(added)
+            if pending >= settings.POST_LIKES_CACHE_THRESHOLD:
+                due.add(post_id)
+            if liked:
+                liked_ids.append(post_id)
+            results.append((post_id, LikeStatus.liked if liked else LikeStatus.already_liked))
+
+        if due:
+            await self.likes_cache.mark_due(*due)
+        if liked_ids:
+            await self._update_trending(liked_ids, 1.0)
+        return results
+
+
+def build_post_service(session: AsyncSession) -> PostService:
+    """ Builds post service on session outside of request dependencies, e.g. in background tasks """
+    return PostService(
+        PostRepo(session),
+        PostLikesCacheRepo(SetCacher()),
+        LikeRepo(session),
+        PostCacheRepo(ValueCacher()),
+        TopicFeedCacheRepo(LexSortedSetCacher()),
+        FollowRepo(session),
+        TimelineCacheRepo(LexSortedSetCacher(), SetCacher()),
+        TrendingCacheRepo(DecayedSortedSetCacher(), SetCacher()),
+    )
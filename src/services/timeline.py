@@ -0,0 +1,154 @@
+from datetime import datetime
+from functools import partial
+from typing import Annotated, Optional
+from fastapi import Depends
+
+from core.pagination import encode_position_cursor, decode_position_cursor
+from core.settings import get_settings
+
+from repositories.follow import FollowRepo
+from repositories.post import PostRepo
+from repositories.post_cache import TimelineCacheRepo
+from repositories.user import UserRepo
+
+from services.post import PostService, post_reads
+
+
+settings = get_settings()
+
+
+class TimelineService:
+    """
+    Home timelines of posts of followed authors, newest first.
+
+    New posts are pushed into bounded timelines of followers shortly after
+    write, by the background flusher. Posts of authors with more than
+    `TIMELINE_FANOUT_MAX_FOLLOWERS` followers are pulled from the database
+    on read and merged in, so a post does not cost a write per follower.
+    When an author drops to the threshold, posts they made while pulled are
+    missing from built timelines, so timelines of their followers are dropped
+    and rebuilt on the next read.
+    """
+
+    def __init__(
+        self,
+        follow_repo: Annotated[FollowRepo, Depends()],
+        user_repo: Annotated[UserRepo, Depends()],
+        post_repo: Annotated[PostRepo, Depends()],
+        timeline_cache_repo: Annotated[TimelineCacheRepo, Depends()],
+        post_service: Annotated[PostService, Depends()],
+    ) -> None:
+        self.follow_repo = follow_repo
+        self.user_repo = user_repo
+        self.post_repo = post_repo
+        self.timelines = timeline_cache_repo
+        self.post_service = post_service
+
+    async def follow(self, follower_id: int, followee_id: int) -> bool:
+        """
+        Follow user, followed user posts appear in timeline from the next read
+
+        Returns:
+            bool: False if followed user does not exist
+        """
+        if not await self.user_repo.exists(id=followee_id):
+            return False
+        async with self.follow_repo.unit_of_work():
+            if await self.follow_repo.create_follow(follower_id, followee_id):
+                await self.user_repo.increment_followers(followee_id, 1)
+        await self.timelines.invalidate(follower_id)
+        return True
+
+    async def unfollow(self, follower_id: int, followee_id: int) -> bool:
+        """
+        Unfollow user
+
+        Returns:
+            bool: False if user was not followed
+        """
+        followers = None
+        async with self.follow_repo.unit_of_work():
+            deleted = await self.follow_repo.delete_follow(follower_id, followee_id)
+            if deleted:
+                followers = await self.user_repo.increment_followers(followee_id, -1)
+        if deleted:
+            await self.timelines.invalidate(follower_id)
+        if followers == settings.TIMELINE_FANOUT_MAX_FOLLOWERS:
+            # Author switched from pulled to pushed
+            await self._invalidate_followers(followee_id)
+        return deleted
+
+    async def _invalidate_followers(self, user_id: int) -> None:
+        """ Drop timelines of all followers of user """
+        follower_ids = await self.follow_repo.get_follower_ids(user_id)
+        batch_size = settings.TIMELINE_FANOUT_BATCH_SIZE
+        for start in range(0, len(follower_ids), batch_size):
+            await self.timelines.invalidate_many(follower_ids[start:start + batch_size])
+
+    async def _build_timeline(self, user_id: int, author_ids: list[int]) -> list[tuple[datetime, int]]:
+        """ Build timeline of posts of fanned out authors from database """
+        # Filled from the primary, see `PostService._load_post`
+        self.post_repo.use_primary()
+        positions = await self.post_repo.get_author_feed_positions(author_ids, settings.TIMELINE_MAX_SIZE)
+        await self.timelines.replace(user_id, positions)
+        if positions:
+            # Posts fanned out while the timeline was built skipped it, as it did not exist yet
+            newer = await self.post_repo.get_author_feed_positions(
+                author_ids, settings.TIMELINE_MAX_SIZE, since=positions[0],
+            )
+            if newer:
+                await self.timelines.add_posts(user_id, newer)
+                positions = (newer + positions)[:settings.TIMELINE_MAX_SIZE]
+        return positions
+
+    async def _get_pushed_page(
+        self,
+        user_id: int,
+        author_ids: list[int],
+        after: Optional[tuple[datetime, int]],
+        limit: int,
+    ) -> list[tuple[datetime, int]]:
+        """ Get page of posts fanned out to timeline, building timeline on miss """
+        size = await self.timelines.size(user_id)
+        if size:
+            positions = await self.timelines.get_page(user_id, after, limit)
+        else:
+            built = await post_reads.do(
+                f"timeline:{user_id}",
+                partial(self._build_timeline, user_id, author_ids),
+            )
+            size = len(built)
+            positions = [position for position in built if after is None or position < after][:limit]
+        if len(positions) < limit and size >= settings.TIMELINE_MAX_SIZE:
+            # Page reaches past the oldest post kept in the bounded timeline
+            return await self.post_repo.get_author_feed_positions(author_ids, limit, after)
+        return positions
+
+    async def get_timeline(self, user_id: int, limit: int, cursor: Optional[str] = None) -> dict:
+        """
+        Get page of home timeline with live likes counters
+
+        Raises ValueError if cursor is invalid.
+        """
+        after = decode_position_cursor(cursor) if cursor else None
+        followees = await self.follow_repo.get_followees(user_id)
+        if not followees:
+            return {'items': [], 'next_cursor': None}
+
+        pushed, pulled = [], []
+        for author_id, followers in followees.items():
+            if followers > settings.TIMELINE_FANOUT_MAX_FOLLOWERS:
+                pulled.append(author_id)
+            else:
+                pushed.append(author_id)
+
+        positions = await self._get_pushed_page(user_id, pushed, after, limit) if pushed else []
+        if pulled:
+            # Authors passing the threshold later may have posts both pushed and pulled
+            positions = set(positions)
+            positions.update(await self.post_repo.get_author_feed_positions(pulled, limit, after))
+            positions = sorted(positions, reverse=True)[:limit]
+
+        next_cursor = encode_position_cursor(*positions[-1]) if len(positions) == limit else None
+        items = await self.post_service.get_posts([post_id for _, post_id in positions])
+        return {'items': items, 'next_cursor': next_cursor}
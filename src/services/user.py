@@ -1,35 +1,95 @@
 
+import uuid
+
 from typing import Annotated
 from fastapi import Depends
-from werkzeug.security import generate_password_hash, check_password_hash
 
 from db.models import User
 
 from core.settings import get_settings
-from core.jwt import create_token
+from core.hashing import password_hasher
+from core.jwt import create_token, decode_token, REFRESH_TOKEN
 
 from repositories.user import UserRepo
+from repositories.user_cache import RefreshTokenCacheRepo, UserPrincipalCacheRepo
 from schemas.auth import Token
 from schemas.user import UserSignUp
 
 
 settings = get_settings()
 
-JWT_SECRET = settings.JWT_SECRET
-JWT_ALGORITHM = settings.JWT_ALGORITHM
-
 
 class UserService:
-    def __init__(self, user_repo: Annotated[UserRepo, Depends()]) -> None:
+    def __init__(
+        self,
+        user_repo: Annotated[UserRepo, Depends()],
+        refresh_token_repo: Annotated[RefreshTokenCacheRepo, Depends()],
+        user_cache_repo: Annotated[UserPrincipalCacheRepo, Depends()],
+    ) -> None:
         self.user_repo = user_repo
+        self.refresh_tokens = refresh_token_repo
+        self.user_cache = user_cache_repo
 
-    def create_access_token(username: str) -> Token:
-        """ Create access token for user """
+    async def create_access_token(self, username: str, user_id: int) -> Token:
+        """ Create access and refresh tokens for user, refresh token is usable once """
+        payload = {'username': username, 'user_id': user_id}
+        jti = uuid.uuid4().hex
+        refresh_token = create_token({**payload, 'jti': jti}, token_type=REFRESH_TOKEN)
+        await self.refresh_tokens.add(jti, user_id)
         return Token(
-            access_token=create_token({'username': username}),
+            access_token=create_token(payload),
             token_type='bearer',
+            expires_in=settings.JWT_ACCESS_TOKEN_TTL,
+            refresh_token=refresh_token,
         )
 
+    def _decode_refresh_token(self, refresh_token: str) -> dict | None:
+        """ Returns claims of refresh token, None if it is invalid """
+        payload = decode_token(refresh_token, token_type=REFRESH_TOKEN, use_cache=False)
+        if not payload or 'user_id' not in payload or 'jti' not in payload:
+            return None
+        return payload
+
+    async def refresh_access_token(self, refresh_token: str) -> Token | bool:
+        """
+        Exchange refresh token for a new token pair, rotating the refresh token
+
+        A refresh token presented again after it was exchanged may have been
+        stolen, so all refresh tokens of its user are revoked.
+
+        Returns:
+            Token: New tokens if refresh token is valid, unused and user still exists
+            bool: False otherwise
+        """
+        payload = self._decode_refresh_token(refresh_token)
+        if payload is None:
+            return False
+        user_id = await self.refresh_tokens.consume(payload['jti'])
+        if user_id is None:
+            await self.refresh_tokens.revoke_user(payload['user_id'])
+            return False
+        if user_id != payload['user_id']:
+            return False
+        # Replicas may lag behind a just deactivated user
+        self.user_repo.use_primary()
+        user = await self.user_repo.get_by_id(user_id)
+        if user is None or not user.is_active:
+            return False
+        return await self.create_access_token(user.username, user.id)
+
+    async def revoke_refresh_token(self, refresh_token: str) -> bool:
+        """
+        Revoke refresh token, e.g. on logout
+
+        Returns:
+            bool: False if refresh token is invalid
+        """
+        payload = self._decode_refresh_token(refresh_token)
+        if payload is None:
+            return False
+        await self.refresh_tokens.revoke(payload['jti'])
+        return True
+
     async def auth_user(self, username: str, password: str) -> User | bool:
         """ 
         Authenticate user by username and password
@@ -38,17 +98,22 @@ class UserService:
             User: User object if user is authenticated
             bool: False if user is not authenticated
         """
+        # Replicas may lag behind a just created user or changed password
+        self.user_repo.use_primary()
         user = await self.user_repo.get_by_username(username)
         if user is None:
             return False
-        result = check_password_hash(user.hashed_password, password)
+        result = await password_hasher.verify(user.hashed_password, password)
         if not result:
             return False
+        if password_hasher.needs_rehash(user.hashed_password):
+            hashed_password = await password_hasher.hash(password)
+            await self.user_repo.update(user.id, hashed_password=hashed_password)
         return user
 
     async def create_user(self, user_data: UserSignUp) -> User:
         """ Create user """
-        hashed_password = generate_password_hash(user_data.password)
+        hashed_password = await password_hasher.hash(user_data.password)
 
         user = await self.user_repo.create(
             **user_data.dict(),
@@ -56,3 +121,23 @@ class UserService:
         )
         return user
 
+    async def update_user(self, user_id: int, **values) -> bool:
+        """
+        Update user, dropping their cached principal
+
+        Every change of user data cached in principals, e.g. username or
+        `is_active`, must go through this method. Deactivated users also
+        lose their refresh tokens.
+
+        Returns:
+            bool: False if user does not exist
+        """
+        self.user_repo.use_primary()
+        user = await self.user_repo.get_by_id(user_id)
+        if user is None:
+            return False
+        await self.user_repo.update(user_id, **values)
+        await self.user_cache.invalidate(user.username, user.id)
+        if values.get('is_active') is False:
+            await self.refresh_tokens.revoke_user(user.id)
+        return True
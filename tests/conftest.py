@@ -0,0 +1,90 @@
+from datetime import datetime, timedelta
+
+import fakeredis
+import httpx
+import pytest
+
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+import core.cache
+import db.session
+
+from db.models import Base, Post, User
+
+from repositories.user_cache import local_principals
+from services.post import PostService, build_post_service
+
+
+@pytest.fixture
+async def redis(monkeypatch):
+    """ In-memory Redis with Lua scripting, used by all cachers """
+    client = fakeredis.FakeAsyncRedis()
+    monkeypatch.setattr(core.cache, "_redis", client)
+    yield client
+    await client.flushall()
+
+
+@pytest.fixture
+async def engine(tmp_path, monkeypatch):
+    """ SQLite database with the schema of the models """
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'test.db'}")
+    async with engine.begin() as connection:
+        await connection.run_sync(Base.metadata.create_all)
+    monkeypatch.setattr(db.session, "_engine", engine)
+    monkeypatch.setattr(db.session, "_sessionmaker", sessionmaker(
+        bind=engine, class_=AsyncSession, expire_on_commit=False,
+    ))
+    yield engine
+    await engine.dispose()
+
+
+@pytest.fixture
+async def session(engine):
+    async with db.session.get_sessionmaker()() as session:
+        yield session
+
+
+@pytest.fixture
+async def client(engine, redis):
+    """ Client calling the app in process, without running its lifespan """
+    from main import app
+    local_principals.clear()
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        yield client
+
+
+@pytest.fixture
+def post_service(session, redis) -> PostService:
+    return build_post_service(session)
+
+
+@pytest.fixture
+async def author(session) -> User:
+    user = User(username="author", hashed_password="-", email="author@example.com", first_name="A")
+    session.add(user)
+    await session.commit()
+    return user
+
+
+@pytest.fixture
+def make_posts(session, author):
+    """ Creates posts one second apart, oldest first """
+    async def make_posts(count: int, topic: str = None, start: datetime = datetime(2024, 1, 1)) -> list[Post]:
+        posts = [
+            Post(
+                title=f"post {i}",
+                content=f"content {i}",
+                topic=topic,
+                likes=0,
+                author_id=author.id,
+                created_at=start + timedelta(seconds=i),
+                updated_at=start + timedelta(seconds=i),
+            )
+            for i in range(count)
+        ]
+        session.add_all(posts)
+        await session.commit()
+        return posts
+    return make_posts
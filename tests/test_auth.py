@@ -0,0 +1,118 @@
+import time
+
+import pytest
+
+from jwt import encode
+from werkzeug.security import generate_password_hash
+
+from core.cache import ValueCacher
+from core.hashing import PasswordHasher
+from core.jwt import create_token, decode_token, get_signing_key, settings
+from repositories.user import UserRepo
+from repositories.user_cache import RefreshTokenCacheRepo, UserPrincipalCacheRepo
+from services.user import UserService
+
+
+@pytest.fixture
+def user_service(session, redis) -> UserService:
+    return UserService(
+        UserRepo(session),
+        RefreshTokenCacheRepo(ValueCacher()),
+        UserPrincipalCacheRepo(ValueCacher()),
+    )
+
+
+@pytest.fixture
+def password_hasher(monkeypatch) -> PasswordHasher:
+    hasher = PasswordHasher(method="pbkdf2:sha256:1000", workers=1)
+    monkeypatch.setattr("services.user.password_hasher", hasher)
+    yield hasher
+    hasher.shutdown()
+
+
+@pytest.fixture
+def set_password(session, author):
+    async def set_password(method: str) -> str:
+        author.hashed_password = generate_password_hash("secret", method=method)
+        await session.commit()
+        return author.hashed_password
+    return set_password
+
+
+async def _stored_hash(session, user) -> str:
+    await session.refresh(user)
+    return user.hashed_password
+
+
+async def test_login_upgrades_legacy_hash(user_service, password_hasher, session, author, set_password):
+    await set_password("pbkdf2:sha256:500")
+
+    assert await user_service.auth_user(author.username, "secret")
+
+    hashed_password = await _stored_hash(session, author)
+    assert hashed_password.startswith("pbkdf2:sha256:1000$")
+    assert await user_service.auth_user(author.username, "secret")
+
+
+async def test_login_keeps_current_hash(user_service, password_hasher, session, author, set_password):
+    current = await set_password("pbkdf2:sha256:1000")
+
+    assert await user_service.auth_user(author.username, "secret")
+
+    assert await _stored_hash(session, author) == current
+
+
+async def test_failed_login_does_not_rehash(user_service, password_hasher, session, author, set_password):
+    legacy = await set_password("pbkdf2:sha256:500")
+
+    assert not await user_service.auth_user(author.username, "wrong")
+
+    assert await _stored_hash(session, author) == legacy
+
+
+def test_token_without_expiry_is_rejected():
+    token = encode({"user_id": 1, "type": "access"}, get_signing_key(), algorithm=settings.JWT_ALGORITHM)
+    assert decode_token(token, use_cache=False) is None
+
+
+def test_token_without_type_is_rejected():
+    now = int(time.time())
+    token = encode(
+        {"user_id": 1, "iat": now, "exp": now + 60}, get_signing_key(), algorithm=settings.JWT_ALGORITHM,
+    )
+    assert decode_token(token, use_cache=False) is None
+
+
+async def test_refresh_token_rotates_and_replay_revokes_all(user_service, author):
+    first = await user_service.create_access_token(author.username, author.id)
+
+    second = await user_service.refresh_access_token(first.refresh_token)
+    assert second
+    assert second.refresh_token != first.refresh_token
+
+    # Replaying a used refresh token also revokes the one issued in exchange
+    assert not await user_service.refresh_access_token(first.refresh_token)
+    assert not await user_service.refresh_access_token(second.refresh_token)
+
+
+async def test_revoked_refresh_token_is_rejected(user_service, author):
+    token = await user_service.create_access_token(author.username, author.id)
+
+    assert await user_service.revoke_refresh_token(token.refresh_token)
+    assert not await user_service.refresh_access_token(token.refresh_token)
+
+
+async def test_unlisted_refresh_token_is_rejected(user_service, author):
+    payload = {"username": author.username, "user_id": author.id}
+    assert not await user_service.refresh_access_token(create_token(payload, token_type="refresh"))
+
+
+async def test_deactivated_user_loses_cached_access_and_refresh_tokens(client, user_service, author):
+    token = await user_service.create_access_token(author.username, author.id)
+    headers = {"Authorization": f"Bearer {token.access_token}"}
+    assert (await client.get("/community/likes/export", headers=headers)).status_code == 200
+
+    assert await user_service.update_user(author.id, is_active=False)
+
+    assert (await client.get("/community/likes/export", headers=headers)).status_code == 401
+    assert not await user_service.refresh_access_token(token.refresh_token)
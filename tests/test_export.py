@@ -0,0 +1,24 @@
+import ujson
+
+from core.jwt import create_token
+from db.models import User, UserLike
+
+
+async def test_likes_export_is_limited_to_own_likes(client, session, author, make_posts):
+    other = User(username="other", hashed_password="-", email="other@example.com", first_name="O")
+    session.add(other)
+    await session.commit()
+    posts = await make_posts(2)
+    session.add_all([
+        UserLike(user_id=author.id, post_id=posts[0].id),
+        UserLike(user_id=other.id, post_id=posts[0].id),
+        UserLike(user_id=other.id, post_id=posts[1].id),
+    ])
+    await session.commit()
+
+    token = create_token({"username": author.username, "user_id": author.id})
+    response = await client.get("/community/likes/export", headers={"Authorization": f"Bearer {token}"})
+
+    assert response.status_code == 200
+    likes = [ujson.loads(line) for line in response.text.splitlines()]
+    assert [(like["user_id"], like["post_id"]) for like in likes] == [(author.id, posts[0].id)]
@@ -0,0 +1,84 @@
+from datetime import datetime
+
+import pytest
+
+from db.models import Post
+from repositories.post import PostRepo
+
+
+pytestmark = pytest.mark.filterwarnings("error::sqlalchemy.exc.SADeprecationWarning")
+
+
+@pytest.fixture
+def post_repo(session) -> PostRepo:
+    return PostRepo(session)
+
+
+async def test_filter_pages_start_at_first_row(post_repo, make_posts):
+    posts = await make_posts(5)
+
+    pages = [await post_repo.filter(page=page, per_page=2) for page in (1, 2, 3)]
+
+    assert [[post.id for post in page] for page in pages] == [
+        [posts[0].id, posts[1].id], [posts[2].id, posts[3].id], [posts[4].id],
+    ]
+    with pytest.raises(ValueError):
+        await post_repo.filter(page=0)
+
+
+async def test_filter_projects_columns(post_repo, make_posts):
+    await make_posts(2, topic="news")
+    await make_posts(1)
+
+    rows = await post_repo.filter(columns=[Post.id, Post.topic], topic="news")
+
+    assert [row.topic for row in rows] == ["news", "news"]
+
+
+async def test_keyset_pages_newest_first(post_repo, make_posts):
+    posts = await make_posts(3)
+
+    first = await post_repo.keyset(2)
+    rest = await post_repo.keyset(2, after=(first[-1].created_at, first[-1].id))
+
+    assert [post.id for post in first + rest] == [post.id for post in reversed(posts)]
+
+
+async def test_count_and_exists(post_repo, make_posts):
+    assert await post_repo.count() == 0
+    assert not await post_repo.exists()
+
+    await make_posts(2, topic="news")
+    await make_posts(1)
+
+    assert await post_repo.count() == 3
+    assert await post_repo.count(topic="news") == 2
+    assert await post_repo.exists(topic="news")
+    assert not await post_repo.exists(topic="sports")
+
+
+async def test_get_many_keeps_order_of_ids(post_repo, make_posts):
+    posts = await make_posts(3)
+    ids = [posts[2].id, 0, posts[0].id, posts[1].id]
+
+    assert [post.id for post in await post_repo.get_many(ids)] == [posts[2].id, posts[0].id, posts[1].id]
+    rows = await post_repo.get_many(ids, columns=[Post.id, Post.title])
+    assert [row.title for row in rows] == ["post 2", "post 0", "post 1"]
+    assert await post_repo.get_many([]) == []
+
+
+async def test_bulk_create_and_update(post_repo, author):
+    created_at = datetime(2024, 1, 1)
+    async with post_repo.unit_of_work():
+        await post_repo.bulk_create([
+            {"title": title, "content": "content", "likes": 0, "author_id": author.id,
+             "created_at": created_at, "updated_at": created_at}
+            for title in ("a", "b")
+        ])
+    posts = await post_repo.filter()
+
+    async with post_repo.unit_of_work():
+        await post_repo.bulk_update([{"id": post.id, "likes": 3} for post in posts])
+    post_repo.session.expire_all()
+
+    assert [(post.title, post.likes) for post in await post_repo.filter()] == [("a", 3), ("b", 3)]
@@ -0,0 +1,32 @@
+import pytest
+
+from werkzeug.security import generate_password_hash
+
+from core.hashing import PasswordHasher
+
+
+@pytest.fixture
+def hasher() -> PasswordHasher:
+    hasher = PasswordHasher(method="pbkdf2:sha256:1000", workers=1)
+    yield hasher
+    hasher.shutdown()
+
+
+async def test_hash_of_configured_method_is_current(hasher):
+    hashed_password = await hasher.hash("secret")
+
+    assert not hasher.needs_rehash(hashed_password)
+    assert await hasher.verify(hashed_password, "secret")
+
+
+def test_hash_of_other_method_or_parameters_needs_rehash(hasher):
+    assert hasher.needs_rehash(generate_password_hash("secret", method="pbkdf2:sha256:500"))
+    assert hasher.needs_rehash(generate_password_hash("secret", method="pbkdf2:sha512:1000"))
+    assert hasher.needs_rehash(generate_password_hash("secret", method="scrypt:16384:8:1"))
+
+
+def test_method_without_parameters_accepts_any_parameters():
+    hasher = PasswordHasher(method="pbkdf2", workers=1)
+
+    assert not hasher.needs_rehash(generate_password_hash("secret", method="pbkdf2:sha256:500"))
+    assert hasher.needs_rehash(generate_password_hash("secret", method="scrypt:16384:8:1"))
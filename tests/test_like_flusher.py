@@ -0,0 +1,88 @@
+import pytest
+
+from repositories.like import LikeRepo
+from services.like_flusher import LikesFlusher
+from services.post import PostService
+
+
+@pytest.fixture
+def like_repo(session) -> LikeRepo:
+    return LikeRepo(session)
+
+
+async def _stored_likes(like_repo: LikeRepo, posts) -> list[int]:
+    counts = await like_repo.count_by_posts([post.id for post in posts])
+    return [counts[post.id] for post in posts]
+
+
+async def test_tick_flushes_posts_over_threshold_at_once(
+    post_service, like_repo, author, make_posts, monkeypatch,
+):
+    monkeypatch.setattr("services.post.settings.POST_LIKES_CACHE_THRESHOLD", 1)
+    [post] = await make_posts(1)
+    await post_service.like_post(post.id, author.id)
+    flusher = LikesFlusher(interval=3600, batch_size=10)
+
+    stats = await flusher.get_stats()
+    assert (stats.backlog_posts, stats.due_posts) == (1, 1)
+
+    await flusher._tick()
+
+    assert await _stored_likes(like_repo, [post]) == [1]
+    assert (await flusher.get_stats()).due_posts == 0
+
+
+async def test_tick_flushes_when_backlog_reaches_batch_size(post_service, like_repo, author, make_posts):
+    posts = await make_posts(2)
+    flusher = LikesFlusher(interval=3600, batch_size=2)
+
+    await post_service.like_post(posts[0].id, author.id)
+    await flusher._tick()
+    assert await _stored_likes(like_repo, posts) == [0, 0]
+
+    await post_service.like_post(posts[1].id, author.id)
+    await flusher._tick()
+    assert await _stored_likes(like_repo, posts) == [1, 1]
+    stats = await flusher.get_stats()
+    assert (stats.backlog_posts, stats.flushed_posts, stats.flushed_likes) == (0, 2, 2)
+
+
+async def test_tick_flushes_when_interval_passed(post_service, like_repo, author, make_posts):
+    [post] = await make_posts(1)
+    await post_service.like_post(post.id, author.id)
+
+    await LikesFlusher(interval=0, batch_size=10)._tick()
+
+    assert await _stored_likes(like_repo, [post]) == [1]
+
+
+async def test_stop_flushes_remaining_backlog(post_service, like_repo, author, make_posts):
+    [post] = await make_posts(1)
+    flusher = LikesFlusher(interval=3600, poll_interval=3600, batch_size=10)
+    flusher.start()
+    await post_service.like_post(post.id, author.id)
+
+    await flusher.stop()
+
+    assert not flusher.running
+    assert await _stored_likes(like_repo, [post]) == [1]
+
+
+async def test_failed_sync_is_retried_on_next_flush(post_service, like_repo, author, make_posts, monkeypatch):
+    [post] = await make_posts(1)
+    await post_service.like_post(post.id, author.id)
+    sync_likes = PostService.sync_likes
+
+    async def failing_sync_likes(self, post_id):
+        raise RuntimeError("database unavailable")
+
+    monkeypatch.setattr(PostService, "sync_likes", failing_sync_likes)
+    flusher = LikesFlusher(interval=3600, batch_size=10)
+    assert await flusher.flush() == 0
+    stats = await flusher.get_stats()
+    assert (stats.failed_posts, stats.backlog_posts) == (1, 1)
+
+    monkeypatch.setattr(PostService, "sync_likes", sync_likes)
+    assert await flusher.flush() == 1
+    assert await _stored_likes(like_repo, [post]) == [1]
+    assert (await flusher.get_stats()).backlog_posts == 0
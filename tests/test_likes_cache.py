@@ -0,0 +1,64 @@
+from core.cache import DecayedSortedSetCacher, SetCacher
+from schemas.post import LikeStatus
+
+
+async def test_relike_of_flushed_like_does_not_count_twice(post_service, author, make_posts):
+    [post] = await make_posts(1)
+
+    await post_service.like_post(post.id, author.id)
+    await post_service.sync_likes(post.id)
+    await post_service.like_post(post.id, author.id)
+
+    assert (await post_service.get_post(post.id))['likes'] == 1
+    assert await post_service.likes_cache.get_pending(post.id) == ([], [])
+
+
+async def test_unlike_of_never_liked_post_does_not_count(post_service, author, make_posts):
+    [post] = await make_posts(1)
+
+    await post_service.unlike_post(post.id, author.id)
+
+    assert (await post_service.get_post(post.id))['likes'] == 0
+    assert await post_service.likes_cache.get_pending(post.id) == ([], [])
+
+
+async def test_unlike_and_relike_of_flushed_like(post_service, author, make_posts):
+    [post] = await make_posts(1)
+    await post_service.like_post(post.id, author.id)
+    await post_service.sync_likes(post.id)
+
+    await post_service.unlike_post(post.id, author.id)
+    assert (await post_service.get_post(post.id))['likes'] == 0
+
+    await post_service.like_post(post.id, author.id)
+    assert (await post_service.get_post(post.id))['likes'] == 1
+    assert await post_service.likes_cache.get_pending(post.id) == ([], [])
+
+
+async def test_scripts_are_reloaded_after_script_flush(redis):
+    cacher = SetCacher()
+    assert await cacher.move_member("to", "from", "a", "owner") == (True, 1)
+
+    await redis.script_flush()
+    assert await cacher.move_member("to", "from", "b", "owner") == (True, 2)
+
+    await redis.script_flush()
+    await DecayedSortedSetCacher().add_many("bases", [(["ranking"], "a"), (["ranking"], "b")], 1.0, 3600)
+    assert set(await DecayedSortedSetCacher().top("ranking", 10)) == {"a", "b"}
+
+
+async def test_like_posts_reports_flushed_likes_as_already_liked(post_service, author, make_posts):
+    flushed, pending, new = await make_posts(3)
+    await post_service.like_post(flushed.id, author.id)
+    await post_service.sync_likes(flushed.id)
+    await post_service.like_post(pending.id, author.id)
+
+    results = await post_service.like_posts([flushed.id, pending.id, new.id, 0], author.id)
+
+    assert results == [
+        (flushed.id, LikeStatus.already_liked),
+        (pending.id, LikeStatus.already_liked),
+        (new.id, LikeStatus.liked),
+        (0, LikeStatus.not_found),
+    ]
+    assert (await post_service.get_post(flushed.id))['likes'] == 1
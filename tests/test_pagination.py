@@ -0,0 +1,31 @@
+from datetime import datetime
+
+import pytest
+
+from core.pagination import (
+    clamp_limit, decode_cursor, decode_position_cursor, encode_cursor, encode_position_cursor,
+)
+from core.settings import get_settings
+
+
+def test_position_cursor_round_trip():
+    position = (datetime(2024, 1, 1, 12, 30, 15, 123456), 42)
+    assert decode_position_cursor(encode_position_cursor(*position)) == position
+
+
+def test_cursor_is_url_safe_without_padding():
+    cursor = encode_cursor({"rank": 0.5, "id": 7})
+    assert "=" not in cursor
+    assert decode_cursor(cursor) == {"rank": 0.5, "id": 7}
+
+
+@pytest.mark.parametrize("cursor", ["not-a-cursor", encode_cursor({"id": 1}), "WzFd"])
+def test_invalid_position_cursor_raises_value_error(cursor):
+    with pytest.raises(ValueError):
+        decode_position_cursor(cursor)
+
+
+def test_clamp_limit_caps_at_max_page_size():
+    max_page_size = get_settings().MAX_PAGE_SIZE
+    assert clamp_limit(max_page_size + 1) == max_page_size
+    assert clamp_limit(1) == 1
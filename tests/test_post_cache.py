@@ -0,0 +1,109 @@
+import pytest
+
+from core.cache import CacheStats, ValueCacher
+from repositories.post_cache import PostCacheRepo, post_cache_stats
+from schemas.post import PostUpdate
+
+
+async def test_fill_lock_release_keeps_lock_taken_over_after_expiry(redis):
+    posts_cache = PostCacheRepo(ValueCacher())
+    expired = await posts_cache.acquire_fill_lock("feed:all:head:10")
+    await redis.delete("posts:fill_lock:feed:all:head:10")
+    current = await posts_cache.acquire_fill_lock("feed:all:head:10")
+
+    await posts_cache.release_fill_lock("feed:all:head:10", expired)
+    assert await posts_cache.is_fill_locked("feed:all:head:10")
+
+    await posts_cache.release_fill_lock("feed:all:head:10", current)
+    assert not await posts_cache.is_fill_locked("feed:all:head:10")
+
+
+async def test_feed_fills_of_no_topic_and_topic_named_none_do_not_share_lock(post_service, make_posts):
+    await make_posts(1, topic="None")
+    names = []
+    fill_once = post_service._fill_once
+
+    async def record_fill(name, get_cached, load):
+        names.append(name)
+        return await fill_once(name, get_cached, load)
+
+    post_service._fill_once = record_fill
+    await post_service.get_feed(10, page=0)
+    await post_service.get_feed(10, topic="None", page=0)
+
+    assert len(set(names)) == 2
+
+
+@pytest.fixture
+def cache_stats(monkeypatch) -> dict[str, CacheStats]:
+    for name in post_cache_stats:
+        monkeypatch.setitem(post_cache_stats, name, CacheStats())
+    return post_cache_stats
+
+
+async def _cache_post_and_feeds(post_service, post) -> None:
+    """ Fills cache entries of post and of the feeds it shows in """
+    await post_service.get_post(post.id)
+    await post_service.get_feed(10, page=0)
+    await post_service.get_feed(10, topic=post.topic, page=0)
+
+
+async def _cached(post_service, post) -> list[bool]:
+    posts_cache = post_service.posts_cache
+    return [
+        await posts_cache.get_post(post.id, track=False) is not None,
+        await posts_cache.get_feed(None, "page:0", 10, track=False) is not None,
+        await posts_cache.get_feed(post.topic, "page:0", 10, track=False) is not None,
+    ]
+
+
+async def test_post_and_feed_reads_count_hits_and_misses(post_service, make_posts, cache_stats):
+    [post] = await make_posts(1)
+
+    await post_service.get_post(post.id)
+    await post_service.get_post(post.id)
+    await post_service.get_feed(10, page=0)
+
+    assert (cache_stats["post"].hits, cache_stats["post"].misses) == (1, 1)
+    assert (cache_stats["feed"].hits, cache_stats["feed"].misses) == (0, 1)
+
+
+async def test_update_drops_cached_post_and_feeds(post_service, author, make_posts):
+    [post] = await make_posts(1, topic="news")
+    await _cache_post_and_feeds(post_service, post)
+    assert await _cached(post_service, post) == [True, True, True]
+
+    update = PostUpdate(id=post.id, title="updated", content="content", topic="news")
+    assert await post_service.update_post(update, author.id)
+
+    assert await _cached(post_service, post) == [False, False, False]
+    assert (await post_service.get_post(post.id))['title'] == "updated"
+
+
+async def test_delete_drops_cached_post_and_feeds(post_service, author, make_posts):
+    [post] = await make_posts(1, topic="news")
+    await _cache_post_and_feeds(post_service, post)
+
+    assert await post_service.delete_post(post.id, author.id)
+
+    assert await _cached(post_service, post) == [False, False, False]
+    assert await post_service.get_post(post.id) is None
+
+
+async def test_likes_sync_drops_cached_post_and_feeds(post_service, author, make_posts):
+    [post] = await make_posts(1, topic="news")
+    await _cache_post_and_feeds(post_service, post)
+
+    await post_service.like_post(post.id, author.id)
+    await post_service.sync_likes(post.id)
+
+    assert await _cached(post_service, post) == [False, False, False]
+
+
+async def test_likes_recount_drops_cached_post_and_feeds(post_service, author, make_posts):
+    [post] = await make_posts(1, topic="news")
+    await _cache_post_and_feeds(post_service, post)
+
+    assert await post_service.recount_likes([post.id]) == {post.id: 0}
+
+    assert await _cached(post_service, post) == [False, False, False]
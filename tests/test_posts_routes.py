@@ -0,0 +1,29 @@
+async def test_posts_keep_offset_pagination_contract(client, make_posts):
+    posts = await make_posts(5)
+
+    response = await client.get("/community/posts", params={"limit": 2})
+    assert response.status_code == 200
+    assert [item["id"] for item in response.json()] == [posts[4].id, posts[3].id]
+
+    response = await client.get("/community/posts", params={"limit": 2, "page": 2})
+    assert [item["id"] for item in response.json()] == [posts[0].id]
+
+
+async def test_posts_feed_paginates_by_cursor(client, make_posts):
+    posts = await make_posts(5)
+
+    served, cursor = [], None
+    while True:
+        params = {"limit": 2, **({"cursor": cursor} if cursor else {})}
+        page = (await client.get("/community/posts/feed", params=params)).json()
+        served.extend(item["id"] for item in page["items"])
+        cursor = page["next_cursor"]
+        if cursor is None:
+            break
+
+    assert served == [post.id for post in reversed(posts)]
+
+
+async def test_posts_feed_rejects_invalid_cursor(client, make_posts):
+    response = await client.get("/community/posts/feed", params={"cursor": "not-a-cursor"})
+    assert response.status_code == 400
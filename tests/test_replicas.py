@@ -0,0 +1,60 @@
+from datetime import datetime
+
+import pytest
+
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import sessionmaker
+
+from db.models import Base, Post, User
+from db.routing import REPLICAS, ReplicaSet, RoutingSession
+from db.session import _create_engine
+
+from repositories.post import PostRepo
+from services.post import build_post_service
+
+
+async def _create_database(engine, title: str) -> None:
+    async with engine.begin() as connection:
+        await connection.run_sync(Base.metadata.create_all)
+    async with AsyncSession(engine) as session:
+        session.add(User(id=1, username="author", hashed_password="-", email="author@example.com", first_name="A"))
+        session.add(Post(
+            id=1, title=title, content="content", likes=0, author_id=1,
+            created_at=datetime(2024, 1, 1), updated_at=datetime(2024, 1, 1),
+        ))
+        await session.commit()
+
+
+@pytest.fixture
+async def routed_session(tmp_path, redis):
+    """ Session over a primary and a replica lagging behind an update of the post """
+    primary = _create_engine(f"sqlite+aiosqlite:///{tmp_path / 'primary.db'}")
+    replica = _create_engine(f"sqlite+aiosqlite:///{tmp_path / 'replica.db'}")
+    await _create_database(primary, "updated")
+    await _create_database(replica, "stale")
+    replicas = ReplicaSet([replica], check_interval=10.0)
+    make_session = sessionmaker(
+        bind=primary,
+        class_=AsyncSession,
+        sync_session_class=RoutingSession,
+        info={REPLICAS: replicas},
+        expire_on_commit=False,
+    )
+    async with make_session() as session:
+        yield session
+    await primary.dispose()
+    await replicas.dispose()
+
+
+async def test_replica_serves_plain_reads(routed_session):
+    post = await PostRepo(routed_session).get_by_id(1)
+    assert post.title == "stale"
+
+
+async def test_cache_fills_read_primary(routed_session):
+    post_service = build_post_service(routed_session)
+
+    assert (await post_service.get_post(1))['title'] == "updated"
+    assert (await post_service.get_posts([1]))[0]['title'] == "updated"
+    feed = await post_service.get_feed(10, page=0)
+    assert [item['title'] for item in feed['items']] == ["updated"]
@@ -0,0 +1,36 @@
+from datetime import datetime
+
+from db.models import Post
+
+
+async def test_search_pages_through_matches(post_service, make_posts):
+    posts = await make_posts(5)
+
+    first = await post_service.search_posts("content", 3)
+    second = await post_service.search_posts("content", 3, cursor=first["next_cursor"])
+
+    served = [item["id"] for item in first["items"] + second["items"]]
+    assert served == [post.id for post in reversed(posts)]
+    assert first["items"][0]["author"]["username"] == "author"
+    assert second["next_cursor"] is None
+
+
+async def test_search_fallback_matches_like_wildcards_literally(post_service, session, author):
+    posts = [
+        Post(title=title, content="-", likes=0, author_id=author.id, created_at=created_at, updated_at=created_at)
+        for title, created_at in [
+            ("100% done", datetime(2024, 1, 1)),
+            ("1000 done", datetime(2024, 1, 2)),
+            ("snake_case", datetime(2024, 1, 3)),
+            ("snakeycase", datetime(2024, 1, 4)),
+        ]
+    ]
+    session.add_all(posts)
+    await session.commit()
+
+    async def search(text: str) -> list[str]:
+        return [item["title"] for item in (await post_service.search_posts(text, 10))["items"]]
+
+    assert await search("100%") == ["100% done"]
+    assert await search("snake_case") == ["snake_case"]
+    assert await search("DONE 1000") == ["1000 done"]
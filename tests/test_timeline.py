@@ -0,0 +1,108 @@
+import pytest
+
+from core.cache import LexSortedSetCacher, SetCacher
+from db.models import User
+from repositories.follow import FollowRepo
+from repositories.post import PostRepo
+from repositories.post_cache import TimelineCacheRepo
+from repositories.user import UserRepo
+from schemas.post import PostCreate
+from services.like_flusher import LikesFlusher
+from services.timeline import TimelineService
+
+
+@pytest.fixture
+def timeline_service(session, post_service) -> TimelineService:
+    return TimelineService(
+        FollowRepo(session),
+        UserRepo(session),
+        PostRepo(session),
+        TimelineCacheRepo(LexSortedSetCacher(), SetCacher()),
+        post_service,
+    )
+
+
+@pytest.fixture
+def make_users(session):
+    async def make_users(*usernames: str) -> list[User]:
+        users = [
+            User(username=username, hashed_password="-", email=f"{username}@example.com", first_name=username)
+            for username in usernames
+        ]
+        session.add_all(users)
+        await session.commit()
+        return users
+    return make_users
+
+
+async def _timeline_ids(timeline_service, user_id: int) -> list[int]:
+    timeline = await timeline_service.get_timeline(user_id, 20)
+    return [item['id'] for item in timeline['items']]
+
+
+async def test_new_posts_are_fanned_out_by_flusher(timeline_service, post_service, author, make_posts, make_users):
+    [follower] = await make_users("follower")
+    [old] = await make_posts(1)
+    await timeline_service.follow(follower.id, author.id)
+    assert await _timeline_ids(timeline_service, follower.id) == [old.id]
+
+    new = await post_service.create_post(PostCreate(title="new", content="content"), author.id)
+    assert await _timeline_ids(timeline_service, follower.id) == [old.id]
+
+    assert await LikesFlusher().fan_out() == 1
+    assert await _timeline_ids(timeline_service, follower.id) == [new.id, old.id]
+
+
+async def test_author_dropping_to_threshold_rebuilds_follower_timelines(
+    timeline_service, post_service, author, make_posts, make_users, monkeypatch,
+):
+    monkeypatch.setattr("services.timeline.settings.TIMELINE_FANOUT_MAX_FOLLOWERS", 1)
+    monkeypatch.setattr("services.post.settings.TIMELINE_FANOUT_MAX_FOLLOWERS", 1)
+    reader, other, small = await make_users("reader", "other", "small")
+    await timeline_service.follow(reader.id, small.id)
+    await timeline_service.follow(reader.id, author.id)
+    await timeline_service.follow(other.id, author.id)
+    small_post = await post_service.create_post(PostCreate(title="small", content="content"), small.id)
+    await LikesFlusher().fan_out()
+    assert await _timeline_ids(timeline_service, reader.id) == [small_post.id]
+
+    # Author is over the threshold, so the post is pulled on read, not pushed
+    pulled = await post_service.create_post(PostCreate(title="pulled", content="content"), author.id)
+    await LikesFlusher().fan_out()
+    assert await _timeline_ids(timeline_service, reader.id) == [pulled.id, small_post.id]
+
+    await timeline_service.unfollow(other.id, author.id)
+    assert await _timeline_ids(timeline_service, reader.id) == [pulled.id, small_post.id]
+
+
+async def test_timeline_keeps_post_fanned_out_while_it_is_built(
+    timeline_service, post_service, author, make_posts, make_users,
+):
+    [follower] = await make_users("follower")
+    posts = await make_posts(2)
+    await timeline_service.follow(follower.id, author.id)
+    replace = timeline_service.timelines.replace
+
+    async def replace_after_fan_out(user_id, positions):
+        posts.append(await post_service.create_post(PostCreate(title="new", content="content"), author.id))
+        await LikesFlusher().fan_out()
+        await replace(user_id, positions)
+
+    timeline_service.timelines.replace = replace_after_fan_out
+
+    assert await _timeline_ids(timeline_service, follower.id) == [post.id for post in reversed(posts)]
+    assert await timeline_service.timelines.size(follower.id) == 3
+
+
+async def test_flusher_fans_out_with_likes_flush_off(timeline_service, post_service, author, make_posts, make_users):
+    [follower] = await make_users("follower")
+    [old] = await make_posts(1)
+    await timeline_service.follow(follower.id, author.id)
+    assert await _timeline_ids(timeline_service, follower.id) == [old.id]
+    new = await post_service.create_post(PostCreate(title="new", content="content"), author.id)
+    await post_service.like_post(old.id, follower.id)
+
+    await LikesFlusher(interval=0, flush_likes=False)._tick()
+
+    assert await _timeline_ids(timeline_service, follower.id) == [new.id, old.id]
+    assert (await LikesFlusher().get_stats()).backlog_posts == 1
@@ -0,0 +1,33 @@
+from datetime import datetime
+
+from core.settings import get_settings
+
+
+async def test_topic_feed_serves_more_posts_than_page_size(post_service, make_posts, monkeypatch):
+    settings = get_settings()
+    monkeypatch.setattr(settings, "TOPIC_FEEDS_ENABLED", True)
+    posts = await make_posts(settings.MAX_PAGE_SIZE + 50, topic="python")
+
+    first = await post_service.get_feed(settings.MAX_PAGE_SIZE, topic="python")
+    second = await post_service.get_feed(settings.MAX_PAGE_SIZE, topic="python", cursor=first["next_cursor"])
+
+    served = [item["id"] for item in first["items"] + second["items"]]
+    assert served == [post.id for post in reversed(posts)]
+    assert second["next_cursor"] is None
+    assert await post_service.topic_feeds.size("python") == len(posts)
+
+
+async def test_topic_feed_keeps_post_created_while_it_is_built(post_service, make_posts, monkeypatch):
+    monkeypatch.setattr(get_settings(), "TOPIC_FEEDS_ENABLED", True)
+    posts = await make_posts(3, topic="python")
+    replace = post_service.topic_feeds.replace
+
+    async def replace_after_new_post(topic, positions):
+        posts.extend(await make_posts(1, topic="python", start=datetime(2024, 2, 1)))
+        await replace(topic, positions)
+
+    post_service.topic_feeds.replace = replace_after_new_post
+    feed = await post_service.get_feed(10, topic="python")
+
+    assert [item["id"] for item in feed["items"]] == [post.id for post in reversed(posts)]
+    assert await post_service.topic_feeds.size("python") == 4
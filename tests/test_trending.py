@@ -0,0 +1,45 @@
+import pytest
+
+from core.cache import DecayedSortedSetCacher
+from core.jwt import create_token
+
+
+@pytest.fixture
+def cacher(redis) -> DecayedSortedSetCacher:
+    return DecayedSortedSetCacher()
+
+
+async def test_taken_back_weight_clamps_score_at_zero(cacher, redis):
+    await cacher.add_many("bases", [(["ranking"], "a"), (["ranking"], "b")], 1.0, 3600)
+    await cacher.add_many("bases", [(["ranking"], "a")], -2.0, 3600)
+
+    assert await cacher.top("ranking", 10) == ["b"]
+
+
+async def test_taken_back_weight_does_not_add_missing_member(cacher, redis):
+    await cacher.add_many("bases", [(["ranking"], "a")], -1.0, 3600)
+
+    assert await redis.zcard("ranking") == 0
+
+
+async def test_likes_update_trending_without_topic_rankings(post_service, author, make_posts, monkeypatch):
+    monkeypatch.setattr("services.post.settings.TRENDING_TOPICS_ENABLED", False)
+    quiet, liked = await make_posts(2, topic="news")
+
+    await post_service.like_post(liked.id, author.id)
+
+    trending = await post_service.get_trending(1)
+    assert [post['id'] for post in trending['items']] == [liked.id]
+
+
+async def test_likes_of_missing_posts_are_not_ranked(client, post_service, author, make_posts):
+    [post] = await make_posts(1)
+    headers = {"Authorization": f"Bearer {create_token({'username': author.username, 'user_id': author.id})}"}
+
+    assert (await client.post(f"/community/posts/{post.id}/like", headers=headers)).status_code == 200
+    for post_id in range(post.id + 1, post.id + 6):
+        response = await client.post(f"/community/posts/{post_id}/like", headers=headers)
+        assert response.status_code == 404
+    assert (await client.delete(f"/community/posts/{post.id + 1}/like", headers=headers)).status_code == 404
+
+    assert await post_service.trending.get_top(None, 10) == [post.id]